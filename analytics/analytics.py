@@ -0,0 +1,176 @@
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from dfa.dfa import DFA
+from dfa.equivalence import DFATable
+from ltypes.laction import LAction
+
+
+class TransitionMatrix:
+    """Sparse adjacency matrix of a DFA in coordinate form: transition e goes
+    from state src[e] to state dst[e] with action actions[e]. The states are
+    numbered from 0 (the start state) and the actions by their first use.
+    Multiplying by the matrix is a gather and a bincount, so counting traces
+    costs O(transitions) per step, without building the traces"""
+
+    def __init__(self, start: int, transitions: Dict[Any, Dict[LAction, Any]]) -> None:
+        state_ids = {start: 0}
+        for state in transitions:
+            state_ids.setdefault(state, len(state_ids))
+        self.num_states = len(state_ids)
+        self.actions: List[LAction] = []
+        action_ids: Dict[LAction, int] = {}
+        src, dst, actions = [], [], []
+        for state, state_transitions in transitions.items():
+            for action, next_state in state_transitions.items():
+                action_id = action_ids.get(action)
+                if action_id is None:
+                    action_id = len(self.actions)
+                    action_ids[action] = action_id
+                    self.actions.append(action)
+                src.append(state_ids[state])
+                dst.append(state_ids[next_state])
+                actions.append(action_id)
+        self.src = np.array(src, dtype=np.int64)
+        self.dst = np.array(dst, dtype=np.int64)
+        self.action_ids = np.array(actions, dtype=np.int64)
+
+    @staticmethod
+    def from_dfa(dfa: DFA) -> "TransitionMatrix":
+        if dfa.start is None:
+            dfa.explore()
+        return TransitionMatrix(dfa.start, dfa.transitions)
+
+    @staticmethod
+    def from_table(table: DFATable) -> "TransitionMatrix":
+        return TransitionMatrix(table.start, table.transitions)
+
+    @property
+    def num_transitions(self) -> int:
+        return len(self.src)
+
+    def forward(self, counts: np.ndarray) -> np.ndarray:
+        """counts . A: the number of paths into each state, one step further"""
+        return np.bincount(
+            self.dst, weights=counts[self.src], minlength=self.num_states
+        )
+
+    def backward(self, counts: np.ndarray) -> np.ndarray:
+        """A . counts: for each state, the sum of counts over its successors"""
+        return np.bincount(
+            self.src, weights=counts[self.dst], minlength=self.num_states
+        )
+
+    def prefix_counts(self, k: int) -> np.ndarray:
+        """(k + 1) x states array, whose row i has the number of traces of
+        length i ending in each state. As the automaton is deterministic,
+        different paths from the start state are different traces"""
+        counts = np.zeros((k + 1, self.num_states))
+        counts[0, 0] = 1.0
+        for length in range(k):
+            counts[length + 1] = self.forward(counts[length])
+        return counts
+
+    def suffix_counts(self, k: int) -> np.ndarray:
+        """(k + 1) x states array, whose row j has the number of traces of
+        length at most j from each state"""
+        counts = np.ones((k + 1, self.num_states))
+        for length in range(k):
+            counts[length + 1] = 1.0 + self.backward(counts[length])
+        return counts
+
+    def out_degrees(self) -> np.ndarray:
+        return np.bincount(self.src, minlength=self.num_states)
+
+
+def trace_counts(matrix: TransitionMatrix, k: int) -> np.ndarray:
+    """Number of traces of each length from 0 to k. The counts are floats, as
+    they grow exponentially with the length in protocols with choices inside
+    loops: they are exact up to 2^53 and become inf past ~10^308"""
+    counts = np.zeros(k + 1)
+    row = np.zeros(matrix.num_states)
+    row[0] = 1.0
+    for length in range(k + 1):
+        counts[length] = row.sum()
+        if length < k:
+            row = matrix.forward(row)
+    return counts
+
+
+def action_counts(matrix: TransitionMatrix, k: int) -> np.ndarray:
+    """Number of times each action is taken over all the traces of length at
+    most k. Transition e is taken at position i + 1 by every trace made of a
+    trace of length i ending in src[e], then e, then a trace of length at
+    most k - i - 1 from dst[e]. Takes O(k * states) memory"""
+    if k == 0 or matrix.num_transitions == 0:
+        return np.zeros(len(matrix.actions))
+    prefixes = matrix.prefix_counts(k - 1)
+    suffixes = matrix.suffix_counts(k - 1)
+    # Row i of prefixes is paired with row k - 1 - i of suffixes
+    per_transition = np.einsum(
+        "ie,ie->e", prefixes[:, matrix.src], suffixes[::-1][:, matrix.dst]
+    )
+    return np.bincount(
+        matrix.action_ids, weights=per_transition, minlength=len(matrix.actions)
+    )
+
+
+class TraceStatistics:
+    """Statistics of the DFA of a projection: the number of traces of each
+    length up to k, the branching factor (number of transitions) of its states
+    and how many times each action is taken over the traces of length at
+    most k"""
+
+    def __init__(self, matrix: TransitionMatrix, k: int) -> None:
+        self.k = k
+        self.states = matrix.num_states
+        self.transitions = matrix.num_transitions
+        self.trace_counts = trace_counts(matrix, k)
+        degrees = matrix.out_degrees()
+        self.terminal_states = int(np.count_nonzero(degrees == 0))
+        self.mean_branching = float(degrees.mean())
+        self.max_branching = int(degrees.max())
+        # Branching factor -> number of states
+        self.branching = {
+            int(degree): int(count)
+            for degree, count in enumerate(np.bincount(degrees))
+            if count > 0
+        }
+        counts = action_counts(matrix, k)
+        self.actions: List[Tuple[LAction, float]] = sorted(
+            zip(matrix.actions, counts.tolist()), key=lambda item: -item[1]
+        )
+
+    @property
+    def total_traces(self) -> float:
+        """Number of traces of length at most k"""
+        return float(self.trace_counts.sum())
+
+    def dominant_actions(self, top: int = 5) -> List[Tuple[LAction, float]]:
+        """The actions taken most often, with the fraction of all the actions
+        taken over the traces of length at most k which they account for"""
+        total = sum(count for _, count in self.actions)
+        if total == 0:
+            return []
+        return [(action, count / total) for action, count in self.actions[:top]]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "states": self.states,
+            "transitions": self.transitions,
+            "traces": self.total_traces,
+            "trace_counts": self.trace_counts.tolist(),
+            "terminal_states": self.terminal_states,
+            "mean_branching": self.mean_branching,
+            "max_branching": self.max_branching,
+            "branching": self.branching,
+            "dominant_actions": [
+                [str(action), share] for action, share in self.dominant_actions()
+            ],
+        }
+
+
+def statistics(dfa: DFA, k: int) -> TraceStatistics:
+    return TraceStatistics(TransitionMatrix.from_dfa(dfa), k)
@@ -0,0 +1,215 @@
+import json
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from analytics.analytics import TransitionMatrix
+from dfa.equivalence import ACTION_TYPES
+from ltypes.laction import LAction
+
+# Binary trace files start with a header (magic, version, bytes per action
+# id, size of the action table), followed by the action table as a JSON list
+# of [participant, action type, payload] and then by batches of traces: the
+# number of traces, their lengths and the ids of their actions
+TRACES_HEADER = struct.Struct("<4sHHI")
+TRACES_MAGIC = b"MCPT"
+TRACES_VERSION = 1
+BATCH_HEADER = struct.Struct("<I")
+
+
+class TraceGenerator:
+    """Weighted random walks over the DFA of a projection, so every trace is a
+    trace of the projection. From each state, a transition is taken with
+    probability proportional to the weight of its action (1 by default; a
+    weight of 0 disables an action). A walk stops at a state with no
+    transitions, after max_length actions or, once it has taken min_length
+    actions, with probability stop_probability before every step.
+
+    Walks are run in batches: the states and actions are integers, and each
+    step of a batch draws the transitions of all its walks at once, in
+    constant time per walk, from an alias table of the transitions of each
+    state"""
+
+    def __init__(
+        self,
+        matrix: TransitionMatrix,
+        weights: Optional[Dict[LAction, float]] = None,
+        max_length: int = 32,
+        min_length: int = 0,
+        stop_probability: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.actions = matrix.actions
+        self.max_length = max_length
+        self.min_length = min_length
+        self.stop_probability = stop_probability
+        self.rng = np.random.default_rng(seed)
+
+        if weights is None:
+            transition_weights = np.ones(matrix.num_transitions)
+        else:
+            action_weights = np.array(
+                [weights.get(action, 1.0) for action in self.actions], dtype=float
+            )
+            if (action_weights < 0).any():
+                raise ValueError("Action weights can't be negative")
+            transition_weights = action_weights[matrix.action_ids]
+        # Transitions which can be taken, sorted by source state
+        order = np.flatnonzero(transition_weights > 0)
+        order = order[np.argsort(matrix.src[order], kind="stable")]
+        src = matrix.src[order]
+        self.dst = matrix.dst[order].astype(np.int32)
+        self.action_ids = matrix.action_ids[order].astype(np.int32)
+        transition_weights = transition_weights[order]
+
+        # Transitions of state s: first[s] to first[s] + degrees[s]. States
+        # with no transitions end the walks
+        self.degrees = np.bincount(src, minlength=matrix.num_states)
+        self.first = np.concatenate(([0], np.cumsum(self.degrees)[:-1]))
+        self.live = self.degrees > 0
+        self.probabilities, self.aliases = alias_tables(
+            self.first, self.degrees, transition_weights
+        )
+
+    def batch(self, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Runs size walks from the start state, returning the length of each
+        trace and a size x max_length array with the action ids of each trace
+        (padded with -1)"""
+        states = np.zeros(size, dtype=np.int32)
+        lengths = np.zeros(size, dtype=np.int64)
+        actions = np.full((size, self.max_length), -1, dtype=np.int32)
+        active = np.arange(size)
+        for step in range(self.max_length):
+            if self.stop_probability > 0 and step >= self.min_length:
+                active = active[self.rng.random(len(active)) >= self.stop_probability]
+            walk_states = states[active]
+            live = self.live[walk_states]
+            if not live.all():
+                active = active[live]
+                walk_states = walk_states[live]
+            if len(active) == 0:
+                break
+            # The integer part of u * degree picks a slot of the alias table
+            # of the state, and the fractional part picks the transition of
+            # the slot or its alias
+            degrees = self.degrees[walk_states]
+            u = self.rng.random(len(active)) * degrees
+            slots = np.minimum(u.astype(np.int64), degrees - 1)
+            transitions = self.first[walk_states] + slots
+            transitions = np.where(
+                u - slots < self.probabilities[transitions],
+                transitions,
+                self.aliases[transitions],
+            )
+            actions[active, step] = self.action_ids[transitions]
+            states[active] = self.dst[transitions]
+            lengths[active] += 1
+        return lengths, actions
+
+    def traces(self, count: int, batch_size: int = 65536) -> Iterator[List[LAction]]:
+        for lengths, actions in self.batches(count, batch_size):
+            for length, row in zip(lengths.tolist(), actions.tolist()):
+                yield [self.actions[action] for action in row[:length]]
+
+    def batches(
+        self, count: int, batch_size: int = 65536
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        while count > 0:
+            size = min(count, batch_size)
+            yield self.batch(size)
+            count -= size
+
+    def write_jsonl(self, out: TextIO, count: int, batch_size: int = 65536) -> None:
+        """Writes each trace as a JSON list of actions (e.g. ["b!U", "c?V"])"""
+        names = np.array(
+            [json.dumps(str(action)) for action in self.actions] + ["null"]
+        )
+        for lengths, actions in self.batches(count, batch_size):
+            # Padding is -1, which indexes the extra name
+            rows = names[actions]
+            out.write(
+                "".join(
+                    f"[{','.join(row[:length])}]\n"
+                    for length, row in zip(lengths.tolist(), rows.tolist())
+                )
+            )
+
+    def write_binary(self, out: BinaryIO, count: int, batch_size: int = 65536) -> None:
+        id_size = 2 if len(self.actions) < (1 << 16) else 4
+        id_type = np.dtype("<u2") if id_size == 2 else np.dtype("<u4")
+        table = json.dumps(
+            [
+                [action.participant, str(action.action_type), action.payload]
+                for action in self.actions
+            ]
+        ).encode()
+        out.write(TRACES_HEADER.pack(TRACES_MAGIC, TRACES_VERSION, id_size, len(table)))
+        out.write(table)
+        for lengths, actions in self.batches(count, batch_size):
+            out.write(BATCH_HEADER.pack(len(lengths)))
+            out.write(lengths.astype("<u4").tobytes())
+            # Row-major order, so the ids of each trace are consecutive
+            out.write(actions[actions >= 0].astype(id_type).tobytes())
+
+
+def alias_tables(
+    first: np.ndarray, degrees: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Alias tables (Vose's method) of the transitions of each state, all in
+    the same arrays: slot i of the table of state s is taken with probability
+    1 / degrees[s], and then transition i is taken with probability
+    probabilities[i] and transition aliases[i] otherwise"""
+    totals = np.bincount(
+        np.repeat(np.arange(len(degrees)), degrees),
+        weights=weights,
+        minlength=len(degrees),
+    )
+    scaled = (
+        weights * np.repeat(degrees / np.maximum(totals, 1e-300), degrees)
+    ).tolist()
+    probabilities = [1.0] * len(weights)
+    aliases = list(range(len(weights)))
+    for state in np.flatnonzero(degrees > 1).tolist():
+        begin = int(first[state])
+        end = begin + int(degrees[state])
+        small = [i for i in range(begin, end) if scaled[i] < 1.0]
+        if not small:
+            continue
+        large = [i for i in range(begin, end) if scaled[i] >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large[-1]
+            probabilities[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(large.pop())
+        # The transitions left have probability 1, up to rounding
+    return np.array(probabilities), np.array(aliases, dtype=np.int64)
+
+
+def read_binary(f: BinaryIO) -> Iterator[List[LAction]]:
+    """Traces written by TraceGenerator.write_binary"""
+    magic, version, id_size, table_size = TRACES_HEADER.unpack(
+        f.read(TRACES_HEADER.size)
+    )
+    if magic != TRACES_MAGIC or version != TRACES_VERSION:
+        raise ValueError("Not a trace file, or unsupported version")
+    actions = [
+        LAction(participant, ACTION_TYPES[action_type], payload)
+        for participant, action_type, payload in json.loads(f.read(table_size))
+    ]
+    id_type = np.dtype("<u2") if id_size == 2 else np.dtype("<u4")
+    while True:
+        header = f.read(BATCH_HEADER.size)
+        if not header:
+            break
+        (size,) = BATCH_HEADER.unpack(header)
+        lengths = np.frombuffer(f.read(4 * size), dtype="<u4")
+        total = int(lengths.sum())
+        ids = np.frombuffer(f.read(id_size * total), dtype=id_type).tolist()
+        pos = 0
+        for length in lengths.tolist():
+            yield [actions[action] for action in ids[pos : pos + length]]
+            pos += length
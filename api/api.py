@@ -0,0 +1,192 @@
+from typing import Dict, Iterable, List, Optional, Set
+
+from dfa.cancellation import check_cancelled
+from dfa.dfa import DFA
+from dfa.equivalence import DFATable
+from dfa.symmetry import SymmetricTranslator
+from fingerprint.fingerprint import role_abstract_fingerprint
+from gtypes.gtype import GType
+from ltypes.ltype import LType
+from parser.parser import Protocol, parse_source
+
+
+class ProjectionCache:
+    """State which can be reused across calls to the API. Translations are
+    keyed by the role-abstract fingerprint of the projections, so they are
+    valid for any protocol. Each DFA is explored by the given number of
+    worker processes"""
+
+    def __init__(self, workers: int = 1) -> None:
+        self.translator = SymmetricTranslator(workers)
+        # Role-abstract fingerprints of the projections known to be valid
+        self.checked: Set[int] = set()
+
+    def is_checked(self, key: int) -> bool:
+        return key in self.checked or key in self.translator.translations
+
+
+class RoleProjection:
+    """Projection of a protocol onto one of its roles. If the projection
+    failed, error holds the exception raised (one of the exceptions in
+    errors.errors for protocols which can't be projected)"""
+
+    def __init__(self, role: str) -> None:
+        self.role = role
+        self.preliminary: Optional[LType] = None
+        self.projection: Optional[LType] = None
+        self.error: Optional[Exception] = None
+        self._dfa_table: Optional[DFATable] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def dfa_table(self) -> DFATable:
+        """Transition table of the DFA of the preliminary projection, built the
+        first time it is requested"""
+        assert self.preliminary is not None
+        if self._dfa_table is None:
+            dfa = DFA(self.preliminary)
+            dfa.explore()
+            self._dfa_table = DFATable.from_dfa(dfa)
+        return self._dfa_table
+
+
+class ProtocolProjection:
+    """Projections of a protocol. error is set if the global type couldn't be
+    projected at all, otherwise the errors are reported for each role"""
+
+    def __init__(self, protocol: Protocol) -> None:
+        self.protocol = protocol.protocol
+        self.roles: List[str] = protocol.roles
+        self.gtype: GType = protocol.gtype
+        self.projections: Dict[str, RoleProjection] = {}
+        self.error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(
+            projection.ok for projection in self.projections.values()
+        )
+
+
+class ProtocolCheck:
+    """Outcome of checking whether a protocol can be projected. If it can't,
+    role is the role whose projection failed first (None if the global type
+    couldn't be projected at all) and error the exception raised"""
+
+    def __init__(
+        self, protocol: str, role: Optional[str] = None, error: Exception = None
+    ) -> None:
+        self.protocol = protocol
+        self.role = role
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def check_protocol(
+    protocol: Protocol, cache: Optional[ProjectionCache] = None
+) -> ProtocolCheck:
+    """Checks that a protocol can be projected onto all of its roles, stopping
+    at the first error. The DFAs of the projections are explored, which is
+    where invalid choices are found, but no local types are built from them.
+    Projections equal up to a renaming of the roles to one already checked
+    are not explored again"""
+    if cache is None:
+        cache = ProjectionCache()
+    role = None
+    try:
+        projections = protocol.gtype.project(set(protocol.roles))
+        for role in protocol.roles:
+            check_cancelled()
+            ltype = projections[role].normalise()
+            key, _ = role_abstract_fingerprint(ltype, role)
+            if not cache.is_checked(key):
+                DFA(ltype).explore()
+                cache.checked.add(key)
+    except Exception as e:
+        return ProtocolCheck(protocol.protocol, role, e)
+    return ProtocolCheck(protocol.protocol)
+
+
+def check_source(
+    source: str, cache: Optional[ProjectionCache] = None
+) -> Dict[str, ProtocolCheck]:
+    """Parses the Scribble protocols in source and checks whether they can be
+    projected. Syntax errors (and invalid sub-protocol calls) are raised"""
+    if cache is None:
+        cache = ProjectionCache()
+    return {
+        name: check_protocol(protocol, cache)
+        for name, protocol in parse_source(source).items()
+    }
+
+
+def project_protocol(
+    protocol: Protocol,
+    roles: Optional[Iterable[str]] = None,
+    determinise: bool = True,
+    cache: Optional[ProjectionCache] = None,
+) -> ProtocolProjection:
+    """Projects a protocol onto the given roles (all of them by default). If
+    determinise is not set, only the preliminary projections are computed"""
+    if cache is None:
+        cache = ProjectionCache()
+    if roles is None:
+        roles = protocol.roles
+    else:
+        selected = set(roles)
+        roles = [role for role in protocol.roles if role in selected]
+
+    result = ProtocolProjection(protocol)
+    try:
+        projections = protocol.gtype.project(set(roles))
+    except Exception as e:
+        result.error = e
+        return result
+
+    for role in roles:
+        check_cancelled()
+        role_projection = RoleProjection(role)
+        result.projections[role] = role_projection
+        try:
+            role_projection.preliminary = projections[role].normalise()
+            if determinise:
+                role_projection.projection = cache.translator.translate(
+                    role, role_projection.preliminary
+                )
+        except Exception as e:
+            role_projection.error = e
+    return result
+
+
+def project_protocols(
+    protocols: Dict[str, Protocol],
+    roles: Optional[Iterable[str]] = None,
+    determinise: bool = True,
+    cache: Optional[ProjectionCache] = None,
+) -> Dict[str, ProtocolProjection]:
+    if cache is None:
+        cache = ProjectionCache()
+    if roles is not None:
+        roles = list(roles)
+    return {
+        name: project_protocol(protocol, roles, determinise, cache)
+        for name, protocol in protocols.items()
+    }
+
+
+def project_source(
+    source: str,
+    roles: Optional[Iterable[str]] = None,
+    determinise: bool = True,
+    cache: Optional[ProjectionCache] = None,
+) -> Dict[str, ProtocolProjection]:
+    """Parses the Scribble protocols in source and projects them, returning the
+    results by protocol name. Syntax errors (and invalid sub-protocol calls)
+    are raised, while projection errors are stored in the results. Passing
+    the same cache to several calls reuses the work done in previous ones"""
+    return project_protocols(parse_source(source), roles, determinise, cache)
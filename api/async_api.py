@@ -0,0 +1,222 @@
+import asyncio
+import io
+import os
+import pickle
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Manager
+from threading import Event
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from api.api import ProtocolCheck, ProtocolProjection, check_source, project_source
+from dfa.cancellation import CancelToken, cancellable
+from dfa.dfa import DFA
+from errors.errors import ExplorationCancelled
+from gtypes.gtype import GType
+from ltypes.ltype import LType
+from parser import parser as scr_parser
+from parser.parser import Protocol
+from serialisation.serialisation import Image, ImageWriter
+
+
+class _ImagePickler(pickle.Pickler):
+    """Pickles the types as roots of a binary image, which rebuilds them with
+    their constructors when it is loaded. Pickling them directly would copy
+    their bitmasks of type variables, whose bits are only meaningful in the
+    process which interned the variables"""
+
+    def __init__(self, file, writer: ImageWriter) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.writer = writer
+        self.num_roots = 0
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        if isinstance(obj, (GType, LType)):
+            name = str(self.num_roots)
+            self.writer.add_root(name, obj)
+            self.num_roots += 1
+            return name
+        return None
+
+
+class _ImageUnpickler(pickle.Unpickler):
+    def __init__(self, file, image: Image) -> None:
+        super().__init__(file)
+        self.image = image
+
+    def persistent_load(self, pid: str) -> Any:
+        return self.image[pid]
+
+
+def dumps(obj: Any) -> Tuple[bytes, bytes]:
+    """Pickles an object which may contain types, so that it can be sent to
+    another process"""
+    writer = ImageWriter()
+    data = io.BytesIO()
+    _ImagePickler(data, writer).dump(obj)
+    return writer.to_bytes(), data.getvalue()
+
+
+def loads(image: bytes, data: bytes) -> Any:
+    return _ImageUnpickler(io.BytesIO(data), Image(image)).load()
+
+
+def _run(
+    fn: Callable, args: Tuple, token: Optional[CancelToken], transfer: bool
+) -> Any:
+    """Runs a job in a worker thread or process. Jobs sent to other processes
+    (transfer) get their arguments and return their results through dumps"""
+    if transfer:
+        args = loads(*args)
+    with cancellable(token):
+        result = fn(*args)
+    return dumps(result) if transfer else result
+
+
+def _translate(ltype: LType) -> LType:
+    return DFA(ltype).translate()
+
+
+class AsyncProjector:
+    """Runs parsing, projection and DFA translation in an executor (a thread
+    pool by default), so that they don't block the event loop.
+
+    - Every request may have a timeout (in seconds, overriding the default
+      one), after which asyncio.TimeoutError is raised. It counts from when
+      the job is submitted, after waiting for a slot.
+    - A request which times out or whose task is cancelled also stops its job:
+      the explorations of the job check a CancelToken and stop with
+      ExplorationCancelled.
+    - At most max_concurrent jobs are submitted to the executor at any time.
+      Further requests wait for a slot, which is only freed once the job has
+      actually stopped, so cancelled jobs can't pile up in the executor.
+
+    Types are sent to and from process pools as binary images."""
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        max_concurrent: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor()
+        self.executor = executor
+        self.transfer = isinstance(executor, ProcessPoolExecutor)
+        # The cancellation events of jobs in other processes are served by a
+        # manager process, started with the first of them
+        self.manager = None
+        if max_concurrent is None:
+            max_concurrent = os.cpu_count() or 1
+        self.max_concurrent = max_concurrent
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.timeout = timeout
+        # Tokens of the jobs submitted to the executor which haven't finished
+        self.tokens: Set[CancelToken] = set()
+
+    def event(self) -> Any:
+        if not self.transfer:
+            return Event()
+        if self.manager is None:
+            self.manager = Manager()
+        return self.manager.Event()
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        if timeout is None:
+            timeout = self.timeout
+        if self.slots is None:
+            # Created here so that it belongs to the running event loop
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+        try:
+            deadline = None if timeout is None else time.time() + timeout
+            token = CancelToken(self.event(), deadline)
+            if self.transfer:
+                args = dumps(args)
+            future: Future = self.executor.submit(_run, fn, args, token, self.transfer)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        self.tokens.add(token)
+
+        def release() -> None:
+            self.tokens.discard(token)
+            self.slots.release()
+
+        def done(_) -> None:
+            # The job may only stop after the event loop has been closed
+            if not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(release)
+                except RuntimeError:
+                    pass
+
+        future.add_done_callback(done)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except ExplorationCancelled:
+            # The job noticed the deadline before the event loop did
+            raise asyncio.TimeoutError() from None
+        except BaseException:
+            # Timed out or cancelled (or the job failed)
+            token.cancel()
+            raise
+        return loads(*result) if self.transfer else result
+
+    async def parse_source(
+        self, source: str, timeout: Optional[float] = None
+    ) -> Dict[str, Protocol]:
+        return await self.run(scr_parser.parse_source, source, timeout=timeout)
+
+    async def parse_file(
+        self, file_name: str, timeout: Optional[float] = None
+    ) -> Dict[str, Protocol]:
+        return await self.run(scr_parser.parse_file, file_name, timeout=timeout)
+
+    async def check_source(
+        self, source: str, timeout: Optional[float] = None
+    ) -> Dict[str, ProtocolCheck]:
+        return await self.run(check_source, source, timeout=timeout)
+
+    async def project_source(
+        self,
+        source: str,
+        roles: Optional[Iterable[str]] = None,
+        determinise: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, ProtocolProjection]:
+        if roles is not None:
+            roles = list(roles)
+        return await self.run(
+            project_source, source, roles, determinise, timeout=timeout
+        )
+
+    async def translate(self, ltype: LType, timeout: Optional[float] = None) -> LType:
+        """Local type with the traces of the DFA of ltype (a normalised
+        projection)"""
+        return await self.run(_translate, ltype, timeout=timeout)
+
+    @property
+    def running(self) -> int:
+        """Number of jobs submitted to the executor which haven't stopped"""
+        return len(self.tokens)
+
+    def close(self) -> None:
+        """Cancels the jobs still running, and shuts down the executor (if
+        the projector created it) and the manager"""
+        for token in self.tokens:
+            token.cancel()
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+    async def __aenter__(self) -> "AsyncProjector":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
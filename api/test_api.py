@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from api.api import ProjectionCache, project_protocols, project_source
+from parser import parser as scr_parser
+
+EXAMPLES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples",
+    "examples.scr",
+)
+
+
+def results_to_strings(results) -> Dict[Tuple[str, str], Optional[str]]:
+    strings = {}
+    for name, result in results.items():
+        for role, projection in result.projections.items():
+            if projection.ok:
+                strings[(name, role)] = projection.projection.to_string("")
+            else:
+                strings[(name, role)] = type(projection.error).__name__
+    return strings
+
+
+def test_concurrent_translations_are_sequential_ones():
+    with open(EXAMPLES) as f:
+        source = f.read()
+    expected = results_to_strings(project_source(source))
+    # Shared by the threads, which are the first to project it
+    protocols = scr_parser.parse_source(source)
+    cache = ProjectionCache()
+
+    def run(iteration: int):
+        if iteration % 3 == 0:
+            return results_to_strings(project_source(source, cache=cache))
+        # Half of the other runs share the cache too
+        run_cache = cache if iteration % 3 == 1 else ProjectionCache()
+        return results_to_strings(project_protocols(protocols, cache=run_cache))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(run, range(24)))
+    assert all(strings == expected for strings in results)
@@ -0,0 +1,138 @@
+"""Latency and throughput of the asyncio API under concurrent requests. Clients
+keep --concurrency requests in flight: most of them project the protocols of a
+file, and every --heavy-every-th one checks the blow-up protocol of
+parallel_scaling.py with a --timeout, so it is cancelled. A ticker measures
+how late the event loop runs it, which shows whether the loop is blocked.
+With --executor inline the requests are run in the event loop, as calling
+the synchronous API from a coroutine would.
+
+    python benchmarks/async_load.py examples/examples.scr --executor thread
+    python benchmarks/async_load.py examples/examples.scr --executor process
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.api import check_source, project_source  # noqa: E402
+from api.async_api import AsyncProjector  # noqa: E402
+from benchmarks.parallel_scaling import blowup_source  # noqa: E402
+
+TICK = 0.01
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def ticker(lags, stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - start - TICK)
+
+
+async def request(projector, idx: int, args, light: str, heavy: str):
+    """Returns the kind of request, its latency and whether it timed out"""
+    is_heavy = args.heavy_every > 0 and idx % args.heavy_every == args.heavy_every - 1
+    start = time.perf_counter()
+    timed_out = False
+    if projector is None:
+        if is_heavy:
+            check_source(heavy)
+        else:
+            project_source(light)
+    else:
+        try:
+            if is_heavy:
+                await projector.check_source(heavy, timeout=args.timeout)
+            else:
+                await projector.project_source(light)
+        except asyncio.TimeoutError:
+            timed_out = True
+    return is_heavy, time.perf_counter() - start, timed_out
+
+
+async def run(args, projector, light: str, heavy: str):
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(lags, stop))
+    results = []
+    pending = iter(range(args.requests))
+
+    async def client():
+        for idx in pending:
+            results.append(await request(projector, idx, args, light, heavy))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return elapsed, results, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio API load benchmark")
+    parser.add_argument("file", help="file with the protocols of the light requests")
+    parser.add_argument(
+        "--executor", choices=["thread", "process", "inline"], default="thread"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--heavy-every", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=11)
+    parser.add_argument("--timeout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        light = f.read()
+    heavy = blowup_source(args.depth)
+
+    if args.executor == "inline":
+        projector = None
+    elif args.executor == "thread":
+        projector = AsyncProjector(
+            ThreadPoolExecutor(args.workers), args.max_concurrent
+        )
+    else:
+        projector = AsyncProjector(
+            ProcessPoolExecutor(args.workers), args.max_concurrent
+        )
+
+    elapsed, results, lags = asyncio.run(run(args, projector, light, heavy))
+    if projector is not None:
+        projector.close()
+        projector.executor.shutdown()
+
+    light_latencies = [latency for is_heavy, latency, _ in results if not is_heavy]
+    heavy_latencies = [latency for is_heavy, latency, _ in results if is_heavy]
+    timeouts = sum(1 for _, _, timed_out in results if timed_out)
+    print(
+        f"{args.executor}: {len(results)} requests in {elapsed:.2f}s, "
+        f"{len(results) / elapsed:.1f} requests/s, {timeouts} timed out"
+    )
+    for label, latencies in (("light", light_latencies), ("heavy", heavy_latencies)):
+        if latencies:
+            print(
+                f"{label:6} latency ms: p50 {percentile(latencies, 0.5) * 1000:.0f}, "
+                f"p95 {percentile(latencies, 0.95) * 1000:.0f}, "
+                f"max {max(latencies) * 1000:.0f}"
+            )
+    if lags:
+        print(
+            f"event loop lag ms: p50 {percentile(lags, 0.5) * 1000:.1f}, "
+            f"max {max(lags) * 1000:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
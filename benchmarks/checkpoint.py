@@ -0,0 +1,112 @@
+"""Overhead of checkpointing the DFA exploration, and how fast an exploration
+killed halfway resumes from its last checkpoint. The DFA is the one of the
+blow-up protocol of parallel_scaling.py, with 2^depth + 1 states. The
+interrupted exploration runs in a separate process, which is killed with
+SIGKILL, and the resumed DFA must be the same as the uninterrupted one
+(dfa/test_checkpoint.py checks this on a small DFA, from a checkpoint cut
+short in the middle of a record).
+
+    python benchmarks/checkpoint.py --depth 16 --interval 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.parallel_scaling import blowup_source  # noqa: E402
+from dfa.checkpoint import CheckpointDFA  # noqa: E402
+from dfa.dfa import DFA  # noqa: E402
+from dfa.equivalence import DFATable  # noqa: E402
+from dfa.state_store import MemoryStateStore  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def blowup_ltype(depth: int):
+    protocol = scr_parser.parse_source(blowup_source(depth))["Blowup"]
+    return protocol.gtype.project(set(protocol.roles))["r"].normalise()
+
+
+def explore(dfa: DFA):
+    start = time.perf_counter()
+    dfa.explore()
+    elapsed = time.perf_counter() - start
+    return elapsed, DFATable.from_dfa(dfa).to_json()
+
+
+def best(repeat: int, make_dfa):
+    """Best time of exploring repeat fresh DFAs, with the last DFA and table"""
+    times = []
+    for _ in range(repeat):
+        dfa = make_dfa()
+        elapsed, table = explore(dfa)
+        times.append(elapsed)
+    return min(times), dfa, table
+
+
+def interrupted(depth: int, path: str, interval: float) -> None:
+    CheckpointDFA(blowup_ltype(depth), path, interval).explore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint benchmark")
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ltype = blowup_ltype(args.depth)
+    # The first exploration also fills the memoised hashes and first actions
+    # of the local type, so it is left out of the timings
+    explore(DFA(ltype, MemoryStateStore()))
+    plain, _, expected = best(args.repeat, lambda: DFA(ltype, MemoryStateStore()))
+    print(f"depth {args.depth}: {expected['states']} states")
+    print(f"no checkpoints: {plain:.2f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "blowup.ckpt")
+        elapsed, dfa, table = best(
+            args.repeat, lambda: CheckpointDFA(ltype, path, args.interval)
+        )
+        mismatches = table != expected
+        print(
+            f"checkpoints every {args.interval}s: {elapsed:.2f}s "
+            f"({dfa.checkpoints} checkpoints, {os.path.getsize(path)} bytes, "
+            f"overhead {(elapsed / plain - 1) * 100:.1f}%)"
+        )
+
+        process = multiprocessing.Process(
+            target=interrupted, args=(args.depth, path, args.interval)
+        )
+        os.unlink(path)
+        process.start()
+        # Kill the exploration once it has written a few checkpoints
+        sizes = set()
+        while len(sizes) < 4 and process.is_alive():
+            if os.path.exists(path):
+                sizes.add(os.path.getsize(path))
+            time.sleep(args.interval / 10)
+        process.kill()
+        process.join()
+
+        dfa = CheckpointDFA(ltype, path, args.interval, resume=True)
+        elapsed, table = explore(dfa)
+        mismatches += table != expected
+        print(
+            f"resumed after a kill: {elapsed:.2f}s "
+            f"({dfa.resumed_from} states expanded before the kill were restored)"
+        )
+        elapsed, table = explore(CheckpointDFA(ltype, path, args.interval, resume=True))
+        mismatches += table != expected
+        print(f"resumed a finished exploration: {elapsed:.2f}s")
+
+    if mismatches > 0:
+        print("MISMATCH")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
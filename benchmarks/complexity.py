@@ -0,0 +1,41 @@
+"""Prints the operation counts of projecting the protocols of the generated
+families of counters/complexity.py next to their bounds, which are checked by
+counters/test_complexity.py. Exits with 1 if any bound is exceeded.
+
+    python benchmarks/complexity.py --families ring fanout
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from counters.complexity import FAMILIES, check  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Complexity regression checks")
+    parser.add_argument(
+        "--families", nargs="+", choices=list(FAMILIES), default=list(FAMILIES)
+    )
+    args = parser.parse_args()
+
+    violations = 0
+    print(f"{'protocol':14}{'phase':>10}{'operation':>20}{'count':>10}{'bound':>10}")
+    for family in args.families:
+        for n in FAMILIES[family].sizes:
+            for bound, count, limit in check(FAMILIES[family], n):
+                exceeded = count > limit
+                violations += exceeded
+                print(
+                    f"{family + ' ' + str(n):14}{bound.phase:>10}"
+                    f"{bound.operation:>20}{count:>10}{limit:>10}"
+                    f"{'  EXCEEDED' if exceeded else ''}"
+                )
+    print(f"{violations} bounds exceeded")
+    if violations > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
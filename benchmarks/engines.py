@@ -0,0 +1,95 @@
+"""Compares the two ways of building the DFAs of the projections of protocols
+with many roles: projecting the global type onto every role and determinising
+each projection, or building the global LTS once and hiding the actions of
+the other roles. The DFAs of both engines must be trace equivalent.
+
+    python benchmarks/engines.py --roles 4 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfa.dfa import DFA  # noqa: E402
+from dfa.equivalence import equivalent  # noqa: E402
+from lts.lts import GlobalLTS  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def ring_source(num_roles: int) -> str:
+    """A token passed around a ring of roles, while the first role tells the
+    others at every round whether to go on"""
+    roles = [f"r{idx}" for idx in range(num_roles)]
+    ring = " ".join(
+        f"{roles[idx]}->{roles[(idx + 1) % num_roles]}:token;"
+        for idx in range(num_roles)
+    )
+    go = " ".join(f"r0->{role}:go;" for role in roles[1:])
+    stop = " ".join(f"r0->{role}:stop;" for role in roles[1:])
+    return (
+        f"global protocol Ring({', '.join(f'role {role}' for role in roles)}) {{\n"
+        f"    rec X {{ choice {{ {go} {ring} continue X }} or {{ {stop} end }} }}\n"
+        "}\n"
+    )
+
+
+def scatter_source(num_roles: int) -> str:
+    """A coordinator which sends a job to every worker and then collects the
+    results, in a loop"""
+    workers = [f"w{idx}" for idx in range(num_roles - 1)]
+    jobs = " ".join(f"m->{worker}:job;" for worker in workers)
+    results = " ".join(f"{worker}->m:result;" for worker in workers)
+    return (
+        f"global protocol Scatter(role m, {', '.join(f'role {w}' for w in workers)}) {{\n"
+        f"    rec X {{ {jobs} {results} continue X }}\n"
+        "}\n"
+    )
+
+
+def syntactic(protocol):
+    projections = protocol.gtype.project(set(protocol.roles))
+    dfas = {}
+    for role in protocol.roles:
+        dfa = DFA(projections[role].normalise())
+        dfa.explore()
+        dfas[role] = dfa
+    return dfas
+
+
+def lts(protocol):
+    return GlobalLTS(protocol.gtype).role_dfas(protocol.roles)
+
+
+def timed(fn, protocol):
+    start = time.perf_counter()
+    result = fn(protocol)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Projection engines benchmark")
+    parser.add_argument("--roles", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'protocol':16}{'projection ms':>16}{'lts ms':>12}")
+    for num_roles in args.roles:
+        for source in (ring_source(num_roles), scatter_source(num_roles)):
+            for name, protocol in scr_parser.parse_source(source).items():
+                syntactic_time, dfas = timed(syntactic, protocol)
+                lts_time, tables = timed(lts, protocol)
+                for role in protocol.roles:
+                    mismatches += not equivalent(dfas[role], tables[role])
+                print(
+                    f"{name + '/' + str(num_roles):16}"
+                    f"{syntactic_time * 1000:>16.2f}{lts_time * 1000:>12.2f}"
+                )
+    print(f"{mismatches} mismatches")
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
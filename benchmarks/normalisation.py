@@ -0,0 +1,96 @@
+"""Reports how much simplifying the projections while normalising them (merging
+equal branches and flattening choices) reduces their size, the number of
+subterms expanded by the subset construction and the number of states of
+their DFAs, and how long the subset construction takes either way.
+
+    python benchmarks/normalisation.py examples/examples.scr
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfa.dfa import DFA  # noqa: E402
+from ltypes.lchoice import LChoice, LIDChoice, LUnmergedChoice  # noqa: E402
+from ltypes.lmessage_pass import LMessagePass  # noqa: E402
+from ltypes.lrecursion import LRecursion  # noqa: E402
+from ltypes.ltype import LType  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def children(ltype: LType):
+    if isinstance(ltype, LMessagePass):
+        return [ltype.cont]
+    if isinstance(ltype, LRecursion):
+        return [ltype.ltype]
+    if isinstance(ltype, (LChoice, LIDChoice)):
+        return ltype.branches
+    if isinstance(ltype, LUnmergedChoice):
+        return ltype.choices
+    return []
+
+
+def size(ltype: LType) -> int:
+    """Number of distinct nodes of the type (shared subterms count once)"""
+    seen = {id(ltype)}
+    stack = [ltype]
+    while stack:
+        for child in children(stack.pop()):
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+    return len(seen)
+
+
+def measure(ltype: LType, simplify: bool):
+    normalised = ltype.normalise(simplify)
+    dfa = DFA(normalised)
+    start = time.perf_counter()
+    try:
+        dfa.explore()
+        states = len(dfa.transitions)
+    except Exception:
+        states = "error"
+    elapsed = time.perf_counter() - start
+    return size(normalised), len(dfa.subterms.ltypes), states, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalisation report")
+    parser.add_argument("files", nargs="+", help="files with the protocols to project")
+    args = parser.parse_args()
+
+    totals = [0, 0, 0, 0, 0, 0]
+    print(f"{'projection':40}{'size':>14}{'subterms':>16}{'DFA states':>16}{'ms':>16}")
+    for file_name in args.files:
+        for name, protocol in scr_parser.parse_file(file_name).items():
+            try:
+                projections = protocol.gtype.project(set(protocol.roles))
+            except Exception:
+                continue
+            for role in protocol.roles:
+                ltype = projections[role]
+                before = measure(ltype, simplify=False)
+                after = measure(ltype, simplify=True)
+                if isinstance(before[2], int) and isinstance(after[2], int):
+                    for idx in range(3):
+                        totals[2 * idx] += before[idx]
+                        totals[2 * idx + 1] += after[idx]
+                print(
+                    f"{role + '@' + name:40}"
+                    f"{before[0]:>7}{after[0]:>7}"
+                    f"{before[1]:>8}{after[1]:>8}"
+                    f"{before[2]:>8}{after[2]:>8}"
+                    f"{before[3] * 1000:>8.2f}{after[3] * 1000:>8.2f}"
+                )
+    print(
+        f"total size {totals[0]} -> {totals[1]}, "
+        f"subterms {totals[2]} -> {totals[3]}, "
+        f"DFA states {totals[4]} -> {totals[5]}"
+    )
+
+
+if __name__ == "__main__":
+    main()
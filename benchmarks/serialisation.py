@@ -0,0 +1,95 @@
+"""Compares the binary images of the projections of a file with pickle: size,
+time to write and time to load (the image is memory-mapped, and only the
+nodes which are accessed are built). Every loaded projection must print the
+same as the original one.
+
+    python benchmarks/serialisation.py examples/examples.scr --repeat 100
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfa.dfa import DFA  # noqa: E402
+from dfa.equivalence import DFATable  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+from serialisation.serialisation import Image, ImageWriter  # noqa: E402
+
+
+def projections(file_name: str):
+    roots = {}
+    for name, protocol in scr_parser.parse_file(file_name).items():
+        try:
+            projected = protocol.gtype.project(set(protocol.roles))
+        except Exception:
+            continue
+        for role, ltype in projected.items():
+            roots[f"{name}@{role}"] = ltype
+            try:
+                roots[f"{name}@{role}:dfa"] = DFATable.from_dfa(DFA(ltype.normalise()))
+            except Exception:
+                pass
+    return roots
+
+
+def timed(repeat: int, fn):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary image benchmark")
+    parser.add_argument("file", help="file with the protocols to project")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    roots = projections(args.file)
+
+    def write_image() -> bytes:
+        writer = ImageWriter()
+        for name, node in roots.items():
+            writer.add_root(name, node)
+        return writer.to_bytes()
+
+    image_write, data = timed(args.repeat, write_image)
+    pickle_write, pickled = timed(args.repeat, lambda: pickle.dumps(roots))
+
+    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as f:
+        f.write(data)
+
+    def load_image():
+        with Image.open(f.name) as image:
+            return {name: image[name] for name in image.roots}
+
+    try:
+        image_load, loaded = timed(args.repeat, load_image)
+    finally:
+        os.unlink(f.name)
+    pickle_load, _ = timed(args.repeat, lambda: pickle.loads(pickled))
+
+    mismatches = 0
+    for name, node in roots.items():
+        if isinstance(node, DFATable):
+            mismatches += node.to_json() != loaded[name].to_json()
+        else:
+            mismatches += node.to_string("") != loaded[name].to_string("")
+
+    print(f"{len(roots)} projections and DFA tables, {mismatches} mismatches")
+    print(f"{'':8}{'bytes':>10}{'write ms':>10}{'load ms':>10}")
+    for label, size, write, load in (
+        ("image", len(data), image_write, image_load),
+        ("pickle", len(pickled), pickle_write, pickle_load),
+    ):
+        print(f"{label:8}{size:>10}{write * 1000:>10.2f}{load * 1000:>10.2f}")
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Throughput of the DFA exploration with the visited states kept in memory
+(the default exploration and a MemoryStateStore), on disk (DiskStateStore) and
+spilled to disk once there are more than --spill states. The DFA is the one
+of the blow-up protocol of parallel_scaling.py, with 2^depth + 1 states, and
+every store must give the same transition table as the default exploration.
+
+    python benchmarks/state_store.py --depth 14 --spill 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.parallel_scaling import blowup_source  # noqa: E402
+from dfa.dfa import DFA  # noqa: E402
+from dfa.equivalence import DFATable  # noqa: E402
+from dfa.state_store import (  # noqa: E402
+    DiskStateStore,
+    MemoryStateStore,
+    SpillingStateStore,
+)
+from parser import parser as scr_parser  # noqa: E402
+
+
+def explore(ltype, store=None):
+    dfa = DFA(ltype, store)
+    start = time.perf_counter()
+    dfa.explore()
+    elapsed = time.perf_counter() - start
+    return elapsed, DFATable.from_dfa(dfa).to_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="State store benchmark")
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--spill", type=int, default=1000)
+    parser.add_argument("--dir", help="directory for the disk stores (temporary by default)")
+    args = parser.parse_args()
+
+    protocol = scr_parser.parse_source(blowup_source(args.depth))["Blowup"]
+    ltype = protocol.gtype.project(set(protocol.roles))["r"].normalise()
+
+    # The first exploration also fills the memoised hashes and first actions
+    # of the local type, so it is left out of the timings
+    explore(ltype)
+    elapsed, expected = explore(ltype)
+    states = expected["states"]
+    print(f"depth {args.depth}: {states} states")
+    print(f"{'store':12}{'s':>8}{'states/s':>12}")
+    print(f"{'default':12}{elapsed:>8.2f}{states / elapsed:>12.0f}")
+
+    mismatches = 0
+    stores = (
+        ("memory", lambda: MemoryStateStore()),
+        ("disk", lambda: DiskStateStore(args.dir)),
+        ("spilling", lambda: SpillingStateStore(args.spill, args.dir)),
+    )
+    for name, make_store in stores:
+        with make_store() as store:
+            elapsed, table = explore(ltype, store)
+        same = table == expected
+        mismatches += not same
+        print(
+            f"{name:12}{elapsed:>8.2f}{states / elapsed:>12.0f}"
+            f"{'' if same else '  MISMATCH'}"
+        )
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
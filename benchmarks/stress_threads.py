@@ -0,0 +1,66 @@
+"""Stress test for concurrent translations: the protocols of a file are parsed
+once and projected and translated from many threads at the same time, sharing
+the parsed protocols and a projection cache. Every result must be equal to
+the one of a sequential run (api/test_api.py runs a bounded version of it
+over the examples).
+
+    python benchmarks/stress_threads.py examples/examples.scr --threads 16
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.api import ProjectionCache, project_protocols  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def results_to_strings(results) -> Dict[Tuple[str, str], Optional[str]]:
+    strings = {}
+    for name, result in results.items():
+        for role, projection in result.projections.items():
+            if projection.ok:
+                strings[(name, role)] = projection.projection.to_string("")
+            else:
+                strings[(name, role)] = type(projection.error).__name__
+    return strings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent translation stress test")
+    parser.add_argument("file", help="file with the protocols to translate")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    # The reference results come from a separate copy of the protocols, so
+    # the shared one is first projected by the threads
+    expected = results_to_strings(project_protocols(scr_parser.parse_file(args.file)))
+    protocols = scr_parser.parse_file(args.file)
+    cache = ProjectionCache()
+
+    def run(iteration: int) -> int:
+        # Half of the runs share the cache, the other half start from scratch
+        run_cache = cache if iteration % 2 == 0 else ProjectionCache()
+        strings = results_to_strings(project_protocols(protocols, cache=run_cache))
+        return sum(1 for key, value in expected.items() if strings.get(key) != value)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        mismatches = sum(executor.map(run, range(args.iterations)))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{args.iterations} translations of {len(expected)} projections "
+        f"on {args.threads} threads in {elapsed:.2f}s, {mismatches} mismatches"
+    )
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
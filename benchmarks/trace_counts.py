@@ -0,0 +1,76 @@
+"""Counting the traces of a projection with the transition matrix of its DFA
+against enumerating them. The DFA is the one of the blow-up protocol of
+parallel_scaling.py. Enumeration is only run while the traces of length at
+most k are fewer than --max-enumerated, and both counts must agree.
+
+    python benchmarks/trace_counts.py --depth 10 --ks 4 8 12 16 100 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics.analytics import TransitionMatrix, statistics, trace_counts  # noqa: E402
+from benchmarks.parallel_scaling import blowup_source  # noqa: E402
+from dfa.dfa import DFA  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def enumerate_traces(dfa: DFA, k: int) -> int:
+    """Number of traces of length at most k, building every one of them"""
+    total = 1
+    layer = [((), dfa.start)]
+    for _ in range(k):
+        layer = [
+            (trace + (action,), next_state)
+            for trace, state in layer
+            for action, next_state in dfa.transitions[state].items()
+        ]
+        total += len(layer)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace counting benchmark")
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--ks", type=int, nargs="+", default=[4, 8, 12, 16, 100, 1000])
+    parser.add_argument("--max-enumerated", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    protocol = scr_parser.parse_source(blowup_source(args.depth))["Blowup"]
+    dfa = DFA(protocol.gtype.project(set(protocol.roles))["r"].normalise())
+    dfa.explore()
+    matrix = TransitionMatrix.from_dfa(dfa)
+    print(
+        f"depth {args.depth}: {matrix.num_states} states, {matrix.num_transitions} transitions"
+    )
+    print(
+        f"{'k':>6}{'traces':>14}{'matrix ms':>12}{'stats ms':>12}{'enumerate ms':>14}"
+    )
+
+    mismatches = 0
+    for k in args.ks:
+        start = time.perf_counter()
+        count = trace_counts(matrix, k).sum()
+        matrix_time = time.perf_counter() - start
+        start = time.perf_counter()
+        statistics(dfa, k)
+        stats_time = time.perf_counter() - start
+        enumerated = ""
+        if count <= args.max_enumerated:
+            start = time.perf_counter()
+            mismatches += enumerate_traces(dfa, k) != count
+            enumerated = f"{(time.perf_counter() - start) * 1000:.1f}"
+        print(
+            f"{k:>6}{count:>14.6g}{matrix_time * 1000:>12.1f}"
+            f"{stats_time * 1000:>12.1f}{enumerated:>14}"
+        )
+    print(f"{mismatches} mismatches")
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Throughput of the synthetic trace generator on the DFA of the blow-up
+protocol of parallel_scaling.py, writing the traces in memory as JSON lines and
+in the binary format. A sample of the traces is replayed on the DFA, and every
+one of them must be a trace of the projection.
+
+    python benchmarks/trace_generation.py --depth 10 --traces 2000000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics.analytics import TransitionMatrix  # noqa: E402
+from analytics.traces import TraceGenerator, read_binary  # noqa: E402
+from benchmarks.parallel_scaling import blowup_source  # noqa: E402
+from dfa.dfa import DFA  # noqa: E402
+from parser import parser as scr_parser  # noqa: E402
+
+
+def conforms(dfa: DFA, trace) -> bool:
+    state = dfa.start
+    for action in trace:
+        state = dfa.transitions[state].get(action)
+        if state is None:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace generation benchmark")
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--traces", type=int, default=2_000_000)
+    parser.add_argument("--max-length", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--sample", type=int, default=10_000)
+    args = parser.parse_args()
+
+    protocol = scr_parser.parse_source(blowup_source(args.depth))["Blowup"]
+    dfa = DFA(protocol.gtype.project(set(protocol.roles))["r"].normalise())
+    dfa.explore()
+    matrix = TransitionMatrix.from_dfa(dfa)
+    print(
+        f"depth {args.depth}: {matrix.num_states} states, "
+        f"{matrix.num_transitions} transitions"
+    )
+    print(f"{'format':8}{'s':>8}{'traces/s':>12}{'MB':>8}")
+
+    generator = TraceGenerator(matrix, max_length=args.max_length, seed=0)
+    for name in ("binary", "jsonl"):
+        out = io.BytesIO() if name == "binary" else io.StringIO()
+        write = generator.write_binary if name == "binary" else generator.write_jsonl
+        start = time.perf_counter()
+        write(out, args.traces, args.batch_size)
+        elapsed = time.perf_counter() - start
+        size = len(out.getvalue()) / 1e6
+        print(f"{name:8}{elapsed:>8.2f}{args.traces / elapsed:>12.0f}{size:>8.1f}")
+
+    out = io.BytesIO()
+    generator.write_binary(out, args.sample, args.batch_size)
+    out.seek(0)
+    failures = sum(not conforms(dfa, trace) for trace in read_binary(out))
+    print(f"{failures} of {args.sample} sampled traces don't conform")
+    if failures > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Growth bounds on the operation counts (see counters.py) of projecting the
+protocols of a few generated families, checked by test_complexity.py and
+printed by benchmarks/complexity.py. Every protocol is projected, normalised,
+determinised and rebuilt as a local type, counting the operations of each
+phase, and every count must stay within a bound linear in the size of what
+the phase works on (the sizes of the types count their distinct nodes):
+
+    global    hash        <= 4 * global size
+    normalise hash        <= 4 * (projection size + normalised size)
+    explore   dfa_states  one per state of the DFA
+              subterm_expansions
+                          one per subterm of the normalised type
+              next_states <= 4 * normalised size
+              merged_sets <= the sum over the states of their subterms times
+                          their transitions
+              hash        <= 4 * (normalised size + states)
+    rebuild   recursive_states
+                          <= states + transitions
+              dfa_to_ltype
+                          <= size of the rebuilt type, which unfolds the
+                          DFA into a tree (so it isn't run for blowup, where
+                          the tree has exponential size)
+    simplify  hash        <= 4 * size of the rebuilt type
+
+blowup is the protocol of parallel_scaling.py, whose DFA has 2^n + 1 states
+(so its bounds are relative to the states, not to n); ring and scatter are
+the protocols of engines.py, with n roles; fanout is a loop over a choice of
+n labels; and nested is n nested recursions, each of which can be continued
+from the innermost one"""
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from benchmarks.engines import ring_source, scatter_source
+from benchmarks.normalisation import size
+from benchmarks.parallel_scaling import blowup_source
+from counters.counters import (
+    DFA_STATES,
+    DFA_TO_LTYPE,
+    HASH,
+    MERGED_SETS,
+    NEXT_STATES,
+    RECURSIVE_STATES,
+    SUBTERM_EXPANSIONS,
+    counting,
+)
+from dfa.dfa import DFA, mask_bits
+from gtypes.gchoice import GChoice, GIDChoice
+from gtypes.gmessage_pass import GMessagePass
+from gtypes.grecursion import GRecursion
+from gtypes.gtype import GType
+from parser import parser as scr_parser
+
+
+def label(idx: int) -> str:
+    # Labels can't have digits
+    letters = []
+    while True:
+        idx, letter = divmod(idx, 26)
+        letters.append(chr(ord("a") + letter))
+        if idx == 0:
+            return "l" + "".join(letters)
+
+
+def fanout_source(num_labels: int) -> str:
+    branches = " or ".join(
+        f"{{ a->b:{label(idx)}; continue X }}" for idx in range(num_labels)
+    )
+    return (
+        "global protocol Fanout(role a, role b) {\n"
+        f"    rec X {{ choice {branches} or {{ a->b:done; end }} }}\n"
+        "}\n"
+    )
+
+
+def nested_source(depth: int) -> str:
+    branches = " or ".join(
+        f"{{ a->b:{label(idx)}; continue X{label(idx)} }}" for idx in range(depth)
+    )
+    body = f"choice {branches} or {{ a->b:done; end }}"
+    for idx in reversed(range(depth)):
+        body = f"rec X{label(idx)} {{ a->b:m; {body} }}"
+    return f"global protocol Nested(role a, role b) {{\n    {body}\n}}\n"
+
+
+class Family(NamedTuple):
+    # Source of the protocol of size n
+    source: Callable[[int], str]
+    proto_name: str
+    role: str
+    sizes: List[int]
+    # Whether the DFA is rebuilt as a local type
+    rebuild: bool
+
+
+FAMILIES: Dict[str, Family] = {
+    "blowup": Family(blowup_source, "Blowup", "r", [4, 6, 8, 10], False),
+    "ring": Family(ring_source, "Ring", "r0", [4, 8, 16, 32], True),
+    "scatter": Family(scatter_source, "Scatter", "m", [8, 16, 32, 64], True),
+    "fanout": Family(fanout_source, "Fanout", "b", [8, 16, 32, 64], True),
+    "nested": Family(nested_source, "Nested", "b", [4, 8, 16, 32], True),
+}
+
+
+class Bound(NamedTuple):
+    phase: str
+    operation: str
+    # Bound on the count, given the sizes
+    limit: Callable[[Dict[str, int]], int]
+    # Whether it only applies to the DFAs which are rebuilt
+    rebuilt_only: bool
+
+
+BOUNDS: List[Bound] = [
+    Bound("global", HASH, lambda s: 4 * s["global"], False),
+    Bound("normalise", HASH, lambda s: 4 * (s["projection"] + s["normalised"]), False),
+    Bound("explore", DFA_STATES, lambda s: s["states"], False),
+    Bound("explore", SUBTERM_EXPANSIONS, lambda s: s["subterms"], False),
+    Bound("explore", NEXT_STATES, lambda s: 4 * s["normalised"], False),
+    Bound("explore", MERGED_SETS, lambda s: s["merges"], False),
+    Bound("explore", HASH, lambda s: 4 * (s["normalised"] + s["states"]), False),
+    Bound("rebuild", RECURSIVE_STATES, lambda s: s["states"] + s["transitions"], False),
+    Bound("rebuild", DFA_TO_LTYPE, lambda s: s["rebuilt"], True),
+    Bound("simplify", HASH, lambda s: 4 * s["rebuilt"], True),
+]
+
+
+def gtype_children(gtype: GType):
+    if isinstance(gtype, GMessagePass):
+        return [gtype.cont]
+    if isinstance(gtype, GRecursion):
+        return [gtype.gtype]
+    if isinstance(gtype, (GChoice, GIDChoice)):
+        return gtype.branches
+    return []
+
+
+def gtype_size(gtype: GType) -> int:
+    """Number of distinct nodes of the type"""
+    seen = {id(gtype)}
+    stack = [gtype]
+    while stack:
+        for child in gtype_children(stack.pop()):
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+    return len(seen)
+
+
+def measure(family: Family, n: int):
+    """Counts of the operations of each phase, and the sizes they are
+    bounded by"""
+    protocol = scr_parser.parse_source(family.source(n))[family.proto_name]
+    counts = {}
+    with counting() as counts["global"]:
+        protocol.gtype.hash()
+    ltype = protocol.gtype.project(set(protocol.roles))[family.role]
+    with counting() as counts["normalise"]:
+        normalised = ltype.normalise()
+    dfa = DFA(normalised)
+    with counting() as counts["explore"]:
+        dfa.explore()
+    # Same as dfa.to_ltype(), by phases
+    rebuilt = None
+    with counting() as counts["rebuild"]:
+        dfa.recursive = dfa.recursive_states()
+        if family.rebuild:
+            rebuilt = dfa.dfa_to_ltype(dfa.start, set())
+    with counting() as counts["simplify"]:
+        if family.rebuild:
+            rebuilt.normalise()
+
+    sizes = {
+        "global": gtype_size(protocol.gtype),
+        "projection": size(ltype),
+        "normalised": size(normalised),
+        "subterms": len(dfa.subterms.ltypes),
+        "states": len(dfa.transitions),
+        "transitions": sum(len(t) for t in dfa.transitions.values()),
+        "merges": sum(
+            len(list(mask_bits(state.mask))) * len(transitions)
+            for state, transitions in dfa.transitions.items()
+        ),
+        "rebuilt": size(rebuilt) if family.rebuild else 0,
+    }
+    return counts, sizes
+
+
+def check(family: Family, n: int) -> List[Tuple[Bound, int, int]]:
+    """(bound, count, limit) of every bound which applies to the protocol of
+    size n of the family"""
+    counts, sizes = measure(family, n)
+    return [
+        (bound, counts[bound.phase][bound.operation], bound.limit(sizes))
+        for bound in BOUNDS
+        if family.rebuild or not bound.rebuilt_only
+    ]
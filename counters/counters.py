@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Operations whose number grows with the cost of projecting a protocol. They
+# are counted all the time, with an increment inlined in the operation (which
+# is cheap next to the operation itself), so the complexity of the algorithms
+# can be checked without relying on timings (see complexity.py).
+# The hashes of the types are counted when they are computed, not when they
+# are found in the memo
+HASH = "hash"
+NEXT_STATES = "next_states"
+SUBTERM_EXPANSIONS = "subterm_expansions"
+DFA_STATES = "dfa_states"
+# Transitions visited by DFA.recursive_states, when the DFA is rebuilt
+RECURSIVE_STATES = "recursive_states"
+DFA_TO_LTYPE = "dfa_to_ltype"
+MERGED_SETS = "merged_sets"
+# Nodes copied by rename_tvars
+RENAMED_NODES = "renamed_nodes"
+
+COUNTS: Dict[str, int] = dict.fromkeys(
+    (
+        HASH,
+        NEXT_STATES,
+        SUBTERM_EXPANSIONS,
+        DFA_STATES,
+        RECURSIVE_STATES,
+        DFA_TO_LTYPE,
+        MERGED_SETS,
+        RENAMED_NODES,
+    ),
+    0,
+)
+
+
+@contextmanager
+def counting() -> Iterator[Dict[str, int]]:
+    """Yields a dict which, once the block is left, holds the number of
+    operations of each kind done inside it. The counts are global, so they
+    include the operations of other threads running at the same time"""
+    start = dict(COUNTS)
+    counts: Dict[str, int] = {}
+    try:
+        yield counts
+    finally:
+        counts.update({name: COUNTS[name] - start[name] for name in COUNTS})
@@ -0,0 +1,16 @@
+import pytest
+
+from counters.complexity import FAMILIES, check
+
+
+@pytest.mark.parametrize(
+    "family,n",
+    [(family, n) for family in FAMILIES for n in FAMILIES[family].sizes],
+)
+def test_operation_counts_within_bounds(family, n):
+    exceeded = [
+        f"{bound.phase} {bound.operation}: {count} > {limit}"
+        for bound, count, limit in check(FAMILIES[family], n)
+        if count > limit
+    ]
+    assert not exceeded
@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+from threading import local
+from typing import Any, Iterator, Optional
+
+from errors.errors import ExplorationCancelled
+
+# Explorations check whether they have been cancelled every CHECK_INTERVAL
+# states (a power of 2), starting with the first one
+CHECK_INTERVAL = 256
+
+_current = local()
+
+
+class CancelToken:
+    """Tells the explorations running on behalf of a request to stop, either
+    when the event is set or after the deadline (wall-clock time, so that it
+    means the same in worker processes). The event may be a threading.Event,
+    or a multiprocessing manager Event for explorations in other processes"""
+
+    def __init__(self, event: Any = None, deadline: Optional[float] = None) -> None:
+        self.event = event
+        self.deadline = deadline
+
+    def cancel(self) -> None:
+        if self.event is not None:
+            self.event.set()
+
+    def cancelled(self) -> bool:
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.event is not None and self.event.is_set()
+
+
+@contextmanager
+def cancellable(token: Optional[CancelToken]) -> Iterator[None]:
+    """Explorations run by this thread within the context stop with
+    ExplorationCancelled once the token is cancelled"""
+    previous = getattr(_current, "token", None)
+    _current.token = token
+    try:
+        yield
+    finally:
+        _current.token = previous
+
+
+def check_cancelled() -> None:
+    token = getattr(_current, "token", None)
+    if token is not None and token.cancelled():
+        raise ExplorationCancelled()
@@ -0,0 +1,155 @@
+import os
+import pickle
+import time
+from typing import BinaryIO, Dict, List, Optional
+
+from dfa.cancellation import CHECK_INTERVAL, check_cancelled
+from dfa.dfa import DFA, SubtermTable
+from dfa.state_store import MemoryStateStore, StateStore
+from ltypes.laction import LAction
+from ltypes.ltype import LType
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHECKPOINT_MAGIC = "dfa-checkpoint"
+CHECKPOINT_VERSION = 2
+
+
+def checkpoint_path(directory: str, ltype: LType) -> str:
+    """Checkpoint file of a local type, named after its stable hash (the same
+    hash which identifies its subterms in the checkpoint)"""
+    return os.path.join(directory, f"{ltype.hash():016x}.ckpt")
+
+
+class CheckpointDFA(DFA):
+    """DFA whose exploration is saved to a checkpoint file at least every
+    interval seconds, so that an exploration which is killed can be resumed
+    from its last checkpoint. The file is a header followed by a pickled
+    record for each checkpoint, with what was found since the previous one:
+
+    - the stable hashes of the new subterms, in the order of their ids, so
+      that the resumed exploration numbers the subterms in the same way
+    - the masks of the new states (both expanded and still to be expanded)
+    - the transitions of the states expanded since the previous checkpoint
+
+    Records are only appended (and synced), so a checkpoint cut short by a
+    kill is just ignored when resuming. As the subterms and states are
+    numbered as in the uninterrupted exploration, a resumed exploration builds
+    the same DFA, state for state"""
+
+    def __init__(
+        self,
+        ltype: LType,
+        path: str,
+        interval: float = 60.0,
+        resume: bool = False,
+        store: Optional[StateStore] = None,
+    ) -> None:
+        super().__init__(ltype, MemoryStateStore() if store is None else store)
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+        self.ltype_hash = ltype.hash()
+        # What has already been written to the checkpoint file
+        self.saved_subterms = 0
+        self.saved_states = 0
+        self.saved_uid = 0
+        self.pending: List[Dict[LAction, int]] = []
+        self.checkpoints = 0
+        # First state expanded after resuming
+        self.resumed_from = 0
+
+    def explore(self) -> int:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a+b") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Another process is exploring the same local type
+                    return self.explore_store()
+            return self.explore_checkpointed(f)
+
+    def explore_checkpointed(self, f: BinaryIO) -> int:
+        uid = self.restore(f) if self.resume else 0
+        self.resumed_from = uid
+        if uid == 0 and len(self.store) == 0:
+            f.truncate(0)
+            pickle.dump((CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.ltype_hash), f)
+            self.store.add(self.subterms.mask([self.ltype]))
+
+        last_checkpoint = time.monotonic()
+        while uid < len(self.store):
+            if uid & (CHECK_INTERVAL - 1) == 0:
+                check_cancelled()
+            self.pending.append(self.expand_stored(uid))
+            uid += 1
+            if time.monotonic() - last_checkpoint >= self.interval:
+                self.checkpoint(f, uid)
+                last_checkpoint = time.monotonic()
+        if uid > self.saved_uid or len(self.store) > self.saved_states:
+            self.checkpoint(f, uid)
+        return self.load_store()
+
+    def checkpoint(self, f: BinaryIO, uid: int) -> None:
+        subterm_hashes = [
+            ltype.hash()
+            for ltype in self.subterms.ltypes[self.saved_subterms :]
+        ]
+        masks = [
+            self.store.mask(idx) for idx in range(self.saved_states, len(self.store))
+        ]
+        pickle.dump(
+            (subterm_hashes, masks, self.pending), f, protocol=pickle.HIGHEST_PROTOCOL
+        )
+        f.flush()
+        os.fsync(f.fileno())
+        self.saved_subterms = len(self.subterms.ltypes)
+        self.saved_states = len(self.store)
+        self.saved_uid = uid
+        self.pending = []
+        self.checkpoints += 1
+
+    def restore(self, f: BinaryIO) -> int:
+        """Replays the checkpoints in the file, returning the uid of the first
+        state still to be expanded (0 if there is nothing to resume)"""
+        f.seek(0)
+        try:
+            header = pickle.load(f)
+        except Exception:
+            return 0
+        if header != (CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.ltype_hash):
+            return 0
+
+        ltypes = self.subterms_by_hash()
+        end = f.tell()
+        while True:
+            try:
+                subterm_hashes, masks, transitions = pickle.load(f)
+            except Exception:
+                break
+            for ltype_hash in subterm_hashes:
+                self.subterms.intern(ltypes[ltype_hash])
+            for mask in masks:
+                self.store.add(mask)
+            for state_transitions in transitions:
+                self.store.add_transitions(self.saved_uid, state_transitions)
+                self.saved_uid += 1
+            end = f.tell()
+        # Drop a checkpoint which was cut short, and append after the last
+        # complete one
+        f.truncate(end)
+        f.seek(end)
+        self.saved_subterms = len(self.subterms.ltypes)
+        self.saved_states = len(self.store)
+        return self.saved_uid
+
+    def subterms_by_hash(self) -> Dict[int, LType]:
+        """All the subterms reachable from the local type, by their hash"""
+        table = SubtermTable()
+        table.intern(self.ltype)
+        table.close()
+        return {ltype_hash: table.ltypes[idx] for ltype_hash, idx in table.ids.items()}
@@ -1,41 +1,140 @@
 from abc import ABC
 from collections import deque
-from typing import Set, Dict, Any, Iterable, List, Deque
-
-from ltypes import lchoice
+from typing import Set, Dict, Any, Iterable, Iterator, List, Deque, Optional
+
+from counters.counters import (
+    COUNTS,
+    DFA_STATES,
+    DFA_TO_LTYPE,
+    MERGED_SETS,
+    RECURSIVE_STATES,
+    SUBTERM_EXPANSIONS,
+)
+from dfa.cancellation import CHECK_INTERVAL, check_cancelled
+from errors.errors import NotTraceEquivalent
 from ltypes.laction import LAction
-from ltypes.lchoice import merge_next_states, LUnmergedChoice, LChoice
+from ltypes.lchoice import LUnmergedChoice, LChoice
 from ltypes.lend import LEnd
 from ltypes.lmessage_pass import LMessagePass
 from ltypes.lrec_var import LRecVar
 from ltypes.lrecursion import LRecursion
 from ltypes.ltype import LType
+from dfa.state_store import StateStore
+
+
+def mask_bits(mask: int) -> Iterator[int]:
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+class SubtermTable:
+    """Numbers every distinct local subterm reached during a translation with a
+    dense id, so that sets of local types can be represented as bitmasks. The
+    next states of each subterm are computed once, as a bitmask per action"""
+
+    def __init__(self) -> None:
+        self.ids: Dict[int, int] = {}
+        self.ltypes: List[LType] = []
+        self.successors: List[Optional[Dict[LAction, int]]] = []
+
+    def intern(self, ltype: LType, ltype_hash: Optional[int] = None) -> int:
+        """Id of the subterm, given its hash if it is already known"""
+        if ltype_hash is None:
+            ltype_hash = ltype.hash()
+        idx = self.ids.get(ltype_hash)
+        if idx is None:
+            idx = len(self.ltypes)
+            self.ids[ltype_hash] = idx
+            self.ltypes.append(ltype)
+            self.successors.append(None)
+        return idx
+
+    def mask(self, ltypes: Iterable[LType]) -> int:
+        mask = 0
+        for ltype in ltypes:
+            mask |= 1 << self.intern(ltype)
+        return mask
+
+    def next_masks(self, idx: int) -> Dict[LAction, int]:
+        successors = self.successors[idx]
+        if successors is None:
+            COUNTS[SUBTERM_EXPANSIONS] += 1
+            successors = {
+                action: self.mask(next_ltypes)
+                for action, next_ltypes in self.ltypes[idx].next_states().items()
+            }
+            self.successors[idx] = successors
+        return successors
+
+    def close(self) -> None:
+        """Computes the next states of every subterm reachable from the ones
+        already interned, after which merge_next_states only works on the
+        (picklable) successor masks and no longer needs the local types"""
+        idx = 0
+        while idx < len(self.ltypes):
+            self.next_masks(idx)
+            idx += 1
 
-
-def hash_state(ltypes: List[LType]):
-    return lchoice.hash_ltype_list(ltypes, set())
+    @staticmethod
+    def from_successors(successors) -> "SubtermTable":
+        """Table holding only the successors of some subterms (a list, or a
+        dict from the ids of the subterms), on which merge_next_states works
+        for the states over those subterms"""
+        table = SubtermTable()
+        table.successors = successors
+        return table
+
+    def merge_next_states(self, mask: int) -> Dict[LAction, int]:
+        """Same as lchoice.merge_next_states, for the local types in the mask"""
+        merged = None
+        for idx in mask_bits(mask):
+            transitions = self.next_masks(idx)
+            if merged is None:
+                merged = dict(transitions)
+            else:
+                if merged.keys() != transitions.keys():
+                    raise NotTraceEquivalent(
+                        "All independendent choices should have the same set of first actions"
+                    )
+                COUNTS[MERGED_SETS] += len(transitions)
+                for action, next_mask in transitions.items():
+                    merged[action] |= next_mask
+        return merged
 
 
 class DFAState:
-    state_id = 0
-
-    def __init__(self, ltypes: List[LType]) -> None:
-        self.ltypes = ltypes
-        # If the transitions can be merged, it means all local types have the same first actions
-        self.transitions = merge_next_states(
-            [ltype.next_states() for ltype in self.ltypes]
-        )
-        self.uid = DFAState.state_id
-        DFAState.state_id += 1
-        self.hash = hash_state(self.ltypes)
+    def __init__(
+        self,
+        subterms: SubtermTable,
+        mask: int,
+        uid: int,
+        transitions: Optional[Dict[LAction, int]] = None,
+    ) -> None:
+        COUNTS[DFA_STATES] += 1
+        self.subterms = subterms
+        self.mask = mask
+        if transitions is None:
+            # If the transitions can be merged, it means all local types have the same first actions
+            transitions = subterms.merge_next_states(mask)
+        self.transitions = transitions
+        # States are numbered by the DFA which builds them, so DFAs can be
+        # built concurrently
+        self.uid = uid
+        self.hash = mask
+
+    @property
+    def ltypes(self) -> List[LType]:
+        return [self.subterms.ltypes[idx] for idx in mask_bits(self.mask)]
 
     def __hash__(self):
-        return self.hash
+        return hash(self.mask)
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, DFAState):
             return False
-        return self.__hash__() == other.__hash__()
+        return self.mask == other.mask
 
     def __str__(self) -> str:
         return f"({self.uid})"
@@ -48,38 +147,152 @@ class DFAState:
 
 
 class DFA:
-    def __init__(self, ltype: LType) -> None:
+    def __init__(self, ltype: LType, store: Optional[StateStore] = None) -> None:
         self.ltype = ltype
+        # Where the visited states are kept while exploring, if they shouldn't
+        # all be kept in memory (see explore_store)
+        self.store = store
         self.tvar_id = 0
-        self.rec_variables: Dict[int, str] = {}
+        self.rec_variables: Dict[Any, str] = {}
         self.transitions: Dict[DFAState, Dict[LAction, DFAState]] = {}
+        self.start: Optional[DFAState] = None
+        self.subterms = SubtermTable()
+        # States on a cycle, found once the DFA is explored (see to_ltype)
+        self.recursive: Optional[Set[Any]] = None
+
+    @staticmethod
+    def from_table(start: Any, transitions: Dict[Any, Dict[LAction, Any]]) -> "DFA":
+        """DFA with precomputed transitions, between states of any hashable
+        type (e.g. the ints of a DFATable)"""
+        dfa = DFA(LEnd())
+        dfa.transitions = transitions
+        dfa.start = start
+        return dfa
 
     def translate(self) -> LType:
+        self.explore()
+        return self.to_ltype()
+
+    def to_ltype(self) -> LType:
+        """Local type with the traces of the DFA, which must be explored"""
+        self.recursive = self.recursive_states()
+        return self.dfa_to_ltype(self.start, set()).normalise()
+
+    def recursive_states(self) -> Set[Any]:
+        """States which are on a cycle: the states of the strongly connected
+        components with more than one state, or with a transition to itself.
+        The components are found with Tarjan's algorithm, which visits every
+        state and transition once, instead of searching for a cycle from every
+        state rebuilt by dfa_to_ltype"""
+        index: Dict[Any, int] = {}
+        low: Dict[Any, int] = {}
+        on_stack: Set[Any] = set()
+        stack: List[Any] = []
+        recursive: Set[Any] = set()
+        for root in self.transitions:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            # Explicit stack of (state, iterator over its next states), so long
+            # chains of states don't exhaust the Python stack
+            work = [(root, iter(self.transitions[root].values()))]
+            while work:
+                state, next_states = work[-1]
+                next_state = next(next_states, None)
+                if next_state is not None:
+                    COUNTS[RECURSIVE_STATES] += 1
+                    if next_state == state:
+                        recursive.add(state)
+                    if next_state not in index:
+                        index[next_state] = low[next_state] = len(index)
+                        stack.append(next_state)
+                        on_stack.add(next_state)
+                        work.append(
+                            (next_state, iter(self.transitions[next_state].values()))
+                        )
+                    elif next_state in on_stack:
+                        low[state] = min(low[state], index[next_state])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[state])
+                if low[state] == index[state]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == state:
+                            break
+                    if len(component) > 1:
+                        recursive.update(component)
+        return recursive
+
+    def explore(self) -> DFAState:
+        """Builds the transitions of all the reachable states of the DFA and
+        returns the start state"""
+        if self.store is not None:
+            return self.explore_store()
+
         queue: Deque[DFAState] = deque()
 
-        start = DFAState([self.ltype])
+        start = DFAState(self.subterms, self.subterms.mask([self.ltype]), 0)
         queue.append(start)
-        all_states: Dict[int, DFAState] = {start.__hash__(): start}
+        all_states: Dict[int, DFAState] = {start.mask: start}
 
         self.transitions: Dict[DFAState, Dict[LAction, DFAState]] = {start: {}}
 
+        expanded = 0
         while queue:
+            if expanded & (CHECK_INTERVAL - 1) == 0:
+                check_cancelled()
+            expanded += 1
             current = queue.popleft()
             curr_transitions = {}
-            for action, next_state in current.transitions.items():
-                next_state_list = list(next_state)
-                state_hash = hash_state(next_state_list)
-
-                if state_hash not in all_states:
-                    new_state = DFAState(next_state_list)
-                    all_states[state_hash] = new_state
+            for action, next_mask in current.transitions.items():
+                if next_mask not in all_states:
+                    new_state = DFAState(self.subterms, next_mask, len(all_states))
+                    all_states[next_mask] = new_state
                     curr_transitions[action] = new_state
                     queue.append(new_state)
                 else:
-                    curr_transitions[action] = all_states[state_hash]
+                    curr_transitions[action] = all_states[next_mask]
             self.transitions[current] = curr_transitions
 
-        return self.dfa_to_ltype(start, set()).normalise()
+        self.start = start
+        return start
+
+    def explore_store(self) -> int:
+        """Same as explore, but the visited states are kept in the store instead
+        of in memory, and only their masks are stored. States are numbered in
+        the order they are found, so the states still to be expanded are just
+        the uids after the current one. The transitions between the uids are
+        read back from the store once the exploration is finished"""
+        self.store.add(self.subterms.mask([self.ltype]))
+        uid = 0
+        while uid < len(self.store):
+            if uid & (CHECK_INTERVAL - 1) == 0:
+                check_cancelled()
+            self.expand_stored(uid)
+            uid += 1
+        return self.load_store()
+
+    def expand_stored(self, uid: int) -> Dict[LAction, int]:
+        """Adds the transitions of a state of the store (and the states they
+        lead to), returning them"""
+        transitions = {}
+        for action, next_mask in self.subterms.merge_next_states(self.store.mask(uid)).items():
+            transitions[action], _ = self.store.add(next_mask)
+        self.store.add_transitions(uid, transitions)
+        return transitions
+
+    def load_store(self) -> int:
+        self.transitions = dict(self.store.transitions())
+        self.start = 0
+        return 0
 
     def rec_var_name(self, state: DFAState) -> str:
         # hash_code = state.hash
@@ -92,14 +305,15 @@ class DFA:
         # self.tvar_id += 1
         # return rec_var
 
-        hash_code = state.hash
-        if hash_code not in self.rec_variables:
-            self.rec_variables[hash_code] = f"t{self.tvar_id}"
+        if state not in self.rec_variables:
+            self.rec_variables[state] = f"t{self.tvar_id}"
             self.tvar_id += 1
 
-        return self.rec_variables[hash_code]
+        return self.rec_variables[state]
 
     def dfa_to_ltype(self, state: DFAState, visited: Set[DFAState]) -> LType:
+        check_cancelled()
+        COUNTS[DFA_TO_LTYPE] += 1
         if state in visited:
             return LRecVar(self.rec_var_name(state))
 
@@ -115,45 +329,15 @@ class DFA:
         elif len(branches) > 1:
             curr = LChoice(branches)
 
-        if self.is_recursive(state, state, set()):
-            # if self.is_recursive1(state):
+        if self.recursive is None:
+            self.recursive = self.recursive_states()
+        if state in self.recursive:
             curr = LRecursion(self.rec_var_name(state), curr)
 
         visited.remove(state)
 
         return curr
 
-    # def is_recursive2(self, state: DFAState, visited: Set[DFAState]):
-    #     if state in visited:
-    #         return
-    #
-    #     visited.add(state)
-    #
-    #     for next_state in self.transitions[state].values():
-    #         if self.is_recursive2(next_state, visited):
-    #             return
-    #
-    #     return
-    #
-    # def is_recursive1(self, state: DFAState):
-    #     visited = set()
-    #     for next_state in self.transitions[state].values():
-    #         self.is_recursive2(next_state, visited)
-    #
-    #     return state in visited
-
-    def is_recursive(self, state: DFAState, target: DFAState, visited: Set[DFAState]):
-        if state in visited:
-            return False
-
-        visited.add(state)
-
-        for next_state in self.transitions[state].values():
-            if next_state == target or self.is_recursive(next_state, target, visited):
-                return True
-
-        return False
-
     @staticmethod
     def transition_to_str(start: DFAState, action: LAction, end: DFAState):
         return f"[{start}\n- {action} ->\n{end}]"
@@ -0,0 +1,120 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dfa.dfa import DFA
+from ltypes.laction import LAction, ActionType
+from ltypes.ltype import LType
+from unionfind.unionfind import DisjointSets
+
+ACTION_TYPES = {str(action_type): action_type for action_type in ActionType}
+
+
+class DFATable:
+    """Transition table of a DFA with plain integer states, as stored in the
+    golden projection files"""
+
+    def __init__(self, start: int, transitions: Dict[int, Dict[LAction, int]]):
+        self.start = start
+        self.transitions = transitions
+
+    @staticmethod
+    def from_dfa(dfa: DFA) -> "DFATable":
+        if dfa.start is None:
+            dfa.explore()
+        state_ids = {state: idx for idx, state in enumerate(dfa.transitions)}
+        transitions = {
+            state_ids[state]: {
+                action: state_ids[next_state]
+                for action, next_state in state_transitions.items()
+            }
+            for state, state_transitions in dfa.transitions.items()
+        }
+        return DFATable(state_ids[dfa.start], transitions)
+
+    def to_ltype(self) -> LType:
+        return DFA.from_table(self.start, self.transitions).to_ltype()
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "start": self.start,
+            "states": len(self.transitions),
+            "transitions": [
+                [
+                    state,
+                    action.participant,
+                    str(action.action_type),
+                    action.payload,
+                    next_state,
+                ]
+                for state, state_transitions in self.transitions.items()
+                for action, next_state in state_transitions.items()
+            ],
+        }
+
+    @staticmethod
+    def from_json(table: Dict[str, Any]) -> "DFATable":
+        transitions: Dict[int, Dict[LAction, int]] = {
+            state: {} for state in range(table["states"])
+        }
+        for state, participant, action_type, payload, next_state in table[
+            "transitions"
+        ]:
+            action = LAction(participant, ACTION_TYPES[action_type], payload)
+            transitions[state][action] = next_state
+        return DFATable(table["start"], transitions)
+
+
+def distinguishing_trace(dfa1, dfa2) -> Optional[List[LAction]]:
+    """Checks whether two DFAs (either DFA or DFATable instances) accept the
+    same traces using the Hopcroft-Karp union-find algorithm. Returns None if
+    they are equivalent, otherwise a shortest trace which is accepted by only
+    one of them. Pairs of states are explored in BFS order, so the first
+    mismatch found is reached through a shortest trace"""
+    for dfa in (dfa1, dfa2):
+        if isinstance(dfa, DFA) and dfa.start is None:
+            dfa.explore()
+
+    # Each entry stores the pair of states, the index of the entry it was
+    # reached from and the action taken, so traces can be rebuilt on failure
+    visited: List[Tuple[Any, Any, int, Optional[LAction]]] = [
+        (dfa1.start, dfa2.start, -1, None)
+    ]
+    queue: Deque[int] = deque([0])
+    sets = DisjointSets()
+    sets.union((0, dfa1.start), (1, dfa2.start))
+
+    while queue:
+        idx = queue.popleft()
+        state1, state2, _, _ = visited[idx]
+        transitions1 = dfa1.transitions[state1]
+        transitions2 = dfa2.transitions[state2]
+        if transitions1.keys() != transitions2.keys():
+            mismatches = transitions1.keys() ^ transitions2.keys()
+            action = min(mismatches, key=str)
+            return _rebuild_trace(visited, idx) + [action]
+
+        for action, next_state1 in transitions1.items():
+            next_state2 = transitions2[action]
+            if sets.union((0, next_state1), (1, next_state2)):
+                visited.append((next_state1, next_state2, idx, action))
+                queue.append(len(visited) - 1)
+    return None
+
+
+def _rebuild_trace(
+    visited: List[Tuple[Any, Any, int, Optional[LAction]]], idx: int
+) -> List[LAction]:
+    trace = []
+    while idx > 0:
+        _, _, idx, action = visited[idx]
+        trace.append(action)
+    trace.reverse()
+    return trace
+
+
+def ltype_distinguishing_trace(ltype1: LType, ltype2: LType) -> Optional[List[LAction]]:
+    return distinguishing_trace(DFA(ltype1), DFA(ltype2))
+
+
+def equivalent(dfa1, dfa2) -> bool:
+    return distinguishing_trace(dfa1, dfa2) is None
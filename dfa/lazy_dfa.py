@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, KeysView, Optional
+
+from dfa.dfa import DFAState, SubtermTable
+from ltypes.laction import LAction
+from ltypes.ltype import LType
+
+
+class LazyDFA:
+    """DFA of a local type which is explored on the fly: a state is only built
+    (merging the next states of its local types) the first time a transition
+    into it is taken. Built states are kept in an LRU cache holding at most
+    max_states states, so arbitrarily large state spaces can be walked
+    incrementally with bounded memory. The local subterms the states are made
+    of are numbered once, so the memory they take is linear in the size of
+    the type. A state is identified by its mask, which is also its uid, so a
+    state rebuilt after being evicted is equal to the evicted one"""
+
+    def __init__(self, ltype: LType, max_states: int = 1024) -> None:
+        assert max_states >= 1
+        self.max_states = max_states
+        self.states: Dict[int, DFAState] = OrderedDict()
+        self.subterms = SubtermTable()
+        self.num_built = 0
+        self.start = self.get_state(self.subterms.mask([ltype]))
+
+    def get_state(self, mask: int) -> DFAState:
+        state = self.states.get(mask)
+        if state is not None:
+            self.states.move_to_end(mask)
+            return state
+
+        state = DFAState(self.subterms, mask, mask)
+        self.num_built += 1
+        self.states[mask] = state
+        if len(self.states) > self.max_states:
+            self.states.popitem(last=False)
+        return state
+
+    @staticmethod
+    def actions(state: DFAState) -> KeysView:
+        return state.transitions.keys()
+
+    @staticmethod
+    def is_terminal(state: DFAState) -> bool:
+        return len(state.transitions) == 0
+
+    def next_state(self, state: DFAState, action: LAction) -> Optional[DFAState]:
+        next_mask = state.transitions.get(action)
+        if next_mask is None:
+            return None
+        return self.get_state(next_mask)
+
+    def run(
+        self, trace: Iterable[LAction], state: Optional[DFAState] = None
+    ) -> Optional[DFAState]:
+        """Follows the trace from the given state (the start state by default),
+        returning the state reached or None if some action is not allowed"""
+        if state is None:
+            state = self.start
+        for action in trace:
+            state = self.next_state(state, action)
+            if state is None:
+                return None
+        return state
+
+    def accepts(self, trace: Iterable[LAction], complete: bool = False) -> bool:
+        """Checks whether the trace is allowed by the local type. If complete is
+        set, the trace must also lead to the end of the protocol"""
+        state = self.run(trace)
+        if state is None:
+            return False
+        return not complete or LazyDFA.is_terminal(state)
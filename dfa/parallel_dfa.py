@@ -0,0 +1,212 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from dfa.cancellation import check_cancelled
+from dfa.dfa import DFA, DFAState, SubtermTable, mask_bits
+from ltypes.laction import LAction
+from ltypes.ltype import LType
+from serialisation.serialisation import Image, ImageWriter
+
+Transitions = Union[Dict[LAction, int], Exception]
+# Next states of a subterm, as the (node, hash) of each next subterm, where
+# nodes are indices in the image of the local type
+Successors = Union[Dict[LAction, List[Tuple[int, int]]], Exception]
+
+ROOT = "ltype"
+
+# Nodes of the image of the local type in a worker process, received once
+# when the worker starts, and the node index of each of them
+_worker_nodes: Dict[int, LType] = {}
+_worker_node_ids: Dict[int, int] = {}
+
+
+def _init_worker(image: bytes) -> None:
+    global _worker_nodes, _worker_node_ids
+    loaded = Image(image)
+    loaded[ROOT]
+    _worker_nodes = loaded.nodes
+    _worker_node_ids = {id(node): idx for idx, node in _worker_nodes.items()}
+
+
+def _successors(nodes: List[int]) -> List[Successors]:
+    results: List[Successors] = []
+    for node in nodes:
+        try:
+            results.append(
+                {
+                    action: [
+                        (_worker_node_ids[id(ltype)], ltype.hash())
+                        for ltype in next_ltypes
+                    ]
+                    for action, next_ltypes in _worker_nodes[node].next_states().items()
+                }
+            )
+        except Exception as e:
+            # Raised again by the coordinator, in the order of a sequential run
+            results.append(e)
+    return results
+
+
+def _merge(subterms: SubtermTable, masks: List[int]) -> List[Transitions]:
+    results: List[Transitions] = []
+    for mask in masks:
+        try:
+            results.append(subterms.merge_next_states(mask))
+        except Exception as e:
+            # Returned rather than raised, so the coordinator reports the
+            # error of the first state in BFS order, like a sequential run
+            results.append(e)
+    return results
+
+
+def _expand(
+    chunk: Tuple[Dict[int, Dict[LAction, int]], List[int]],
+) -> List[Transitions]:
+    successors, masks = chunk
+    return _merge(SubtermTable.from_successors(successors), masks)
+
+
+class ParallelDFA(DFA):
+    """DFA explored level by level, splitting the work of every BFS frontier
+    across a pool of worker processes. The workers receive the image of the
+    local type once (see serialisation.py), and for each frontier they first
+    compute the next states of the subterms reached for the first time, then
+    merge the transitions of the states they are sent. The coordinator only
+    interns the new subterms and numbers the new states, in the same order as
+    a sequential exploration: the result is identical to DFA.explore"""
+
+    def __init__(
+        self, ltype: LType, workers: int, min_parallel_frontier: int = 256
+    ) -> None:
+        super().__init__(ltype)
+        assert workers >= 1
+        self.workers = workers
+        # Smaller frontiers are expanded by the coordinator, as sending them
+        # to the workers costs more than merging them
+        self.min_parallel_frontier = min_parallel_frontier
+        self.image = ImageWriter()
+        self.image.add_root(ROOT, ltype)
+        # Bitmask of the subterms whose next states haven't been computed
+        self.unexpanded = 0
+
+    def chunks(self, items: List) -> List[List]:
+        num_chunks = self.workers * 4
+        chunk_size = (len(items) + num_chunks - 1) // num_chunks
+        return [
+            items[idx : idx + chunk_size] for idx in range(0, len(items), chunk_size)
+        ]
+
+    def intern(self, node: int, ltype_hash: int) -> int:
+        num_subterms = len(self.subterms.ltypes)
+        idx = self.subterms.intern(self.image.objects[node], ltype_hash)
+        if idx == num_subterms:
+            self.unexpanded |= 1 << idx
+        return idx
+
+    def expand_subterms(self, executor: Executor, frontier: List[int]) -> None:
+        """Computes the next states of the subterms of the frontier which
+        haven't been expanded yet in the workers, and interns them in the
+        order in which a sequential exploration would"""
+        reached = 0
+        for mask in frontier:
+            reached |= mask
+        pending = list(mask_bits(reached & self.unexpanded))
+        if not pending:
+            return
+        nodes = [self.image.node_ids[id(self.subterms.ltypes[idx])] for idx in pending]
+        results = dict(
+            zip(
+                pending,
+                (
+                    successors
+                    for chunk_successors in executor.map(
+                        _successors, self.chunks(nodes)
+                    )
+                    for successors in chunk_successors
+                ),
+            )
+        )
+        for position, mask in enumerate(frontier):
+            if not mask & self.unexpanded:
+                continue
+            for idx in mask_bits(mask & self.unexpanded):
+                successors = results[idx]
+                if isinstance(successors, Exception):
+                    # Merge the states up to this one as a sequential run
+                    # would, so the same error is raised first
+                    for earlier in frontier[: position + 1]:
+                        self.subterms.merge_next_states(earlier)
+                    raise successors
+                self.subterms.successors[idx] = {
+                    action: self.mask_nodes(next_nodes)
+                    for action, next_nodes in successors.items()
+                }
+                self.unexpanded &= ~(1 << idx)
+
+    def mask_nodes(self, nodes: List[Tuple[int, int]]) -> int:
+        mask = 0
+        for node, ltype_hash in nodes:
+            mask |= 1 << self.intern(node, ltype_hash)
+        return mask
+
+    def expand(self, executor: Executor, frontier: List[int]) -> List[Transitions]:
+        if len(frontier) < self.min_parallel_frontier:
+            # The coordinator expands the new subterms as it merges
+            transitions = _merge(self.subterms, frontier)
+            self.unexpanded = 0
+            for idx, successors in enumerate(self.subterms.successors):
+                if successors is None:
+                    self.unexpanded |= 1 << idx
+            return transitions
+        self.expand_subterms(executor, frontier)
+        chunks = []
+        for masks in self.chunks(frontier):
+            reached = 0
+            for mask in masks:
+                reached |= mask
+            successors = self.subterms.successors
+            chunks.append(({idx: successors[idx] for idx in mask_bits(reached)}, masks))
+        return [
+            transitions
+            for chunk_transitions in executor.map(_expand, chunks)
+            for transitions in chunk_transitions
+        ]
+
+    def explore(self) -> DFAState:
+        start_mask = self.subterms.mask([self.ltype])
+        self.unexpanded = start_mask
+
+        uids: Dict[int, int] = {start_mask: 0}
+        state_transitions: Dict[int, Dict[LAction, int]] = {}
+        frontier = [start_mask]
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.image.to_bytes(),),
+        ) as executor:
+            while frontier:
+                check_cancelled()
+                next_frontier = []
+                for mask, transitions in zip(frontier, self.expand(executor, frontier)):
+                    if isinstance(transitions, Exception):
+                        raise transitions
+                    state_transitions[mask] = transitions
+                    for next_mask in transitions.values():
+                        if next_mask not in uids:
+                            uids[next_mask] = len(uids)
+                            next_frontier.append(next_mask)
+                frontier = next_frontier
+
+        states = {
+            mask: DFAState(self.subterms, mask, uid, state_transitions[mask])
+            for mask, uid in uids.items()
+        }
+        self.transitions = {
+            state: {
+                action: states[next_mask]
+                for action, next_mask in state.transitions.items()
+            }
+            for state in states.values()
+        }
+        self.start = states[start_mask]
+        return self.start
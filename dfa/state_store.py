@@ -0,0 +1,302 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from hashlib import blake2b
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ltypes.laction import LAction
+
+# Header of the transitions of a state in the transition log (uid, number of
+# transitions), followed by a record (action id, next uid) for each of them
+LOG_RECORD = struct.Struct("<II")
+LOG_CHUNK = 1 << 16
+
+
+def fingerprint(mask: int) -> int:
+    """Stable 64-bit fingerprint of a set of subterms, never 0 (which marks
+    the empty slots of the fingerprint table)"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    digest = blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class StateStore(ABC):
+    """Visited states of a DFA exploration, identified by the bitmask of their
+    subterms, and the transitions between them. States are numbered in the
+    order they are added, and their transitions must be added in the same
+    order, so the store can keep them in an append-only log"""
+
+    @abstractmethod
+    def add(self, mask: int) -> Tuple[int, bool]:
+        """Returns the uid of the state and whether it is a new state"""
+        pass
+
+    @abstractmethod
+    def mask(self, uid: int) -> int:
+        pass
+
+    @abstractmethod
+    def add_transitions(self, uid: int, transitions: Dict[LAction, int]) -> None:
+        pass
+
+    @abstractmethod
+    def transitions(self) -> Iterator[Tuple[int, Dict[LAction, int]]]:
+        """Transitions of the states, in the order they were added"""
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "StateStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self) -> None:
+        self.ids: Dict[int, int] = {}
+        self.masks: List[int] = []
+        self.table: List[Dict[LAction, int]] = []
+
+    def add(self, mask: int) -> Tuple[int, bool]:
+        uid = self.ids.get(mask)
+        if uid is not None:
+            return uid, False
+        uid = len(self.masks)
+        self.ids[mask] = uid
+        self.masks.append(mask)
+        return uid, True
+
+    def mask(self, uid: int) -> int:
+        return self.masks[uid]
+
+    def add_transitions(self, uid: int, transitions: Dict[LAction, int]) -> None:
+        assert uid == len(self.table)
+        self.table.append(transitions)
+
+    def transitions(self) -> Iterator[Tuple[int, Dict[LAction, int]]]:
+        return iter(enumerate(self.table))
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+
+class MappedArray:
+    """Array of unsigned 64-bit ints in a memory-mapped file, which can grow.
+    New items are 0"""
+
+    def __init__(self, path: str, capacity: int) -> None:
+        self.path = path
+        self.file = open(path, "w+b")
+        self.mmap: Optional[mmap.mmap] = None
+        self.items: Optional[memoryview] = None
+        self.capacity = 0
+        self.resize(capacity)
+
+    def resize(self, capacity: int) -> None:
+        self.unmap()
+        self.file.truncate(capacity * 8)
+        self.mmap = mmap.mmap(self.file.fileno(), capacity * 8)
+        self.items = memoryview(self.mmap).cast("Q")
+        self.capacity = capacity
+
+    def unmap(self) -> None:
+        if self.items is not None:
+            self.items.release()
+            self.mmap.close()
+            self.items = None
+            self.mmap = None
+
+    def close(self) -> None:
+        self.unmap()
+        self.file.close()
+
+
+class DiskStateStore(StateStore):
+    """Keeps the states and the transitions of an exploration on disk, in a
+    directory (a temporary one, removed when the store is closed, by default):
+
+    - fingerprints: open addressing table (linear probing) of the
+      fingerprints of the masks of the states, memory-mapped
+    - index: offset and length of the mask of each state in the masks file,
+      memory-mapped
+    - masks: the bytes of the masks of the states, appended as they are added
+    - transitions: append-only log of the transitions of each state
+
+    Only the actions (as many as the distinct actions of the local types) are
+    kept in memory. Fingerprints which match are checked against the stored
+    mask, so distinct states are never merged"""
+
+    def __init__(self, directory: Optional[str] = None, capacity: int = 1 << 16) -> None:
+        self.temporary = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="dfa-states-")
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # Power of 2, kept at most half full
+        self.slots = 1 << max(capacity - 1, 1).bit_length()
+        self.fingerprints = MappedArray(self.path("fingerprints"), 2 * self.slots)
+        self.index = MappedArray(self.path("index"), 2 * capacity)
+        self.masks_file = open(self.path("masks"), "w+b")
+        self.masks_size = 0
+        self.masks_flushed = 0
+        self.log_file = open(self.path("transitions"), "w+b")
+        self.actions: List[LAction] = []
+        self.action_ids: Dict[LAction, int] = {}
+        self.size = 0
+        self.expanded = 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def add(self, mask: int) -> Tuple[int, bool]:
+        mask_fingerprint = fingerprint(mask)
+        slots = self.fingerprints.items
+        slot = mask_fingerprint & (self.slots - 1)
+        while slots[2 * slot] != 0:
+            if slots[2 * slot] == mask_fingerprint:
+                uid = slots[2 * slot + 1]
+                if self.mask(uid) == mask:
+                    return uid, False
+            slot = (slot + 1) & (self.slots - 1)
+
+        uid = self.size
+        data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+        self.masks_file.write(data)
+        if 2 * uid >= self.index.capacity:
+            self.index.resize(2 * self.index.capacity)
+        self.index.items[2 * uid] = self.masks_size
+        self.index.items[2 * uid + 1] = len(data)
+        self.masks_size += len(data)
+        slots[2 * slot] = mask_fingerprint
+        slots[2 * slot + 1] = uid
+        self.size += 1
+        if 2 * self.size > self.slots:
+            self.grow()
+        return uid, True
+
+    def grow(self) -> None:
+        """Doubles the fingerprint table, reinserting the fingerprints"""
+        old = self.fingerprints
+        self.slots *= 2
+        new = MappedArray(self.path("fingerprints.new"), 2 * self.slots)
+        old_slots, new_slots = old.items, new.items
+        for old_slot in range(old.capacity // 2):
+            mask_fingerprint = old_slots[2 * old_slot]
+            if mask_fingerprint == 0:
+                continue
+            slot = mask_fingerprint & (self.slots - 1)
+            while new_slots[2 * slot] != 0:
+                slot = (slot + 1) & (self.slots - 1)
+            new_slots[2 * slot] = mask_fingerprint
+            new_slots[2 * slot + 1] = old_slots[2 * old_slot + 1]
+        old.close()
+        os.replace(new.path, old.path)
+        new.path = old.path
+        self.fingerprints = new
+
+    def mask(self, uid: int) -> int:
+        offset = self.index.items[2 * uid]
+        length = self.index.items[2 * uid + 1]
+        if offset + length > self.masks_flushed:
+            self.masks_file.flush()
+            self.masks_flushed = self.masks_size
+        data = os.pread(self.masks_file.fileno(), length, offset)
+        return int.from_bytes(data, "little")
+
+    def action_id(self, action: LAction) -> int:
+        idx = self.action_ids.get(action)
+        if idx is None:
+            idx = len(self.actions)
+            self.action_ids[action] = idx
+            self.actions.append(action)
+        return idx
+
+    def add_transitions(self, uid: int, transitions: Dict[LAction, int]) -> None:
+        assert uid == self.expanded
+        self.expanded += 1
+        records = [LOG_RECORD.pack(uid, len(transitions))]
+        for action, next_uid in transitions.items():
+            records.append(LOG_RECORD.pack(self.action_id(action), next_uid))
+        self.log_file.write(b"".join(records))
+
+    def log_records(self) -> Iterator[Tuple[int, int]]:
+        self.log_file.flush()
+        with open(self.path("transitions"), "rb") as log:
+            while True:
+                chunk = log.read(LOG_RECORD.size * LOG_CHUNK)
+                if not chunk:
+                    break
+                yield from LOG_RECORD.iter_unpack(chunk)
+
+    def transitions(self) -> Iterator[Tuple[int, Dict[LAction, int]]]:
+        records = self.log_records()
+        for uid, num_transitions in records:
+            state_transitions = {}
+            for _ in range(num_transitions):
+                action_id, next_uid = next(records)
+                state_transitions[self.actions[action_id]] = next_uid
+            yield uid, state_transitions
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        self.fingerprints.close()
+        self.index.close()
+        self.masks_file.close()
+        self.log_file.close()
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SpillingStateStore(StateStore):
+    """Keeps the states in memory until there are more than max_states of
+    them, and then moves them to a DiskStateStore"""
+
+    def __init__(self, max_states: int, directory: Optional[str] = None) -> None:
+        self.max_states = max_states
+        self.directory = directory
+        self.store: StateStore = MemoryStateStore()
+        self.spilled = False
+
+    def add(self, mask: int) -> Tuple[int, bool]:
+        result = self.store.add(mask)
+        if not self.spilled and len(self.store) > self.max_states:
+            self.spill()
+        return result
+
+    def spill(self) -> None:
+        memory = self.store
+        disk = DiskStateStore(self.directory, capacity=2 * len(memory))
+        for mask in memory.masks:
+            disk.add(mask)
+        for uid, transitions in memory.transitions():
+            disk.add_transitions(uid, transitions)
+        self.store = disk
+        self.spilled = True
+
+    def mask(self, uid: int) -> int:
+        return self.store.mask(uid)
+
+    def add_transitions(self, uid: int, transitions: Dict[LAction, int]) -> None:
+        self.store.add_transitions(uid, transitions)
+
+    def transitions(self) -> Iterator[Tuple[int, Dict[LAction, int]]]:
+        return self.store.transitions()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def close(self) -> None:
+        self.store.close()
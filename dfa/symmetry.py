@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional, Tuple
+
+from dfa.checkpoint import CheckpointDFA, checkpoint_path
+from dfa.dfa import DFA
+from dfa.parallel_dfa import ParallelDFA
+from dfa.state_store import MemoryStateStore, SpillingStateStore
+from fingerprint.fingerprint import role_abstract_fingerprint
+from ltypes.laction import LAction
+from ltypes.lchoice import LChoice
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from ltypes.lrec_var import LRecVar
+from ltypes.lrecursion import LRecursion
+from ltypes.ltype import LType
+
+
+def rename_roles(ltype: LType, renaming: Dict[str, str]) -> LType:
+    """Builds a copy of a translated local type where every participant is
+    renamed according to renaming (roles not in it are kept)"""
+    if isinstance(ltype, LEnd):
+        return LEnd()
+    if isinstance(ltype, LMessagePass):
+        action = ltype.action
+        participant = renaming.get(action.participant, action.participant)
+        return LMessagePass(
+            LAction(participant, action.action_type, action.payload),
+            rename_roles(ltype.cont, renaming),
+        )
+    if isinstance(ltype, LRecVar):
+        return LRecVar(ltype.tvar)
+    if isinstance(ltype, LRecursion):
+        return LRecursion(ltype.tvar, rename_roles(ltype.ltype, renaming))
+    if isinstance(ltype, LChoice):
+        return LChoice([rename_roles(branch, renaming) for branch in ltype.branches])
+    raise TypeError(f"Cannot rename the roles of {type(ltype).__name__}")
+
+
+class SymmetricTranslator:
+    """Translates projections through their DFA, determinising only once the
+    local types which are equal up to a renaming of the roles (e.g. those of
+    symmetric workers). The other local types in the same class are obtained
+    by renaming the roles of the translated type. With more than one worker,
+    the DFAs are explored in parallel. With max_states, the states of the DFAs
+    with more states than that are moved to disk while they are explored. With
+    checkpoint_dir, the explorations are checkpointed to a file in it (named
+    after the hash of the local type) every checkpoint_interval seconds, and
+    with resume they continue from their last checkpoint. The parallel
+    explorations keep their states in memory and can't be checkpointed, so
+    max_states and checkpoint_dir can only be used with a single worker"""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_states: Optional[int] = None,
+        checkpoint_dir: Optional[str] = None,
+        resume: bool = False,
+        checkpoint_interval: float = 60.0,
+    ) -> None:
+        if workers > 1 and (max_states is not None or checkpoint_dir is not None):
+            raise ValueError(
+                "States can't be spilled or checkpointed with more than one worker"
+            )
+        self.translations: Dict[int, Tuple[List[str], LType]] = {}
+        self.workers = workers
+        self.max_states = max_states
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.checkpoint_interval = checkpoint_interval
+
+    def translate(self, role: str, ltype: LType) -> LType:
+        key, roles = role_abstract_fingerprint(ltype, role)
+        cached = self.translations.get(key)
+        if cached is None:
+            if self.workers > 1:
+                translation = ParallelDFA(ltype, self.workers).translate()
+            elif self.max_states is None and self.checkpoint_dir is None:
+                translation = DFA(ltype).translate()
+            else:
+                translation = self.translate_stored(ltype)
+            self.translations[key] = (roles, translation)
+            return translation
+
+        cached_roles, translation = cached
+        return rename_roles(translation, dict(zip(cached_roles, roles)))
+
+    def translate_stored(self, ltype: LType) -> LType:
+        if self.max_states is None:
+            store = MemoryStateStore()
+        else:
+            store = SpillingStateStore(self.max_states)
+        with store:
+            if self.checkpoint_dir is None:
+                return DFA(ltype, store).translate()
+            dfa = CheckpointDFA(
+                ltype,
+                checkpoint_path(self.checkpoint_dir, ltype),
+                self.checkpoint_interval,
+                self.resume,
+                store,
+            )
+            return dfa.translate()
@@ -0,0 +1,51 @@
+import pickle
+
+from benchmarks.parallel_scaling import blowup_source
+from dfa.checkpoint import CheckpointDFA
+from dfa.dfa import DFA
+from dfa.equivalence import DFATable
+from parser import parser as scr_parser
+
+
+def blowup_ltype(depth: int):
+    protocol = scr_parser.parse_source(blowup_source(depth))["Blowup"]
+    return protocol.gtype.project(set(protocol.roles))["r"].normalise()
+
+
+def record_offsets(path: str):
+    """Offsets of the end of the header and of each record of a checkpoint"""
+    offsets = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                pickle.load(f)
+            except EOFError:
+                return offsets
+            offsets.append(f.tell())
+
+
+def test_exploration_resumes_from_a_truncated_checkpoint(tmp_path):
+    ltype = blowup_ltype(3)
+    dfa = DFA(ltype)
+    expected = str(dfa.translate())
+    expected_table = DFATable.from_dfa(dfa).to_json()
+
+    path = str(tmp_path / "blowup.ckpt")
+    # Checkpoint after every state
+    CheckpointDFA(ltype, path, interval=0.0).explore()
+    offsets = record_offsets(path)
+    # Kill the exploration halfway, while it writes a record
+    start, end = offsets[len(offsets) // 2 - 1 : len(offsets) // 2 + 1]
+    with open(path, "r+b") as f:
+        f.truncate((start + end) // 2)
+
+    resumed = CheckpointDFA(ltype, path, interval=0.0, resume=True)
+    translated = str(resumed.translate())
+    assert 0 < resumed.resumed_from < len(resumed.transitions)
+    assert DFATable.from_dfa(resumed).to_json() == expected_table
+    assert translated == expected
+
+    # The torn record was dropped, so the checkpoint now holds the whole DFA
+    finished = CheckpointDFA(ltype, path, interval=0.0, resume=True)
+    assert str(finished.translate()) == expected
+    assert finished.resumed_from == len(finished.transitions)
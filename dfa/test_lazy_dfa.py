@@ -0,0 +1,65 @@
+from dfa.dfa import DFA
+from dfa.lazy_dfa import LazyDFA
+from parser import parser as scr_parser
+
+SOURCE = """
+global protocol Cycle(role a, role b) {
+    rec X { a->b:m; b->a:n; a->b:o; b->a:p; continue X }
+}
+"""
+
+
+def projection(role: str, source: str = SOURCE, proto_name: str = "Cycle"):
+    protocol = scr_parser.parse_source(source)[proto_name]
+    return protocol.gtype.project(set(protocol.roles))[role].normalise()
+
+
+def walk(lazy: LazyDFA, steps: int):
+    state = lazy.start
+    uids = [state.uid]
+    for _ in range(steps):
+        action = next(iter(LazyDFA.actions(state)))
+        state = lazy.next_state(state, action)
+        uids.append(state.uid)
+    return uids
+
+
+def test_evicted_states_keep_their_uids():
+    ltype = projection("a")
+    evicting = LazyDFA(ltype, max_states=1)
+    uids = walk(evicting, 12)
+    # Every state is evicted before it is reached again
+    assert evicting.num_built == len(uids)
+    assert uids == walk(LazyDFA(ltype), 12)
+    assert uids[5:9] == uids[1:5]
+
+
+def test_memory_is_bounded_by_max_states():
+    # 64 distinct labels (which can't have digits)
+    labels = [first + second for first in "abcdefgh" for second in "abcdefgh"]
+    chain = " ".join(f"a->b:{label};" for label in labels)
+    source = f"global protocol Chain(role a, role b) {{ {chain} end }}"
+    lazy = LazyDFA(projection("b", source, "Chain"), max_states=4)
+    uids = walk(lazy, 64)
+    assert len(set(uids)) == 65
+    assert len(lazy.states) == 4
+    # Nothing but the cache grows with the states visited (the subterm
+    # table grows with the size of the type)
+    assert all(
+        len(value) <= 4
+        for name, value in vars(lazy).items()
+        if isinstance(value, (dict, list, set))
+    )
+
+
+def test_accepts_the_traces_of_the_dfa():
+    ltype = projection("b")
+    dfa = DFA(ltype)
+    dfa.explore()
+    lazy = LazyDFA(ltype, max_states=2)
+    state, trace = dfa.start, []
+    for _ in range(6):
+        action, state = next(iter(dfa.transitions[state].items()))
+        trace.append(action)
+        assert lazy.accepts(trace)
+    assert not lazy.accepts(trace + trace[:1])
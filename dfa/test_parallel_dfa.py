@@ -0,0 +1,36 @@
+import os
+
+from dfa.dfa import DFA
+from dfa.equivalence import DFATable
+from dfa.parallel_dfa import ParallelDFA
+from parser import parser as scr_parser
+
+EXAMPLES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples",
+    "examples.scr",
+)
+
+
+def explore(dfa: DFA):
+    try:
+        dfa.explore()
+    except Exception as e:
+        return type(e), str(e)
+    return DFATable.from_dfa(dfa).to_json()
+
+
+def test_parallel_explorations_are_sequential_ones():
+    explored = 0
+    for protocol in scr_parser.parse_file(EXAMPLES).values():
+        try:
+            projections = protocol.gtype.project(set(protocol.roles))
+            ltypes = {role: projections[role].normalise() for role in protocol.roles}
+        except Exception:
+            continue
+        for ltype in ltypes.values():
+            # Every frontier is sent to the workers, however small
+            parallel = ParallelDFA(ltype, 2, min_parallel_frontier=1)
+            assert explore(parallel) == explore(DFA(ltype))
+            explored += 1
+    assert explored > 0
@@ -24,3 +24,19 @@ class UnnormalisedGlobalType(Exception):
     exception is thrown"""
 
     pass
+
+
+class InvalidProtocolCall(Exception):
+    """When a sub-protocol is invoked with `do` but there is no protocol with
+    that name, or it is given a different number of roles than it declares,
+    the same role twice, or a role the calling protocol doesn't declare"""
+
+    pass
+
+
+class ExplorationCancelled(BaseException):
+    """When an exploration is stopped because its request was cancelled or
+    timed out. It isn't an Exception, so it is not reported as the projection
+    error of a role but stops the whole request"""
+
+    pass
@@ -0,0 +1,205 @@
+from hashlib import blake2b
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from gtypes.gchoice import GChoice, GIDChoice
+from gtypes.gend import GEnd
+from gtypes.gmessage_pass import GMessagePass
+from gtypes.grec_var import GRecVar
+from gtypes.grecursion import GRecursion
+from ltypes.laction import LAction
+from ltypes.lchoice import LIDChoice, LUnmergedChoice, LChoice
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from ltypes.lrec_var import LRecVar
+from ltypes.lrecursion import LRecursion
+from symbols.symbols import bound_indices, mask_roles
+
+DIGEST_SIZE = 16
+
+# Placeholder used for every role name when computing the shape of a type
+ANY_ROLE = "*"
+
+
+def _digest(*parts: bytes) -> bytes:
+    h = blake2b(digest_size=DIGEST_SIZE)
+    for part in parts:
+        # Length-prefix every part so that the encoding is unambiguous
+        h.update(len(part).to_bytes(4, "little"))
+        h.update(part)
+    return h.digest()
+
+
+def _choice_digest(kind: bytes, branch_digests: List[bytes]) -> bytes:
+    # Branches are sorted, so the fingerprint doesn't depend on their order
+    return _digest(kind, *sorted(branch_digests))
+
+
+def _tvar_digest(tvar: str, binders: Sequence[str]) -> bytes:
+    # Bound variables are encoded by their de Bruijn index, so the fingerprint
+    # doesn't depend on the names chosen for them
+    for idx in range(len(binders) - 1, -1, -1):
+        if binders[idx] == tvar:
+            return _digest(b"var", (len(binders) - 1 - idx).to_bytes(4, "little"))
+    return _digest(b"free", tvar.encode())
+
+
+class _Encoder:
+    """Computes the canonical digest of a type, encoding role names through
+    role_name. By default role names are kept as they are. Digests are
+    memoised by node and indices of its bound variables (as memoise_binders
+    does for closed hashes), so subterms shared by several parts of a type are
+    only encoded once"""
+
+    def __init__(self) -> None:
+        self.memo: Dict[Tuple[int, Tuple[int, ...]], bytes] = {}
+
+    def role_name(self, role: str) -> str:
+        return role
+
+    def roles(self, roles) -> bytes:
+        return ",".join(sorted(self.role_name(role) for role in roles)).encode()
+
+    def action(self, action) -> bytes:
+        if isinstance(action, LAction):
+            participants = [action.participant]
+            label = f"{action.action_type}{action.payload}"
+        else:
+            participants = action.participants
+            label = f":{action.payload}"
+        roles = "->".join(self.role_name(role) for role in participants)
+        return f"{roles}{label}".encode()
+
+    def digest(self, t, binders: Tuple[str, ...]) -> bytes:
+        key = (id(t), bound_indices(t.free_tvars, binders))
+        t_digest = self.memo.get(key)
+        if t_digest is None:
+            t_digest = self._digest(t, binders)
+            self.memo[key] = t_digest
+        return t_digest
+
+    def _digest(self, t, binders: Tuple[str, ...]) -> bytes:
+        if isinstance(t, (LEnd, GEnd)):
+            return _digest(b"end")
+        if isinstance(t, (LMessagePass, GMessagePass)):
+            return _digest(b"msg", self.action(t.action), self.digest(t.cont, binders))
+        if isinstance(t, LRecursion):
+            return _digest(b"rec", self.digest(t.ltype, binders + (t.tvar,)))
+        if isinstance(t, GRecursion):
+            return _digest(b"rec", self.digest(t.gtype, binders + (t.tvar,)))
+        if isinstance(t, (LRecVar, GRecVar)):
+            return _tvar_digest(t.tvar, binders)
+        if isinstance(t, LIDChoice):
+            return _choice_digest(
+                b"idchoice:" + self.role_name(t.role).encode(),
+                [
+                    _digest(self.roles(mask_roles(roles)), self.digest(branch, binders))
+                    for branch, roles in zip(t.branches, t.decision_roles)
+                ],
+            )
+        if isinstance(t, LUnmergedChoice):
+            return _choice_digest(
+                b"unmerged", [self.digest(choice, binders) for choice in t.choices]
+            )
+        if isinstance(t, (LChoice, GChoice, GIDChoice)):
+            kind = type(t).__name__.encode()
+            return _choice_digest(
+                kind, [self.digest(branch, binders) for branch in t.branches]
+            )
+        raise TypeError(f"Cannot fingerprint {type(t).__name__}")
+
+
+class _ShapeEncoder(_Encoder):
+    """Encodes every role name with the same placeholder. The digests of the
+    subterms are kept, so that choice branches can be visited in an order
+    which doesn't depend on role names"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.digests: Dict[int, bytes] = {}
+
+    def role_name(self, role: str) -> str:
+        return ANY_ROLE
+
+    def _digest(self, t, binders: Tuple[str, ...]) -> bytes:
+        t_digest = super()._digest(t, binders)
+        self.digests[id(t)] = t_digest
+        return t_digest
+
+
+class _NumberedRolesEncoder(_Encoder):
+    """Encodes role names by the order in which they are first found when
+    traversing the type, so types which are equal up to a renaming of roles
+    have the same digest. A subterm which has already been traversed can't
+    number any new role, so every node is traversed once"""
+
+    def __init__(self, ltype, role: str) -> None:
+        super().__init__()
+        self.numbering: Dict[str, int] = {}
+        self.visited: Set[int] = set()
+        self.shapes = _ShapeEncoder()
+        self.shapes.digest(ltype, ())
+        self.number(role)
+        self._number_roles(ltype)
+
+    def role_name(self, role: str) -> str:
+        return str(self.numbering[role])
+
+    def number(self, role: str) -> None:
+        if role not in self.numbering:
+            self.numbering[role] = len(self.numbering)
+
+    def _sorted_branches(self, branches) -> List[int]:
+        return sorted(
+            range(len(branches)), key=lambda i: self.shapes.digests[id(branches[i])]
+        )
+
+    def _number_roles(self, t) -> None:
+        if id(t) in self.visited:
+            return
+        self.visited.add(id(t))
+        if isinstance(t, LMessagePass):
+            self.number(t.action.participant)
+            self._number_roles(t.cont)
+        elif isinstance(t, LRecursion):
+            self._number_roles(t.ltype)
+        elif isinstance(t, LIDChoice):
+            self.number(t.role)
+            for idx in self._sorted_branches(t.branches):
+                # Decision roles which haven't been found yet are numbered by
+                # name, which at worst misses some renamings
+                for role in sorted(mask_roles(t.decision_roles[idx])):
+                    self.number(role)
+                self._number_roles(t.branches[idx])
+        elif isinstance(t, LUnmergedChoice):
+            for idx in self._sorted_branches(t.choices):
+                self._number_roles(t.choices[idx])
+        elif isinstance(t, LChoice):
+            for idx in self._sorted_branches(t.branches):
+                self._number_roles(t.branches[idx])
+
+
+def type_digest(t, binders: Sequence[str]) -> bytes:
+    """Canonical digest of a global or local type: alpha-equivalent types, and
+    types whose choices only differ in the order of their branches, have the
+    same digest"""
+    return _Encoder().digest(t, tuple(binders))
+
+
+def fingerprint(t) -> int:
+    """Deterministic 128-bit fingerprint of a global or local type, which is
+    the same across processes and machines and can be used as a cache key"""
+    return int.from_bytes(type_digest(t, ()), "little")
+
+
+def role_abstract_fingerprint(ltype, role: str) -> Tuple[int, List[str]]:
+    """Fingerprint of the projection of a type onto role, where role names are
+    abstracted by the order in which they first occur. Returns the fingerprint
+    together with the roles in that order (role itself first): two local types
+    with the same fingerprint are equal once the roles at the same positions
+    are renamed into each other"""
+    encoder = _NumberedRolesEncoder(ltype, role)
+    digest = encoder.digest(ltype, ())
+    roles: List[Optional[str]] = [None] * len(encoder.numbering)
+    for name, idx in encoder.numbering.items():
+        roles[idx] = name
+    return int.from_bytes(digest, "little"), roles
@@ -0,0 +1,44 @@
+from fingerprint.fingerprint import fingerprint, role_abstract_fingerprint
+from ltypes.laction import ActionType, LAction
+from ltypes.lchoice import LChoice
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from parser import parser as scr_parser
+
+SOURCE = """
+global protocol Loop(role a, role b) {
+    rec X { choice { a->b:m; continue X } or { a->b:n; end } }
+}
+
+global protocol Renamed(role c, role d) {
+    rec Y { choice { c->d:n; end } or { c->d:m; continue Y } }
+}
+"""
+
+
+def projections(proto_name: str):
+    protocol = scr_parser.parse_source(SOURCE)[proto_name]
+    return protocol.gtype.project(set(protocol.roles))
+
+
+def test_equal_up_to_binders_and_branch_order():
+    loop, renamed = projections("Loop"), projections("Renamed")
+    assert fingerprint(loop["a"]) != fingerprint(renamed["c"])
+    key_a, roles_a = role_abstract_fingerprint(loop["a"], "a")
+    key_c, roles_c = role_abstract_fingerprint(renamed["c"], "c")
+    assert key_a == key_c
+    assert roles_a == ["a", "b"] and roles_c == ["c", "d"]
+    assert role_abstract_fingerprint(loop["b"], "b")[0] != key_a
+
+
+def test_shared_subterms_are_encoded_once():
+    # A choice of two copies of the same subterm, nested 64 times: traversing
+    # every path would never finish
+    ltype = LEnd()
+    for _ in range(64):
+        action = LAction("b", ActionType.send, "m")
+        ltype = LChoice([LMessagePass(action, ltype), LMessagePass(action, ltype)])
+    key, roles = role_abstract_fingerprint(ltype, "a")
+    assert roles == ["a", "b"]
+    assert key == role_abstract_fingerprint(ltype, "a")[0]
+    assert fingerprint(ltype) == fingerprint(ltype)
@@ -1,7 +1,7 @@
 import string
 from typing import List
 
-from gtypes import HASH_SIZE
+from symbols.symbols import stable_hash, symbol
 from ltypes.laction import LAction, ActionType
 
 
@@ -10,6 +10,16 @@ class GAction:
         assert len(set(participants)) == 2
         self.participants = participants
         self.payload = payload
+        self.participant_ids = [symbol(participant) for participant in participants]
+        self.participant_mask = (1 << self.participant_ids[0]) | (
+            1 << self.participant_ids[1]
+        )
+        self.key = (
+            (symbol(payload) << 64)
+            | (self.participant_ids[0] << 32)
+            | self.participant_ids[1]
+        )
+        self.hash_code = stable_hash(str(self))
 
     def get_participants(self):
         return self.participants
@@ -24,10 +34,13 @@ class GAction:
     def __eq__(self, o: object) -> bool:
         if not isinstance(o, GAction):
             return False
-        return self.__hash__() == o.__hash__()
+        return self.key == o.key
 
     def __hash__(self) -> int:
-        return str(self).__hash__() % HASH_SIZE
+        return self.hash_code
+
+    def __reduce__(self):
+        return GAction, (self.participants, self.payload)
 
     def __str__(self) -> str:
         return f'{"->".join(self.participants)}:{self.payload}'
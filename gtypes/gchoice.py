@@ -1,23 +1,41 @@
-from typing import Dict, Set, List
+from typing import Any, Dict, Set, List, TextIO
 
 import gtypes
+from counters.counters import COUNTS, HASH
 from gtypes.gaction import GAction
 from gtypes.gtype import GType
 
 from ltypes.lchoice import LUnmergedChoice, LIDChoice
 from ltypes.ltype import LType
+from symbols.symbols import (
+    EMPTY_ENV,
+    memoise_args,
+    memoise_empty_env,
+    union_free_binders,
+    union_free_tvars,
+)
 from unionfind.unionfind import UnionFind
 
 
-def _hash_list(elem_list, tvars):
-    hashes = tuple(elem.hash(tvars) for elem in elem_list)
-    return sum(hashes) % gtypes.HASH_SIZE
+def _hash_list(elem_list):
+    return sum(elem.structure_hash() for elem in elem_list) % gtypes.HASH_SIZE
+
+
+def render_choice(out: TextIO, indent: str, branches: List[GType]) -> None:
+    new_indent = indent + "\t"
+    out.write(f"{indent}choice {{\n")
+    for i, gtype in enumerate(branches):
+        if i > 0:
+            out.write(f"\n{indent}}} or {{\n")
+        gtype.render(out, new_indent)
+    out.write(f"\n{indent}}}\n")
 
 
 class GChoice(GType):
     def __init__(self, choices: List[GType]) -> None:
         super().__init__()
         self.branches = choices
+        self.free_tvars = union_free_tvars(choices)
 
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         id_choices = GChoice._identify_independent_choices(self.branches)
@@ -27,7 +45,8 @@ class GChoice(GType):
             for role in roles
         }
 
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[GAction]:
         return set(
             action for gtype in self.branches for action in gtype.first_actions(tvars)
         )
@@ -36,41 +55,38 @@ class GChoice(GType):
         for id_choice in self.branches:
             id_choice.set_rec_gtype(tvar, gtype)
 
-    def hash(self, tvars: set) -> int:
-        return _hash_list(self.branches, tvars)
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return _hash_list(self.branches)
+
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return union_free_binders(self.branches)
 
     @staticmethod
     def _identify_independent_choices(choices: List[GType]):
         ufind = UnionFind()
         for gtype in choices:
-            actions = tuple(gtype.first_actions(set()))
+            actions = tuple(gtype.first_actions(EMPTY_ENV))
             assert len(actions) == 1
-            ufind.add(actions[0].get_participants(), gtype)
+            ufind.add(actions[0].participant_ids, gtype)
         return [GIDChoice(branches) for branches in ufind.get_subsets()]
 
-    def to_string(self, indent) -> str:
-        new_indent = indent + "\t"
-        ltypes = [gtype.to_string(new_indent) for gtype in self.branches]
-        new_line = "\n"
-        return f"{indent}choice {{\n{f'{new_line}{indent}}} or {{{new_line}'.join(ltypes)}\n{indent}}}\n"
+    def render(self, out: TextIO, indent: str) -> None:
+        render_choice(out, indent, self.branches)
 
     def normalise(self) -> GType:
         self.branches = [gtype.normalise() for gtype in self.branches]
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        for id_choice in self.branches:
-            if id_choice.has_rec_var(tvar):
-                return True
-        return False
-
     def __eq__(self, other):
         if not isinstance(other, GChoice):
             return False
-        return self.hash(set()) == other.hash(set())
+        return self.hash() == other.hash()
 
     def __hash__(self):
-        return self.hash(set())
+        return self.hash()
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -79,9 +95,16 @@ class GChoice(GType):
 class GIDChoice(GType):
     def __init__(self, branches: List[GType]):
         self.branches = branches
+        self.free_tvars = union_free_tvars(branches)
+
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return _hash_list(self.branches)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return _hash_list(self.branches, tvars)
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return union_free_binders(self.branches)
 
     def project(self, roles: Set[str]) -> Dict[str, LIDChoice]:
         branch_projections = [gtype.project(roles) for gtype in self.branches]
@@ -90,8 +113,8 @@ class GIDChoice(GType):
                 role,
                 [proj[role] for i, proj in enumerate(branch_projections)],
                 [
-                    # Extract participants of first action and convert them to a set
-                    set(tuple(gtype.first_actions(set()))[0].get_participants())
+                    # Bitmask of the participants of the first action
+                    tuple(gtype.first_actions(EMPTY_ENV))[0].participant_mask
                     for gtype in self.branches
                 ],
             )
@@ -102,34 +125,26 @@ class GIDChoice(GType):
         for branch in self.branches:
             branch.set_rec_gtype(tvar, gtype)
 
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[GAction]:
         return set(
             action for gtype in self.branches for action in gtype.first_actions(tvars)
         )
 
-    def to_string(self, indent: str) -> str:
-        new_indent = indent + "\t"
-        ltypes = [ltype.to_string(new_indent) for ltype in self.branches]
-        new_line = "\n"
-        return f"{indent}choice {{\n{f'{new_line}{indent}}} or {{{new_line}'.join(ltypes)}\n{indent}}}\n"
+    def render(self, out: TextIO, indent: str) -> None:
+        render_choice(out, indent, self.branches)
 
     def normalise(self) -> GType:
         self.branches = [gtype.normalise() for gtype in self.branches]
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        for gtype in self.branches:
-            if gtype.has_rec_var(tvar):
-                return True
-        return False
-
     def __eq__(self, other: object):
         if not isinstance(other, GIDChoice):
             return False
-        return self.hash(set()) == other.hash(set())
+        return self.hash() == other.hash()
 
     def __hash__(self):
-        return self.hash(set())
+        return self.hash()
 
     def __str__(self) -> str:
         return super().__str__()
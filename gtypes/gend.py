@@ -1,32 +1,34 @@
-from typing import Set, Dict
+from typing import Any, Set, Dict, TextIO
 
+from counters.counters import COUNTS, HASH
 from gtypes.gtype import GType
 from ltypes.lend import LEnd
 from ltypes.ltype import LType
 
 
 class GEnd(GType):
-    def first_actions(self, tvars: Set[str]) -> Set[str]:
+    def first_actions(self, tvars: int) -> Set[str]:
         return set()
 
     def set_rec_gtype(self, tvar: str, gtype: GType) -> None:
         pass
 
-    def hash(self, tvars: Set[str]) -> int:
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
         return 1
 
+    def free_binders(self) -> Dict[int, Any]:
+        return {}
+
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         return {role: LEnd() for role in roles}
 
-    def to_string(self, indent: str) -> str:
-        return f"{indent}end"
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}end")
 
     def normalise(self):
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return False
-
     def __str__(self) -> str:
         return self.to_string("")
 
@@ -1,10 +1,12 @@
-from typing import Set, Dict
+from typing import Any, Set, Dict, TextIO
 
 import gtypes
+from counters.counters import COUNTS, HASH
 from gtypes.gaction import GAction
 from gtypes.gtype import GType
 from ltypes.ltype import LType
 from ltypes.lmessage_pass import LMessagePass
+from symbols.symbols import memoise_args, mix
 
 
 class GMessagePass(GType):
@@ -12,6 +14,7 @@ class GMessagePass(GType):
         super().__init__()
         self.action = action
         self.cont = cont
+        self.free_tvars = cont.free_tvars
 
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         projections = self.cont.project(roles)
@@ -21,27 +24,31 @@ class GMessagePass(GType):
                 projections[role] = LMessagePass(local_action, projections[role])
         return projections
 
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
+    def first_actions(self, tvars: int) -> Set[GAction]:
         return {self.action}
 
     def set_rec_gtype(self, tvar: str, gtype: GType) -> None:
         self.cont.set_rec_gtype(tvar, gtype)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return (
-            self.action.__hash__() * gtypes.PRIME + self.cont.hash(tvars)
-        ) % gtypes.HASH_SIZE
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return mix(
+            (self.action.__hash__() * gtypes.PRIME + self.cont.structure_hash())
+            % gtypes.HASH_SIZE
+        )
 
-    def to_string(self, indent: str) -> str:
-        return f"{indent}{self.action};\n{self.cont.to_string(indent)}"
+    def free_binders(self) -> Dict[int, Any]:
+        return self.cont.free_binders()
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}{self.action};\n")
+        self.cont.render(out, indent)
 
     def normalise(self):
         self.cont: GType = self.cont.normalise()
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.cont.has_rec_var(tvar)
-
     def __str__(self) -> str:
         return self.to_string("")
 
@@ -51,4 +58,4 @@ class GMessagePass(GType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.hash(set())
+        return self.hash()
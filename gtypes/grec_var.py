@@ -1,12 +1,12 @@
-from typing import Set, Dict
+from typing import Any, Set, Dict, TextIO
 
-import gtypes
-from gtypes import HASH_SIZE
+from counters.counters import COUNTS, HASH
 from gtypes.gend import GEnd
 from gtypes.gaction import GAction
 from gtypes.gtype import GType
 from ltypes.ltype import LType
 from ltypes.lrec_var import LRecVar
+from symbols.symbols import memoise_empty_env, stable_hash, tvar_mask
 
 
 class GRecVar(GType):
@@ -14,6 +14,8 @@ class GRecVar(GType):
         super().__init__()
         self.tvar = var_name
         self.gtype: GType = GEnd()
+        self.tvar_mask = tvar_mask(var_name)
+        self.free_tvars = self.tvar_mask
 
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         return {role: LRecVar(self.tvar) for role in roles}
@@ -22,28 +24,25 @@ class GRecVar(GType):
         if tvar == self.tvar:
             self.gtype = gtype
 
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
-        if self.tvar in tvars:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[GAction]:
+        if tvars & self.tvar_mask:
             return set()
-        return self.gtype.first_actions(tvars.union({self.tvar}))
+        return self.gtype.first_actions(tvars | self.tvar_mask)
 
-    def hash(self, tvars: Set[str]) -> int:
-        if self.tvar in tvars:
-            return self.tvar.__hash__() % HASH_SIZE
-        return (
-            self.tvar.__hash__() * gtypes.PRIME
-            + self.gtype.hash(tvars.union({self.tvar}))
-        ) % HASH_SIZE
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return stable_hash(self.tvar)
 
-    def to_string(self, indent: str) -> str:
-        return f"{indent}continue {self.tvar}"
+    def free_binders(self) -> Dict[int, Any]:
+        return {self.tvar_mask: self.gtype}
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}continue {self.tvar}")
 
     def normalise(self) -> GType:
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.tvar == tvar
-
     def __str__(self) -> str:
         return self.to_string("")
 
@@ -53,4 +52,4 @@ class GRecVar(GType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.hash(set())
+        return self.hash()
@@ -1,10 +1,18 @@
-from typing import Set, Dict
+from typing import Any, Set, Dict, TextIO
 
 import gtypes
+from counters.counters import COUNTS, HASH
 from gtypes.gaction import GAction
 from gtypes.gtype import GType
 from ltypes.lrecursion import LRecursion
 from ltypes.ltype import LType
+from symbols.symbols import (
+    memoise_empty_env,
+    memoise_args,
+    mix,
+    stable_hash,
+    tvar_mask,
+)
 
 
 class GRecursion(GType):
@@ -13,6 +21,7 @@ class GRecursion(GType):
         self.tvar = tvar
         self.gtype = gtype
         self.gtype.set_rec_gtype(self.tvar, self)
+        self.free_tvars = gtype.free_tvars & ~tvar_mask(tvar)
 
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         projections = self.gtype.project(roles)
@@ -26,17 +35,31 @@ class GRecursion(GType):
         assert tvar != self.tvar
         self.gtype.set_rec_gtype(tvar, gtype)
 
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[GAction]:
         return self.gtype.first_actions(tvars)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return (
-            self.tvar.__hash__() * gtypes.PRIME + self.gtype.hash(tvars)
-        ) % gtypes.HASH_SIZE
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return mix(
+            (stable_hash(self.tvar) * gtypes.PRIME + self.gtype.structure_hash())
+            % gtypes.HASH_SIZE
+        )
 
-    def to_string(self, indent: str) -> str:
-        next_indent = indent + "\t"
-        return f"{indent}rec {self.tvar} {{\n{self.gtype.to_string(next_indent)}\n{indent}}}"
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        tvar = tvar_mask(self.tvar)
+        return {
+            mask: binder
+            for mask, binder in self.gtype.free_binders().items()
+            if mask != tvar
+        }
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}rec {self.tvar} {{\n")
+        self.gtype.render(out, indent + "\t")
+        out.write(f"\n{indent}}}")
 
     def normalise(self) -> GType:
         self.gtype = self.gtype.normalise()
@@ -44,9 +67,6 @@ class GRecursion(GType):
             return self
         return self.gtype
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.gtype.has_rec_var(tvar)
-
     def __str__(self) -> str:
         return self.to_string("")
 
@@ -56,4 +76,4 @@ class GRecursion(GType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.gtype.hash(set())
+        return self.gtype.hash()
@@ -0,0 +1,63 @@
+from threading import Lock
+from typing import Dict, FrozenSet, List, Set, TextIO
+
+from gtypes.grecursion import GRecursion
+from gtypes.gtype import GType
+from ltypes.ltype import LType
+from symbols.symbols import bind_once, tvar_mask
+
+
+class GSubprotocol(GRecursion):
+    """Instantiation of a sub-protocol with some role arguments. A single
+    instance is built for each sub-protocol, role mapping and context, and is
+    shared by every `do` which refers to it, so the instance is only
+    normalised and projected once. Recursive invocations of the sub-protocol
+    are type variables bound by the instance"""
+
+    def __init__(self, name: str, roles: List[str], gtype: GType) -> None:
+        super().__init__(GSubprotocol.instance_name(name, roles), gtype)
+        self.name = name
+        self.roles = roles
+        self.normalised = False
+        self.projections: Dict[FrozenSet[str], Dict[str, LType]] = {}
+        # The free variables of the shared projections are bound when they
+        # are computed, so only one thread may compute them. An instance only
+        # projects the instances nested in it, so the locks are always taken
+        # from the outside in
+        self.lock = Lock()
+
+    @staticmethod
+    def instance_name(name: str, roles: List[str]) -> str:
+        return f"{name}({', '.join(roles)})"
+
+    def project(self, roles: Set[str]) -> Dict[str, LType]:
+        key = frozenset(roles)
+        with self.lock:
+            projections = self.projections.get(key)
+            if projections is None:
+                projections = super().project(roles)
+                self.projections[key] = projections
+        # The callers add their own actions to the dictionary they get back
+        return dict(projections)
+
+    @bind_once
+    def set_rec_gtype(self, tvar: str, gtype: GType) -> None:
+        assert tvar != self.tvar
+        # The instance is shared, so only visit it when it can contain tvar,
+        # and only once per binder (see bind_once)
+        if self.free_tvars & tvar_mask(tvar):
+            self.gtype.set_rec_gtype(tvar, gtype)
+
+    def render(self, out: TextIO, indent: str) -> None:
+        if self.gtype.has_rec_var(self.tvar):
+            super().render(out, indent)
+        else:
+            self.gtype.render(out, indent)
+
+    def normalise(self) -> GType:
+        # The instance is kept even if it isn't recursive, so the places where
+        # it is used keep sharing its projections
+        if not self.normalised:
+            self.gtype = self.gtype.normalise()
+            self.normalised = True
+        return self
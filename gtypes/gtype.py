@@ -1,17 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Set
+from io import StringIO
+from typing import Any, Dict, Set, TextIO
 
+import gtypes
+from counters.counters import COUNTS, HASH
 from gtypes.gaction import GAction
 from ltypes.ltype import LType
+from symbols.symbols import EMPTY_ENV, memoise_args, mix, tvar_mask
 
 
 class GType(ABC):
+    # Bitmask of the type variables which occur free in the type, computed
+    # bottom-up when the type is built
+    free_tvars = EMPTY_ENV
+
     @abstractmethod
     def project(self, roles: Set[str]) -> Dict[str, LType]:
         pass
 
     @abstractmethod
-    def first_actions(self, tvars: Set[str]) -> Set[GAction]:
+    def first_actions(self, tvars: int) -> Set[GAction]:
         pass
 
     @abstractmethod
@@ -19,17 +27,44 @@ class GType(ABC):
         pass
 
     @abstractmethod
-    def hash(self, tvars: Set[str]) -> int:
+    def structure_hash(self) -> int:
+        """Hash of the structure of the type, with its type variables hashed by
+        name. It is computed once for every node, without unfolding any type
+        variable"""
         pass
 
     @abstractmethod
-    def to_string(self, indent: str) -> str:
+    def free_binders(self) -> Dict[int, Any]:
+        """Binder of each free variable of the type, by the mask of the
+        variable. The result is shared, so callers must not mutate it"""
         pass
 
+    @memoise_args
+    def hash(self) -> int:
+        """Hash of the structure of the type combined with the hashes of the
+        binders of its free variables (see LType.hash)"""
+        COUNTS[HASH] += 1
+        binders_hash = 0
+        if self.free_tvars:
+            binders_hash = sum(b.hash() for b in self.free_binders().values())
+        return mix(
+            (self.structure_hash() * gtypes.PRIME + binders_hash) % gtypes.HASH_SIZE
+        )
+
     @abstractmethod
-    def normalise(self):
+    def render(self, out: TextIO, indent: str) -> None:
+        """Writes the textual representation of the type into out in a single
+        pass, without building the strings of the subterms"""
         pass
 
+    def to_string(self, indent: str) -> str:
+        out = StringIO()
+        self.render(out, indent)
+        return out.getvalue()
+
     @abstractmethod
-    def has_rec_var(self, tvar: str) -> bool:
+    def normalise(self):
         pass
+
+    def has_rec_var(self, tvar: str) -> bool:
+        return (self.free_tvars & tvar_mask(tvar)) != EMPTY_ENV
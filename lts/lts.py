@@ -0,0 +1,201 @@
+from typing import Dict, List, Set, Tuple
+
+from dfa.dfa import mask_bits
+from dfa.equivalence import DFATable
+from gtypes.gaction import GAction
+from gtypes.gchoice import GChoice, GIDChoice
+from gtypes.gmessage_pass import GMessagePass
+from gtypes.grec_var import GRecVar
+from gtypes.grecursion import GRecursion
+from gtypes.gtype import GType
+from ltypes.laction import LAction
+from symbols.symbols import EMPTY_ENV, symbol
+
+
+class GlobalLTS:
+    """Labelled transition system of a global type. Its states are the
+    subterms of the type reached by its actions, where recursions and the
+    variables bound by them are unfolded, so each state is explored once
+    however many roles are projected from it"""
+
+    def __init__(self, gtype: GType) -> None:
+        self.states: List[GType] = []
+        self.transitions: List[List[Tuple[GAction, int]]] = []
+        # id of the subterm of a state -> state
+        self.state_ids: Dict[int, int] = {}
+        self.start = self.state(gtype)
+        idx = 0
+        while idx < len(self.states):
+            self.transitions.append(
+                [
+                    (action, self.state(cont))
+                    for action, cont in GlobalLTS.steps(self.states[idx], EMPTY_ENV)
+                ]
+            )
+            idx += 1
+
+    @staticmethod
+    def unfold(gtype: GType) -> GType:
+        """Subterm which takes the steps of gtype: the body of the recursions
+        and the binders of the variables are followed until a message, a
+        choice or the end of the protocol is reached"""
+        seen: Set[int] = set()
+        while id(gtype) not in seen:
+            seen.add(id(gtype))
+            if isinstance(gtype, GRecursion):
+                gtype = gtype.gtype
+            elif isinstance(gtype, GRecVar) and isinstance(gtype.gtype, GRecursion):
+                gtype = gtype.gtype
+            else:
+                break
+        return gtype
+
+    def state(self, gtype: GType) -> int:
+        gtype = GlobalLTS.unfold(gtype)
+        idx = self.state_ids.get(id(gtype))
+        if idx is None:
+            idx = len(self.states)
+            self.state_ids[id(gtype)] = idx
+            self.states.append(gtype)
+        return idx
+
+    @staticmethod
+    def steps(gtype: GType, tvars: int) -> List[Tuple[GAction, GType]]:
+        if isinstance(gtype, GMessagePass):
+            return [(gtype.action, gtype.cont)]
+        if isinstance(gtype, (GChoice, GIDChoice)):
+            return [
+                step for branch in gtype.branches for step in GlobalLTS.steps(branch, tvars)
+            ]
+        if isinstance(gtype, GRecursion):
+            return GlobalLTS.steps(gtype.gtype, tvars)
+        if isinstance(gtype, GRecVar):
+            # Unguarded recursions can't take any step
+            if tvars & gtype.tvar_mask:
+                return []
+            return GlobalLTS.steps(gtype.gtype, tvars | gtype.tvar_mask)
+        return []
+
+    def role_dfa(self, role: str) -> DFATable:
+        """DFA of the traces of the role, where the actions of the other roles
+        are hidden (epsilon-closure and subset construction over the states of
+        the global LTS, which are shared by all the roles)"""
+        # Global state -> [(local action, next state)] and states reached
+        # through hidden actions
+        role_bit = 1 << symbol(role)
+        visible: List[List[Tuple[LAction, int]]] = []
+        hidden: List[List[int]] = []
+        for transitions in self.transitions:
+            state_visible = []
+            state_hidden = []
+            for action, next_state in transitions:
+                if action.participant_mask & role_bit:
+                    state_visible.append((action.project(role), next_state))
+                else:
+                    state_hidden.append(next_state)
+            visible.append(state_visible)
+            hidden.append(state_hidden)
+        closures = HiddenClosures(hidden)
+
+        def closure(mask: int) -> int:
+            result = 0
+            for state in mask_bits(mask):
+                result |= closures.closure(state)
+            return result
+
+        start = closure(1 << self.start)
+        state_ids = {start: 0}
+        masks = [start]
+        transitions: Dict[int, Dict[LAction, int]] = {}
+        idx = 0
+        while idx < len(masks):
+            next_masks: Dict[LAction, int] = {}
+            for state in mask_bits(masks[idx]):
+                for action, next_state in visible[state]:
+                    next_masks[action] = next_masks.get(action, 0) | (1 << next_state)
+            state_transitions = {}
+            for action, next_mask in next_masks.items():
+                next_mask = closure(next_mask)
+                next_id = state_ids.get(next_mask)
+                if next_id is None:
+                    next_id = len(masks)
+                    state_ids[next_mask] = next_id
+                    masks.append(next_mask)
+                state_transitions[action] = next_id
+            transitions[idx] = state_transitions
+            idx += 1
+        return DFATable(0, transitions)
+
+    def role_dfas(self, roles: List[str]) -> Dict[str, DFATable]:
+        return {role: self.role_dfa(role) for role in roles}
+
+
+class HiddenClosures:
+    """Bitmasks of the states reachable from each state through hidden actions,
+    computed on demand. The strongly connected components of the hidden
+    transitions are found with Tarjan's algorithm, which completes all the
+    components reachable from a component before it, so the closure of a
+    component is the union of the closures of its successors"""
+
+    def __init__(self, hidden: List[List[int]]) -> None:
+        self.hidden = hidden
+        self.index = [-1] * len(hidden)
+        self.low = [0] * len(hidden)
+        self.on_stack = [False] * len(hidden)
+        self.stack: List[int] = []
+        self.closures: List[int] = [0] * len(hidden)
+        self.counter = 0
+
+    def closure(self, state: int) -> int:
+        if self.index[state] == -1:
+            self.search(state)
+        return self.closures[state]
+
+    def visit(self, state: int) -> None:
+        self.index[state] = self.low[state] = self.counter
+        self.counter += 1
+        self.stack.append(state)
+        self.on_stack[state] = True
+
+    def search(self, root: int) -> None:
+        index, low, on_stack, hidden = self.index, self.low, self.on_stack, self.hidden
+        self.visit(root)
+        # Explicit stack of (state, position of the next successor), so long
+        # chains of hidden actions don't exhaust the Python stack
+        work = [(root, 0)]
+        while work:
+            state, pos = work[-1]
+            successors = hidden[state]
+            if pos < len(successors):
+                work[-1] = (state, pos + 1)
+                next_state = successors[pos]
+                if index[next_state] == -1:
+                    self.visit(next_state)
+                    work.append((next_state, 0))
+                elif on_stack[next_state]:
+                    low[state] = min(low[state], index[next_state])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[state])
+            if low[state] == index[state]:
+                self.close_component(state)
+
+    def close_component(self, state: int) -> None:
+        component = []
+        while True:
+            member = self.stack.pop()
+            self.on_stack[member] = False
+            component.append(member)
+            if member == state:
+                break
+        closure = 0
+        for member in component:
+            closure |= 1 << member
+        # The closures of the members themselves are still empty
+        for member in component:
+            for next_state in self.hidden[member]:
+                closure |= self.closures[next_state]
+        for member in component:
+            self.closures[member] = closure
@@ -1,2 +1,2 @@
-HASH_SIZE = 1 << 384
-PRIME = 23
+HASH_SIZE = 1 << 64
+PRIME = 0x100000001B3
@@ -1,6 +1,6 @@
 from enum import Enum
 
-from ltypes import HASH_SIZE
+from symbols.symbols import stable_hash, symbol
 
 
 class ActionType(Enum):
@@ -18,6 +18,14 @@ class LAction:
         self.participant = participant
         self.payload = payload
         self.action_type = action_type
+        self.participant_id = symbol(participant)
+        self.participant_bit = 1 << self.participant_id
+        # Actions are equal iff their symbols are, so the ids are packed into
+        # a single integer to compare them
+        self.key = (
+            (symbol(payload) << 33) | (self.participant_id << 1) | action_type.value
+        )
+        self.hash_code = stable_hash(str(self))
 
     def get_participant(self) -> str:
         return self.participant
@@ -25,10 +33,15 @@ class LAction:
     def __eq__(self, o: object) -> bool:
         if not isinstance(o, LAction):
             return False
-        return self.__hash__() == o.__hash__()
+        return self.key == o.key
 
     def __hash__(self) -> int:
-        return str(self).__hash__() % HASH_SIZE
+        return self.hash_code
+
+    def __reduce__(self):
+        # Symbol ids are local to a process, so they are interned again when
+        # an action is unpickled
+        return LAction, (self.participant, self.action_type, self.payload)
 
     def __str__(self) -> str:
         return f"{self.participant}{self.action_type}{self.payload}"
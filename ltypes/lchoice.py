@@ -1,17 +1,155 @@
-from typing import Set, List, Tuple, Dict, Any
+from typing import Set, List, Tuple, Dict, Any, Iterable, TextIO
 
 import ltypes
 
 import numpy as np
 
+from counters.counters import (
+    COUNTS,
+    HASH,
+    MERGED_SETS,
+    NEXT_STATES,
+    RENAMED_NODES,
+)
 from errors.errors import InconsistentChoice, InvalidChoice, NotTraceEquivalent
 from ltypes.laction import LAction
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from ltypes.lrec_var import LRecVar
+from ltypes.lrecursion import LRecursion
 from ltypes.ltype import LType
+from symbols.symbols import (
+    EMPTY_ENV,
+    bind_once,
+    memoise_args,
+    memoise_binders,
+    memoise_empty_env,
+    share_copies,
+    symbol,
+    union_free_binders,
+    union_free_tvars,
+)
+
+
+def same_ltypes(ltypes1: List[LType], ltypes2: List[LType]) -> bool:
+    return all(ltype1 is ltype2 for ltype1, ltype2 in zip(ltypes1, ltypes2))
+
+
+def union_first_participants(types: Iterable[LType], tvars: int) -> int:
+    participants = 0
+    for t in types:
+        participants |= t.first_participants(tvars)
+    return participants
+
+
+def branch_key(ltype: LType):
+    # The branches of a choice are hashed where they are, without unfolding
+    # their variables, so every node is hashed once. The hash of an LIDChoice
+    # doesn't depend on its decision roles, but they decide which of its
+    # branches are checked against each other
+    if isinstance(ltype, LIDChoice):
+        return ltype.closed_hash(()), ltype.role, tuple(ltype.decision_roles)
+    return ltype.closed_hash(())
+
+
+def structurally_equal(ltype1: LType, ltype2: LType) -> bool:
+    """Whether both types are built in the same way from the same actions,
+    roles and type variables. It confirms that branches with the same hash
+    are equal, as different types can collide. Subterms shared by both types
+    are compared once"""
+    seen = set()
+    stack = [(ltype1, ltype2)]
+    while stack:
+        t1, t2 = stack.pop()
+        if t1 is t2 or (id(t1), id(t2)) in seen:
+            continue
+        seen.add((id(t1), id(t2)))
+        if type(t1) is not type(t2):
+            return False
+        if isinstance(t1, LMessagePass):
+            if t1.action != t2.action:
+                return False
+            stack.append((t1.cont, t2.cont))
+        elif isinstance(t1, LRecursion):
+            if t1.tvar != t2.tvar:
+                return False
+            stack.append((t1.ltype, t2.ltype))
+        elif isinstance(t1, LRecVar):
+            if t1.tvar != t2.tvar:
+                return False
+        elif isinstance(t1, LUnmergedChoice):
+            if len(t1.choices) != len(t2.choices):
+                return False
+            stack.extend(zip(t1.choices, t2.choices))
+        elif isinstance(t1, (LIDChoice, LChoice)):
+            if len(t1.branches) != len(t2.branches):
+                return False
+            if isinstance(t1, LIDChoice) and (
+                t1.role != t2.role or t1.decision_roles != t2.decision_roles
+            ):
+                return False
+            stack.extend(zip(t1.branches, t2.branches))
+        elif not isinstance(t1, LEnd):
+            return False
+    return True
+
+
+def is_duplicate(branch: LType, key, branches: Dict[Any, List[LType]]) -> bool:
+    """Whether the branch is equal to one of the branches already found with
+    the same key, adding it to them otherwise"""
+    same_key = branches.setdefault(key, [])
+    if any(structurally_equal(branch, other) for other in same_key):
+        return True
+    same_key.append(branch)
+    return False
+
+
+def unique_branches(branches: List[LType]) -> List[LType]:
+    """Branches without the ones equal to an earlier branch. Equal branches
+    have the same next states, and merging these is idempotent"""
+    found: Dict[Any, List[LType]] = {}
+    return [
+        branch
+        for branch in branches
+        if not is_duplicate(branch, branch_key(branch), found)
+    ]
+
+
+def flatten_branches(branches: List[LType], choice_type: type) -> List[LType]:
+    """Replaces the choices of type choice_type among the branches with their
+    own branches"""
+    flat_branches = []
+    for branch in branches:
+        if not isinstance(branch, choice_type):
+            flat_branches.append(branch)
+        elif isinstance(branch, LUnmergedChoice):
+            flat_branches.extend(branch.choices)
+        else:
+            flat_branches.extend(branch.branches)
+    return flat_branches
+
+
+def hash_ltype_list(l):
+    return sum(elem.structure_hash() for elem in l) % ltypes.HASH_SIZE
+
+
+def closed_hash_ltype_list(l, binders):
+    return sum(elem.closed_hash(binders) for elem in l) % ltypes.HASH_SIZE
 
 
-def hash_ltype_list(l, tvars):
-    hashes = tuple(elem.hash(tvars) for elem in l)
-    return sum(hashes) % ltypes.HASH_SIZE
+def render_choice(
+    out: TextIO,
+    indent: str,
+    branches: Iterable[LType],
+    trailing_new_line: bool = True,
+) -> None:
+    new_indent = indent + "\t"
+    out.write(f"{indent}choice {{\n")
+    for i, ltype in enumerate(branches):
+        if i > 0:
+            out.write(f"\n{indent}}} or {{\n")
+        ltype.render(out, new_indent)
+    out.write(f"\n{indent}}}\n" if trailing_new_line else f"\n{indent}}}")
 
 
 def merge_next_states(
@@ -36,13 +174,15 @@ def merge_next_states(
 
 
 class LIDChoice(LType):
-    def __init__(
-        self, role: str, branches: List[LType], decision_roles: List[Set[str]]
-    ):
+    def __init__(self, role: str, branches: List[LType], decision_roles: List[int]):
+        """decision_roles holds the bitmask of the roles of the first action of
+        each branch (see symbols.role_mask)"""
         assert len(branches) >= 1
         assert len(branches) == len(decision_roles)
         self.role = role
+        self.role_bit = 1 << symbol(role)
         self.branches = branches
+        self.free_tvars = union_free_tvars(branches)
         self.decision_roles = decision_roles
         self.common_branch_indices, self.disjoint_branch_indices, self.in_disjoint_decision_roles = (
             self.split_branches_with_disjoint_first_decisions()
@@ -63,28 +203,63 @@ class LIDChoice(LType):
                 common_states, disjoint_states
             )
 
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        return set(
-            role for ltype in self.branches for role in ltype.first_participants(tvars)
-        )
+    @memoise_empty_env
+    def first_participants(self, tvars: int) -> int:
+        return union_first_participants(self.branches, tvars)
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return set(
             action for ltype in self.branches for action in ltype.first_actions(tvars)
         )
 
+    @bind_once
     def set_rec_ltype(self, tvar: str, ltype: LType) -> None:
         for branch in self.branches:
             branch.set_rec_ltype(tvar, ltype)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return hash_ltype_list(self.branches, tvars)
-
-    def normalise(self) -> LType:
-        self.branches = [branch.normalise() for branch in self.branches]
-        return self
-
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return hash_ltype_list(self.branches)
+
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return union_free_binders(self.branches)
+
+    @memoise_binders
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        return closed_hash_ltype_list(self.branches, binders)
+
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        branches = [branch.normalise(simplify) for branch in self.branches]
+        decision_roles = self.decision_roles
+        if simplify:
+            branches, decision_roles = self.unique_branches(branches)
+            # A single branch isn't checked against anything
+            if len(branches) == 1:
+                return branches[0]
+        if len(branches) == len(self.branches) and same_ltypes(branches, self.branches):
+            return self
+        return LIDChoice(self.role, branches, decision_roles)
+
+    def unique_branches(self, branches: List[LType]) -> Tuple[List[LType], List[int]]:
+        """Removes the branches equal to an earlier one with the same decision
+        roles: the copies are checked against the same branches and their
+        next states are merged into the same sets"""
+        found: Dict[Any, List[LType]] = {}
+        unique = []
+        decision_roles = []
+        for branch, roles in zip(branches, self.decision_roles):
+            if not is_duplicate(branch, (branch_key(branch), roles), found):
+                unique.append(branch)
+                decision_roles.append(roles)
+        return unique, decision_roles
+
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         common_next_states = [
             self.branches[idx].rec_next_states(tvars)
             for idx in self.common_branch_indices
@@ -96,6 +271,7 @@ class LIDChoice(LType):
         return LIDChoice.merge_next_states(common_next_states, disjoint_next_states)
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         common_next_states = [
             self.branches[idx].next_states() for idx in self.common_branch_indices
         ]
@@ -110,9 +286,9 @@ class LIDChoice(LType):
 
     @staticmethod
     def check_consistent_choice(branches: List[LType]):
-        all_empty = len(branches[0].first_actions(set())) == 0
+        all_empty = len(branches[0].first_actions(EMPTY_ENV)) == 0
         for branch in branches:
-            num_actions = len(branch.first_actions(set()))
+            num_actions = len(branch.first_actions(EMPTY_ENV))
             if (all_empty and num_actions > 0) or (not all_empty and num_actions == 0):
                 raise InconsistentChoice(
                     "A role should participate in all branches of a choice or in none"
@@ -126,18 +302,18 @@ class LIDChoice(LType):
         for i in range(len(self.branches)):
             if i not in checked:
                 checked.add(i)
-                decision_role_in_i = self.role in self.decision_roles[i]
+                decision_role_in_i = bool(self.role_bit & self.decision_roles[i])
                 disjoint = False
                 for j in range(i + 1, len(self.branches)):
                     if j not in checked:
-                        if self.decision_roles[i].isdisjoint(self.decision_roles[j]):
+                        if not self.decision_roles[i] & self.decision_roles[j]:
                             checked.add(j)
                             if decision_role_in_i:
                                 disjoint_branches.append(j)
                                 participates_in_disjoint_decisions = True
                             else:
                                 disjoint = True
-                                if self.role in self.decision_roles[j]:
+                                if self.role_bit & self.decision_roles[j]:
                                     common_branches.append(j)
                                     participates_in_disjoint_decisions = True
                                 else:
@@ -168,13 +344,13 @@ class LIDChoice(LType):
     def _check_first_actions_involve_decision_roles(
         states: List[Dict[LAction, Set[LType]]],
         branch_indices: List[int],
-        all_decision_roles: List[Set[str]],
+        all_decision_roles: List[int],
     ):
         for i, state in enumerate(states):
             branch_idx = branch_indices[i]
             decision_roles = all_decision_roles[branch_idx]
             for action in state.keys():
-                if action.get_participant() not in decision_roles:
+                if not action.participant_bit & decision_roles:
                     raise InvalidChoice(
                         "All first actions in a branch should include one of the decision"
                         " roles for that branch"
@@ -193,12 +369,12 @@ class LIDChoice(LType):
         )
 
     def get_disjoint_branch_indices(
-        self, decision_roles: Set[str], branch_indices: List[int]
+        self, decision_roles: int, branch_indices: List[int]
     ):
         disjoint_indices = []
         for branch_idx in branch_indices:
             other_decision_roles = self.decision_roles[branch_idx]
-            if decision_roles.isdisjoint(other_decision_roles):
+            if not decision_roles & other_decision_roles:
                 disjoint_indices.append(branch_idx)
         return disjoint_indices
 
@@ -249,6 +425,7 @@ class LIDChoice(LType):
             for action in branch_state.keys()
         }
 
+        COUNTS[MERGED_SETS] += len(common_actions)
         for action in common_actions:
             new_state = set()
             for state in common_next_states:
@@ -260,25 +437,20 @@ class LIDChoice(LType):
             next_states[action] = new_state
         return next_states
 
-    def to_string(self, indent: str) -> str:
-        new_indent = indent + "\t"
-        ltypes = [ltype.to_string(new_indent) for ltype in self.branches]
-        new_line = "\n"
-        return f"{indent}choice {{\n{f'{new_line}{indent}}} or {{{new_line}'.join(ltypes)}\n{indent}}}\n"
-
-    def has_rec_var(self, tvar: str) -> bool:
-        for ltype in self.branches:
-            if ltype.has_rec_var(tvar):
-                return True
-        return False
-
-    def rename_tvars(self, tvars: Set[str], new_tvar: str, new_ltype: LType):
-        for ltype in self.branches:
-            ltype.rename_tvars(tvars, new_tvar, new_ltype)
-
-    def flatten_recursion(self):
-        for ltype in self.branches:
-            ltype.flatten_recursion()
+    def render(self, out: TextIO, indent: str) -> None:
+        render_choice(out, indent, self.branches)
+
+    @share_copies
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if not self.free_tvars & (tvars | keep):
+            return self
+        COUNTS[RENAMED_NODES] += 1
+        branches = [
+            ltype.rename_tvars(tvars, new_tvar, keep, copies) for ltype in self.branches
+        ]
+        return LIDChoice(self.role, branches, self.decision_roles)
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -286,15 +458,18 @@ class LIDChoice(LType):
     def __eq__(self, other):
         if not isinstance(other, LIDChoice):
             return False
-        return self.hash(set()) == other.hash(set())
+        return self.hash() == other.hash()
 
     def __hash__(self):
-        return self.hash(set())
+        return self.hash()
 
 
 class LUnmergedChoice(LType):
-    def __init__(self, choices: List[LIDChoice]) -> None:
+    def __init__(self, choices: List[LType]) -> None:
+        """The choices are usually LIDChoices, but after simplifying they can be
+        any type: the next states of all of them must have the same actions"""
         self.choices = choices
+        self.free_tvars = union_free_tvars(choices)
 
     @staticmethod
     def aggregate_next_states(
@@ -303,12 +478,14 @@ class LUnmergedChoice(LType):
         new_states = {}
 
         for state in next_states:
+            COUNTS[MERGED_SETS] += len(state)
             for action, next_state in state.items():
                 action_state = new_states.setdefault(action, set())
                 action_state |= next_state
         return new_states
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         # id_choice_next_states = [
         #     id_choice.rec_next_states(tvars) for id_choice in self.choices
         # ]
@@ -318,53 +495,78 @@ class LUnmergedChoice(LType):
         return LUnmergedChoice.aggregate_next_states(next_states)
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         id_choice_next_states = [id_choice.next_states() for id_choice in self.choices]
         return merge_next_states(id_choice_next_states)
 
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        return set(
-            role for ltype in self.choices for role in ltype.first_participants(tvars)
-        )
+    @memoise_empty_env
+    def first_participants(self, tvars: int) -> int:
+        return union_first_participants(self.choices, tvars)
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return set(
             action for ltype in self.choices for action in ltype.first_actions(tvars)
         )
 
+    @bind_once
     def set_rec_ltype(self, tvar: str, ltype: LType) -> None:
         for choice in self.choices:
             choice.set_rec_ltype(tvar, ltype)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return hash_ltype_list(self.choices, tvars)
-
-    def to_string(self, indent: str) -> str:
-        new_indent = indent + "\t"
-        ltypes = [
-            ltype.to_string(new_indent)
-            for id_choice in self.choices
-            for ltype in id_choice.branches
-        ]
-        new_line = "\n"
-        return f"{indent}choice {{\n{f'{new_line}{indent}}} or {{{new_line}'.join(ltypes)}\n{indent}}}\n"
-
-    def normalise(self) -> LType:
-        self.choices = [id_choice.normalise() for id_choice in self.choices]
-        return self
-
-    def has_rec_var(self, tvar: str) -> bool:
-        for id_choice in self.choices:
-            if id_choice.has_rec_var(tvar):
-                return True
-        return False
-
-    def rename_tvars(self, tvars: Set[str], new_tvar: str, new_ltype: LType):
-        for ltype in self.choices:
-            ltype.rename_tvars(tvars, new_tvar, new_ltype)
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return hash_ltype_list(self.choices)
+
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return union_free_binders(self.choices)
+
+    @memoise_binders
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        return closed_hash_ltype_list(self.choices, binders)
+
+    def render(self, out: TextIO, indent: str) -> None:
+        render_choice(
+            out,
+            indent,
+            (
+                ltype
+                for choice in self.choices
+                for ltype in (
+                    choice.branches if isinstance(choice, LIDChoice) else [choice]
+                )
+            ),
+        )
 
-    def flatten_recursion(self):
-        for ltype in self.choices:
-            ltype.flatten_recursion()
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        choices = [id_choice.normalise(simplify) for id_choice in self.choices]
+        if simplify:
+            # Merging the next states is associative, so the choices of nested
+            # unmerged choices can be merged with the others directly
+            choices = unique_branches(flatten_branches(choices, LUnmergedChoice))
+            if len(choices) == 1:
+                return choices[0]
+        if len(choices) == len(self.choices) and same_ltypes(choices, self.choices):
+            return self
+        return LUnmergedChoice(choices)
+
+    @share_copies
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if not self.free_tvars & (tvars | keep):
+            return self
+        COUNTS[RENAMED_NODES] += 1
+        return LUnmergedChoice(
+            [
+                ltype.rename_tvars(tvars, new_tvar, keep, copies)
+                for ltype in self.choices
+            ]
+        )
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -372,21 +574,24 @@ class LUnmergedChoice(LType):
     def __eq__(self, other):
         if not isinstance(other, LUnmergedChoice):
             return False
-        return self.hash(set()) == other.hash(set())
+        return self.hash() == other.hash()
 
     def __hash__(self):
-        return self.hash(set())
+        return self.hash()
 
 
 class LChoice(LType):
     def __init__(self, branches: List[LType]) -> None:
         self.branches = branches
+        self.free_tvars = union_free_tvars(branches)
 
     def next_states(self) -> Dict[LAction, Set[Any]]:
+        COUNTS[NEXT_STATES] += 1
         next_states = [id_choice.next_states() for id_choice in self.branches]
         return LChoice.aggregate_states(next_states)
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[Any]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[Any]]:
+        COUNTS[NEXT_STATES] += 1
         next_states = [branch.rec_next_states(tvars) for branch in self.branches]
         return LChoice.aggregate_states(next_states)
 
@@ -397,46 +602,62 @@ class LChoice(LType):
             action: state for states in all_states for action, state in states.items()
         }
 
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        return set(
-            role for ltype in self.branches for role in ltype.first_participants(tvars)
-        )
+    @memoise_empty_env
+    def first_participants(self, tvars: int) -> int:
+        return union_first_participants(self.branches, tvars)
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return set(
             action for ltype in self.branches for action in ltype.first_actions(tvars)
         )
 
+    @bind_once
     def set_rec_ltype(self, tvar: str, ltype):
         for branch in self.branches:
             branch.set_rec_ltype(tvar, ltype)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return hash_ltype_list(self.branches, tvars)
-
-    def to_string(self, indent: str) -> str:
-        new_indent = indent + "\t"
-        ltypes = [ltype.to_string(new_indent) for ltype in self.branches]
-        new_line = "\n"
-        return f"{indent}choice {{\n{f'{new_line}{indent}}} or {{{new_line}'.join(ltypes)}\n{indent}}}"
-
-    def normalise(self) -> LType:
-        self.branches = [branch.normalise() for branch in self.branches]
-        return self
-
-    def has_rec_var(self, tvar: str) -> bool:
-        for ltype in self.branches:
-            if ltype.has_rec_var(tvar):
-                return True
-        return False
-
-    def rename_tvars(self, tvars: Set[str], new_tvar: str, new_ltype: LType):
-        for ltype in self.branches:
-            ltype.rename_tvars(tvars, new_tvar, new_ltype)
-
-    def flatten_recursion(self):
-        for ltype in self.branches:
-            ltype.flatten_recursion()
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return hash_ltype_list(self.branches)
+
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return union_free_binders(self.branches)
+
+    @memoise_binders
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        return closed_hash_ltype_list(self.branches, binders)
+
+    def render(self, out: TextIO, indent: str) -> None:
+        render_choice(out, indent, self.branches, trailing_new_line=False)
+
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        branches = [branch.normalise(simplify) for branch in self.branches]
+        if simplify:
+            branches = unique_branches(flatten_branches(branches, LChoice))
+            if len(branches) == 1:
+                return branches[0]
+        if len(branches) == len(self.branches) and same_ltypes(branches, self.branches):
+            return self
+        return LChoice(branches)
+
+    @share_copies
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if not self.free_tvars & (tvars | keep):
+            return self
+        COUNTS[RENAMED_NODES] += 1
+        return LChoice(
+            [
+                ltype.rename_tvars(tvars, new_tvar, keep, copies)
+                for ltype in self.branches
+            ]
+        )
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -444,7 +665,7 @@ class LChoice(LType):
     def __eq__(self, other):
         if not isinstance(other, LUnmergedChoice):
             return False
-        return self.hash(set()) == other.hash(set())
+        return self.hash() == other.hash()
 
     def __hash__(self):
-        return self.hash(set())
+        return self.hash()
@@ -1,42 +1,50 @@
-from typing import Set, Dict, Tuple, Any
+from typing import Set, Dict, Tuple, Any, TextIO
 
+from counters.counters import COUNTS, HASH, NEXT_STATES
 from ltypes.laction import LAction
 from ltypes.ltype import LType
+from symbols.symbols import EMPTY_ENV
 
 
 class LEnd(LType):
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        return set()
+    def first_participants(self, tvars: int) -> int:
+        return 0
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return set()
 
     def set_rec_ltype(self, tvar: str, ltype):
         pass
 
-    def hash(self, tvars: Set[str]) -> int:
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return 1
+
+    def free_binders(self) -> Dict[int, Any]:
+        return {}
+
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
         return 1
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return {}
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return {}
 
-    def to_string(self, indent: str) -> str:
-        return f"{indent}end"
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}end")
 
-    def normalise(self) -> LType:
+    def normalise(self, simplify: bool = True) -> LType:
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return False
-
-    def rename_tvars(self, tvars: Set[str], new_tvar: str, ltype: LType):
-        pass
-
-    def flatten_recursion(self):
-        pass
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        return self
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -1,8 +1,17 @@
-from typing import Set, Tuple, Dict
+from typing import Set, Tuple, Dict, Any, TextIO
 
 import ltypes
+from counters.counters import COUNTS, HASH, NEXT_STATES, RENAMED_NODES
 from ltypes.laction import LAction
 from ltypes.ltype import LType
+from symbols.symbols import (
+    EMPTY_ENV,
+    bind_once,
+    memoise_args,
+    memoise_binders,
+    mix,
+    share_copies,
+)
 
 
 class LMessagePass(LType):
@@ -10,42 +19,66 @@ class LMessagePass(LType):
         super().__init__()
         self.action = action
         self.cont = cont
+        self.free_tvars = cont.free_tvars
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return {self.action: {self.cont}}
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return {self.action: {self.cont}}
 
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        return set(self.action.get_participant())
+    def first_participants(self, tvars: int) -> int:
+        return self.action.participant_bit
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return {self.action}
 
+    @bind_once
     def set_rec_ltype(self, tvar: str, ltype):
         self.cont.set_rec_ltype(tvar, ltype)
 
-    def hash(self, tvars: Set[str]) -> int:
-        return (
-            self.action.__hash__() * ltypes.PRIME + self.cont.hash(tvars)
-        ) % ltypes.HASH_SIZE
-
-    def to_string(self, indent: str) -> str:
-        return f"{indent}{self.action};\n{self.cont.to_string(indent)}"
-
-    def normalise(self) -> LType:
-        self.cont: LType = self.cont.normalise()
-        return self
-
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.cont.has_rec_var(tvar)
-
-    def rename_tvars(self, tvars: Set[str], new_tvar, ltype) -> Set[str]:
-        self.cont.rename_tvars(tvars, new_tvar, ltype)
-
-    def flatten_recursion(self):
-        self.cont.flatten_recursion()
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return mix(
+            (self.action.__hash__() * ltypes.PRIME + self.cont.structure_hash())
+            % ltypes.HASH_SIZE
+        )
+
+    def free_binders(self) -> Dict[int, Any]:
+        return self.cont.free_binders()
+
+    @memoise_binders
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        return mix(
+            (self.action.__hash__() * ltypes.PRIME + self.cont.closed_hash(binders))
+            % ltypes.HASH_SIZE
+        )
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}{self.action};\n")
+        self.cont.render(out, indent)
+
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        cont = self.cont.normalise(simplify)
+        if cont is self.cont:
+            return self
+        return LMessagePass(self.action, cont)
+
+    @share_copies
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if not self.free_tvars & (tvars | keep):
+            return self
+        COUNTS[RENAMED_NODES] += 1
+        return LMessagePass(
+            self.action, self.cont.rename_tvars(tvars, new_tvar, keep, copies)
+        )
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -56,4 +89,4 @@ class LMessagePass(LType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.hash(set())
+        return self.hash()
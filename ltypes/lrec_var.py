@@ -1,66 +1,99 @@
-from typing import Set, Tuple, Dict, Any
+from typing import Set, Tuple, Dict, Any, TextIO
 
 import ltypes
-from gtypes import HASH_SIZE
+from counters.counters import COUNTS, HASH, NEXT_STATES, RENAMED_NODES
+from ltypes import HASH_SIZE
+from symbols.symbols import (
+    EMPTY_ENV,
+    memoise_args,
+    memoise_empty_env,
+    mix,
+    stable_hash,
+    tvar_mask,
+)
 from ltypes.laction import LAction
 from ltypes.lend import LEnd
 from ltypes.ltype import LType
 
+BOUND_VAR_HASH = stable_hash("continue")
+
 
 class LRecVar(LType):
     def __init__(self, var_name: str) -> None:
         super().__init__()
         self.tvar = var_name
         self.ltype: LType = LEnd()
+        self.tvar_mask = tvar_mask(var_name)
+        self.free_tvars = self.tvar_mask
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
-        if self.tvar in tvars:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
+        if tvars & self.tvar_mask:
             return {}
         else:
-            return self.ltype.rec_next_states(tvars.union({self.tvar}))
+            return self.ltype.rec_next_states(tvars | self.tvar_mask)
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
-        return self.ltype.rec_next_states({self.tvar})
+        COUNTS[NEXT_STATES] += 1
+        return self.ltype.rec_next_states(self.tvar_mask)
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
-        if self.tvar in tvars:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[LAction]:
+        if tvars & self.tvar_mask:
             return set()
-        return self.ltype.first_actions(tvars.union({self.tvar}))
+        return self.ltype.first_actions(tvars | self.tvar_mask)
 
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
-        if self.tvar in tvars:
-            return set()
-        return self.ltype.first_participants(tvars.union({self.tvar}))
+    @memoise_empty_env
+    def first_participants(self, tvars: int) -> int:
+        if tvars & self.tvar_mask:
+            return 0
+        return self.ltype.first_participants(tvars | self.tvar_mask)
 
     def set_rec_ltype(self, tvar: str, ltype: LType):
         if tvar == self.tvar:
             self.ltype = ltype
 
-    def hash(self, tvars: Set[str]) -> int:
-        if self.tvar in tvars:
-            return self.tvar.__hash__() % HASH_SIZE
-        return (
-            self.tvar.__hash__() * ltypes.PRIME
-            + self.ltype.hash(tvars.union({self.tvar}))
-        ) % HASH_SIZE
-
-    def to_string(self, indent: str) -> str:
-        return f"{indent}continue {self.tvar}"
-
-    def normalise(self) -> LType:
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return stable_hash(self.tvar)
+
+    def free_binders(self) -> Dict[int, Any]:
+        return {self.tvar_mask: self.ltype}
+
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        for idx in range(len(binders) - 1, -1, -1):
+            if binders[idx] == self.tvar:
+                return mix(
+                    (BOUND_VAR_HASH * ltypes.PRIME + len(binders) - 1 - idx)
+                    % HASH_SIZE
+                )
+        return stable_hash(self.tvar)
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}continue {self.tvar}")
+
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        # A copy, which is bound to the same binder until the binder of the
+        # normalised type binds it. Its ancestors are then copied once by
+        # normalise as well, and binding it leaves this type untouched
+        var = LRecVar(self.tvar)
+        var.ltype = self.ltype
+        return var
+
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if tvars & self.tvar_mask:
+            COUNTS[RENAMED_NODES] += 1
+            # The new variable is bound by the binder of new_tvar
+            return LRecVar(new_tvar)
+        if keep & self.tvar_mask:
+            COUNTS[RENAMED_NODES] += 1
+            return LRecVar(self.tvar)
         return self
 
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.tvar == tvar
-
-    def rename_tvars(self, tvars: Set[str], new_tvar: str, ltype: LType):
-        if self.tvar in tvars:
-            self.ltype = ltype
-            self.tvar = new_tvar
-
-    def flatten_recursion(self):
-        pass
-
     def __str__(self) -> str:
         return self.to_string("")
 
@@ -70,4 +103,4 @@ class LRecVar(LType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.hash(set())
+        return self.hash()
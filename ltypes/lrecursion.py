@@ -1,9 +1,23 @@
-from typing import Set, Tuple, Dict, Type, cast
+from typing import Any, Set, Tuple, Dict, Type, cast, TextIO
 
 import ltypes
+from counters.counters import COUNTS, HASH, NEXT_STATES, RENAMED_NODES
 from gtypes.gtype import GType
 from ltypes.laction import LAction
 from ltypes.ltype import LType
+from symbols.symbols import (
+    EMPTY_ENV,
+    bind_once,
+    memoise_args,
+    memoise_binders,
+    memoise_empty_env,
+    mix,
+    share_copies,
+    stable_hash,
+    tvar_mask,
+)
+
+REC_HASH = stable_hash("rec")
 
 
 class LRecursion(LType):
@@ -12,53 +26,96 @@ class LRecursion(LType):
         self.tvar = tvar
         self.ltype = ltype
         self.ltype.set_rec_ltype(self.tvar, self)
+        self.tvar_mask = tvar_mask(tvar)
+        self.free_tvars = ltype.free_tvars & ~self.tvar_mask
 
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[LType]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return self.ltype.rec_next_states(tvars)
 
     def next_states(self) -> Dict[LAction, Set[LType]]:
+        COUNTS[NEXT_STATES] += 1
         return self.ltype.next_states()
 
+    @bind_once
     def set_rec_ltype(self, tvar, gtype):
         assert tvar != self.tvar
-        self.ltype.set_rec_ltype(tvar, gtype)
+        if self.free_tvars & tvar_mask(tvar):
+            self.ltype.set_rec_ltype(tvar, gtype)
 
-    def first_participants(self, tvars):
-        return self.ltype.first_actions(tvars)
+    @memoise_empty_env
+    def first_participants(self, tvars: int) -> int:
+        return self.ltype.first_participants(tvars)
 
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    @memoise_empty_env
+    def first_actions(self, tvars: int) -> Set[LAction]:
         return self.ltype.first_actions(tvars)
 
-    def hash(self, tvars):
-        return (
-            self.tvar.__hash__() * ltypes.PRIME + self.ltype.hash(tvars)
-        ) % ltypes.HASH_SIZE
-
-    def to_string(self, indent: str) -> str:
-        next_indent = indent + "\t"
-        return f"{indent}rec {self.tvar} {{\n{self.ltype.to_string(next_indent)}\n{indent}}}"
-
-    def normalise(self) -> LType:
-        if self.ltype.has_rec_var(self.tvar):
-            self.flatten_recursion()
-            self.ltype = self.ltype.normalise()
+    @memoise_args
+    def structure_hash(self) -> int:
+        COUNTS[HASH] += 1
+        return mix(
+            (stable_hash(self.tvar) * ltypes.PRIME + self.ltype.structure_hash())
+            % ltypes.HASH_SIZE
+        )
+
+    @memoise_args
+    def free_binders(self) -> Dict[int, Any]:
+        return {
+            mask: binder
+            for mask, binder in self.ltype.free_binders().items()
+            if mask != self.tvar_mask
+        }
+
+    @memoise_binders
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        COUNTS[HASH] += 1
+        # The name of the variable isn't hashed, only its de Bruijn indices
+        return mix(
+            (REC_HASH * ltypes.PRIME + self.ltype.closed_hash(binders + (self.tvar,)))
+            % ltypes.HASH_SIZE
+        )
+
+    def render(self, out: TextIO, indent: str) -> None:
+        out.write(f"{indent}rec {self.tvar} {{\n")
+        self.ltype.render(out, indent + "\t")
+        out.write(f"\n{indent}}}")
+
+    @memoise_args
+    def normalise(self, simplify: bool = True) -> LType:
+        if not self.ltype.has_rec_var(self.tvar):
+            return self.ltype.normalise(simplify)
+        # Normalising copies the occurrences of the variables (see
+        # LRecVar.normalise), so the new binder binds them without copying the
+        # body again or touching this type
+        return LRecursion(self.tvar, self.flatten_recursion().normalise(simplify))
+
+    @share_copies
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ) -> LType:
+        if not self.free_tvars & (tvars | keep):
             return self
-        return self.ltype.normalise()
-
-    def rename_tvars(self, tvars: Set[str], new_tvar, ltype) -> Set[str]:
-        return self.ltype.rename_tvars(tvars, new_tvar, ltype)
-
-    def flatten_recursion(self):
-        tvars = set()
-        while isinstance(self.ltype, LRecursion):
-            ltype: LRecursion = cast(LRecursion, self.ltype)
-            tvars.add(ltype.tvar)
-            self.ltype = ltype.ltype
-        if len(tvars) > 0:
-            self.ltype.rename_tvars(tvars, self.tvar, self)
-
-    def has_rec_var(self, tvar: str) -> bool:
-        return self.ltype.has_rec_var(tvar)
+        COUNTS[RENAMED_NODES] += 1
+        # The occurrences of the variable bound here are copied in the same
+        # pass, so binding them to the new binder leaves the original type
+        # untouched. They shadow the variables of the same name in tvars
+        ltype = self.ltype.rename_tvars(
+            tvars & ~self.tvar_mask, new_tvar, keep | self.tvar_mask, copies
+        )
+        return LRecursion(self.tvar, ltype)
+
+    def flatten_recursion(self) -> LType:
+        """Returns the body of the recursion where the recursions directly
+        nested in it are collapsed into this one, renaming their variables"""
+        tvars = EMPTY_ENV
+        ltype = self.ltype
+        while isinstance(ltype, LRecursion):
+            tvars |= ltype.tvar_mask
+            ltype = cast(LRecursion, ltype).ltype
+        if tvars == EMPTY_ENV:
+            return ltype
+        return ltype.rename_tvars(tvars, self.tvar)
 
     def __str__(self) -> str:
         return self.to_string("")
@@ -69,4 +126,4 @@ class LRecursion(LType):
         return self.__hash__() == o.__hash__()
 
     def __hash__(self) -> int:
-        return self.ltype.hash(set())
+        return self.ltype.hash()
@@ -1,24 +1,33 @@
 from abc import ABC, abstractmethod
-from typing import Set, Dict, Tuple, Any
+from io import StringIO
+from typing import Set, Dict, Tuple, Any, TextIO
 
+import ltypes
+from counters.counters import COUNTS, HASH
 from ltypes.laction import LAction
+from symbols.symbols import EMPTY_ENV, memoise_args, mix, tvar_mask
 
 
 class LType(ABC):
+    # Bitmask of the type variables which occur free in the type, computed
+    # bottom-up when the type is built
+    free_tvars = EMPTY_ENV
+
     @abstractmethod
     def next_states(self) -> Dict[LAction, Set[Any]]:
         pass
 
     @abstractmethod
-    def rec_next_states(self, tvars: Set[str]) -> Dict[LAction, Set[Any]]:
+    def rec_next_states(self, tvars: int) -> Dict[LAction, Set[Any]]:
         pass
 
     @abstractmethod
-    def first_participants(self, tvars: Set[str]) -> Set[str]:
+    def first_participants(self, tvars: int) -> int:
+        """Bitmask of the roles of the first actions of the type"""
         pass
 
     @abstractmethod
-    def first_actions(self, tvars: Set[str]) -> Set[LAction]:
+    def first_actions(self, tvars: int) -> Set[LAction]:
         pass
 
     @abstractmethod
@@ -26,25 +35,73 @@ class LType(ABC):
         pass
 
     @abstractmethod
-    def hash(self, tvars: Set[str]) -> int:
+    def structure_hash(self) -> int:
+        """Hash of the structure of the type, with its type variables hashed by
+        name. It is computed once for every node, without unfolding any type
+        variable"""
         pass
 
     @abstractmethod
-    def to_string(self, indent: str) -> str:
+    def free_binders(self) -> Dict[int, Any]:
+        """Binder of each free variable of the type, by the mask of the
+        variable. The result is shared, so callers must not mutate it"""
         pass
 
+    @memoise_args
+    def hash(self) -> int:
+        """Hash which identifies the type (a subterm of a type isn't closed, so
+        the meaning of its free variables depends on their binders): the hash
+        of its structure combined with the hashes of the binders of its free
+        variables. Equal types have the same hash"""
+        COUNTS[HASH] += 1
+        binders_hash = 0
+        if self.free_tvars:
+            binders_hash = sum(b.hash() for b in self.free_binders().values())
+        return mix(
+            (self.structure_hash() * ltypes.PRIME + binders_hash) % ltypes.HASH_SIZE
+        )
+
     @abstractmethod
-    def normalise(self):
+    def closed_hash(self, binders: Tuple[str, ...]) -> int:
+        """Hash of the structure of the type, computed bottom-up without
+        unfolding any type variable: the variables bound by binders (the
+        innermost last) or inside the type are hashed by their de Bruijn index,
+        and the free ones by name. Equal types have the same closed hash"""
         pass
 
     @abstractmethod
-    def has_rec_var(self, tvar: str) -> bool:
+    def render(self, out: TextIO, indent: str) -> None:
+        """Writes the textual representation of the type into out in a single
+        pass, without building the strings of the subterms"""
         pass
 
+    def to_string(self, indent: str) -> str:
+        out = StringIO()
+        self.render(out, indent)
+        return out.getvalue()
+
     @abstractmethod
-    def rename_tvars(self, tvars: Set[str], new_tvar, ltype):
+    def normalise(self, simplify: bool = True):
+        """Returns the normalised type. Types are never modified once built, so
+        the subterms which are already normal and closed are shared with the
+        result (the occurrences of type variables are copied, so that the
+        binders of the result bind them).
+        Unless simplify is unset, equal branches of choices are merged, and
+        choices with a single branch or nested in a choice of the same kind
+        are flattened where this doesn't change the next states"""
         pass
 
-    def flatten_recursion(self):
-        """Collapses consecutive recursive variables into a single one"""
+    def has_rec_var(self, tvar: str) -> bool:
+        return (self.free_tvars & tvar_mask(tvar)) != EMPTY_ENV
+
+    @abstractmethod
+    def rename_tvars(
+        self, tvars: int, new_tvar: str, keep: int = EMPTY_ENV, copies=None
+    ):
+        """Returns the type with the free variables in tvars renamed to
+        new_tvar, and the free variables in keep copied under their own name
+        (the ones bound by a recursion being copied, so that its copy can bind
+        them). Subterms without any of them are shared with the original
+        type, which is left unchanged, and the others are copied once. copies
+        holds the copies made so far by the call (see share_copies)"""
         pass
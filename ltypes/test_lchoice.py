@@ -0,0 +1,62 @@
+from counters.counters import HASH, counting
+from ltypes.laction import ActionType, LAction
+from ltypes.lchoice import LChoice, LIDChoice
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from parser import parser as scr_parser
+
+
+def send(payload: str, cont=None) -> LMessagePass:
+    return LMessagePass(LAction("b", ActionType.send, payload), cont or LEnd())
+
+
+def collide(*ltypes) -> None:
+    # Forge a collision by seeding the memoised hashes the branches are
+    # deduplicated on
+    for ltype in ltypes:
+        ltype._closed_hash_memo = {(): 42}
+
+
+def test_equal_branches_are_merged():
+    choice = LChoice([send("m", send("n")), send("m", send("n")), send("o")])
+    assert len(choice.normalise().branches) == 2
+
+
+def test_colliding_branches_are_kept():
+    first, second = send("m"), send("n")
+    collide(first, second)
+    assert first.closed_hash(()) == second.closed_hash(())
+    assert len(LChoice([first, second]).normalise().branches) == 2
+
+
+def test_colliding_id_choice_branches_are_kept():
+    first, second, copy = send("m"), send("n"), send("m")
+    collide(first, second, copy)
+    choice = LIDChoice("a", [first, second, copy], [0, 0, 0])
+    branches = choice.normalise().branches
+    assert len(branches) == 2 and branches[0] is first and branches[1] is second
+
+
+def nested_recursions(depth: int):
+    """Projection of depth nested recursions, where every level can go back to
+    any of the recursions around it"""
+    # Labels and variables can't have digits
+    labels = [f"l{first}{second}" for first in "abcd" for second in "abcdefghij"]
+    labels = labels[:depth]
+    branches = " or ".join(f"{{ a->b:{label}; continue X{label} }}" for label in labels)
+    body = f"choice {branches} or {{ a->b:done; end }}"
+    for label in reversed(labels):
+        body = f"rec X{label} {{ a->b:m; {body} }}"
+    source = f"global protocol Nested(role a, role b) {{ {body} }}"
+    protocol = scr_parser.parse_source(source)["Nested"]
+    return protocol.gtype.project({"a", "b"})["b"]
+
+
+def test_branches_of_nested_recursions_are_hashed_once():
+    # Hashing a branch by unfolding its variables visits every binding of the
+    # recursions around it, which is exponential in their depth
+    depth = 12
+    ltype = nested_recursions(depth)
+    with counting() as counts:
+        ltype.normalise()
+    assert counts[HASH] <= 4 * depth + 4
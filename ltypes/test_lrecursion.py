@@ -0,0 +1,51 @@
+from benchmarks.normalisation import size
+from counters.counters import HASH, RENAMED_NODES, counting
+from parser import parser as scr_parser
+
+# Labels and variables can't have digits
+LABELS = [f"l{first}{second}" for first in "abcd" for second in "abcdefghij"]
+
+
+def nested_recursions(depth: int, directly_nested: bool):
+    """Projection of depth nested levels of recursion, where the innermost
+    level can go back to any of the recursions. If directly_nested is set,
+    every level is a recursion directly nested in another one, which
+    normalise collapses into it"""
+    labels = LABELS[:depth]
+    tvars = ["X", "Y"] if directly_nested else ["X"]
+    branches = " or ".join(
+        f"{{ a->b:{tvar.lower()}{label}; continue {tvar}{label} }}"
+        for label in labels
+        for tvar in tvars
+    )
+    body = f"choice {branches} or {{ a->b:done; end }}"
+    for label in reversed(labels):
+        body = f"a->b:m; {body}"
+        for tvar in reversed(tvars):
+            body = f"rec {tvar}{label} {{ {body} }}"
+    source = f"global protocol Nested(role a, role b) {{ {body} }}"
+    protocol = scr_parser.parse_source(source)["Nested"]
+    return protocol.gtype.project({"a", "b"})["b"]
+
+
+def test_nested_recursions_are_normalised_in_one_pass():
+    depth = 30
+    ltype = nested_recursions(depth, False)
+    with counting() as counts:
+        normalised = ltype.normalise()
+    assert counts[HASH] <= 4 * (size(ltype) + size(normalised))
+    assert counts[RENAMED_NODES] == 0
+    assert str(normalised).count("rec X") == depth
+
+
+def test_collapsing_nested_recursions_renames_each_node_once():
+    # Renaming the variable of a collapsed recursion used to rename the
+    # recursions nested in it twice, which is exponential in their depth
+    depth = 30
+    ltype = nested_recursions(depth, True)
+    with counting() as counts:
+        normalised = ltype.normalise()
+    assert counts[RENAMED_NODES] <= depth * size(ltype)
+    assert counts[HASH] <= 4 * (size(ltype) + size(normalised))
+    assert str(normalised).count("rec X") == depth
+    assert "Y" not in str(normalised)
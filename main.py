@@ -1,55 +1,819 @@
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import StringIO
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from analytics.analytics import TransitionMatrix, statistics
+from analytics.traces import TraceGenerator
+from api.api import check_protocol
 from dfa.dfa import DFA
+from dfa.equivalence import DFATable, distinguishing_trace
+from dfa.symmetry import SymmetricTranslator
+from lts.lts import GlobalLTS
 from parser import parser as scr_parser
+from safety.safety import ASYNCHRONOUS, SYNCHRONOUS, check_protocols_safety
 import argparse
 
+PROJECTION = "projection"
+LTS = "lts"
+
+
+def project_text(
+    protocols,
+    quiet: bool,
+    out: TextIO = None,
+    translator_options: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Prints the projections of the protocols, returning how many of them
+    could not be projected. translator_options are the keyword arguments of
+    the SymmetricTranslator which explores the DFAs"""
+    if out is None:
+        out = sys.stdout
+    failures = 0
+    for proto_name, protocol in protocols.items():
+        role = None
+        try:
+            print(f"PROTOCOL {proto_name}\n", file=out)
+            if not quiet:
+                protocol.gtype.render(out, "")
+                out.write("\n")
+            projections = protocol.gtype.project(set(protocol.roles))
+            if not quiet:
+                print("Preliminary projections", file=out)
+            projections = {
+                role: projections[role].normalise() for role in protocol.roles
+            }
+            if not quiet:
+                for role, ltype in projections.items():
+                    print(f"{role}@{protocol.protocol}:\n", file=out)
+                    ltype.render(out, "")
+                    out.write(" \n\n\n")
+
+            print("Normalised projections", file=out)
+            translator = SymmetricTranslator(**(translator_options or {}))
+            for role, ltype in projections.items():
+                new_ltype = translator.translate(role, ltype)
+                print(f"{role}@{protocol.protocol}:\n", file=out)
+                new_ltype.render(out, "")
+                out.write(" \n\n\n")
+            print("\n\n=============================>\n", file=out)
+        except Exception as e:
+            failures += 1
+            name = "@".join([x for x in [role, proto_name] if x is not None])
+            print("!!!!!!!!!!!!!!!!!!!!!!!!", file=out)
+            print(f"Error: {name}:", e, file=out)
+            print("!!!!!!!!!!!!!!!!!!!!!!!!", file=out)
+            print("\n=============================>\n", file=out)
+    return failures
+
+
+def lts_text(protocols, quiet: bool, out: TextIO = None) -> int:
+    """Prints the projections of the protocols obtained from their global LTS,
+    returning how many of them could not be projected"""
+    if out is None:
+        out = sys.stdout
+    failures = 0
+    for proto_name, protocol in protocols.items():
+        try:
+            print(f"PROTOCOL {proto_name}\n", file=out)
+            if not quiet:
+                protocol.gtype.render(out, "")
+                out.write("\n")
+            tables = GlobalLTS(protocol.gtype).role_dfas(protocol.roles)
+            print("Normalised projections", file=out)
+            for role, table in tables.items():
+                print(f"{role}@{protocol.protocol}:\n", file=out)
+                table.to_ltype().render(out, "")
+                out.write(" \n\n\n")
+            print("\n\n=============================>\n", file=out)
+        except Exception as e:
+            failures += 1
+            print("!!!!!!!!!!!!!!!!!!!!!!!!", file=out)
+            print(f"Error: {proto_name}:", e, file=out)
+            print("!!!!!!!!!!!!!!!!!!!!!!!!", file=out)
+            print("\n=============================>\n", file=out)
+    return failures
+
+
+def lts_json(protocols, quiet: bool):
+    results = []
+    for proto_name, protocol in protocols.items():
+        result = {"protocol": proto_name, "roles": protocol.roles}
+        try:
+            if not quiet:
+                result["global"] = protocol.gtype.to_string("")
+            tables = GlobalLTS(protocol.gtype).role_dfas(protocol.roles)
+            result["projections"] = {
+                role: table.to_ltype().to_string("") for role, table in tables.items()
+            }
+        except Exception as e:
+            result["error"] = error_to_json(e)
+        results.append(result)
+    return results
+
+
+def error_to_json(e: Exception, role=None):
+    return {"role": role, "type": type(e).__name__, "message": str(e)}
+
+
+def project_json(
+    protocols, quiet: bool, translator_options: Optional[Dict[str, Any]] = None
+):
+    results = []
+    for proto_name, protocol in protocols.items():
+        result = {"protocol": proto_name, "roles": protocol.roles}
+        role = None
+        try:
+            if not quiet:
+                result["global"] = protocol.gtype.to_string("")
+            projections = protocol.gtype.project(set(protocol.roles))
+            projections = {
+                role: projections[role].normalise() for role in protocol.roles
+            }
+            if not quiet:
+                result["preliminary"] = {
+                    role: ltype.to_string("") for role, ltype in projections.items()
+                }
+            result["projections"] = {}
+            translator = SymmetricTranslator(**(translator_options or {}))
+            for role, ltype in projections.items():
+                new_ltype = translator.translate(role, ltype)
+                result["projections"][role] = new_ltype.to_string("")
+        except Exception as e:
+            result["error"] = error_to_json(e, role)
+        results.append(result)
+    return results
+
+
+def check_text(protocols, out: TextIO) -> int:
+    """Prints whether each protocol can be projected, returning how many of
+    them can't"""
+    failures = 0
+    for proto_name, protocol in protocols.items():
+        check = check_protocol(protocol)
+        if check.ok:
+            print(f"OK {proto_name}", file=out)
+        else:
+            failures += 1
+            name = "@".join([x for x in [check.role, proto_name] if x is not None])
+            print(f"FAIL {name}: {check.error}", file=out)
+    return failures
+
+
+def check_json(protocols):
+    results = []
+    for proto_name, protocol in protocols.items():
+        check = check_protocol(protocol)
+        result = {"protocol": proto_name, "ok": check.ok}
+        if not check.ok:
+            result["error"] = error_to_json(check.error, check.role)
+        results.append(result)
+    return results
+
+
+def print_safety(protocols, semantics: str, bound: int) -> bool:
+    """Prints whether the projections of each protocol compose into a system
+    which can't get stuck, returning whether all of them do"""
+    all_safe = True
+    results = check_protocols_safety(protocols, semantics, bound)
+    for proto_name, result in results.items():
+        if isinstance(result, Exception):
+            all_safe = False
+            print(f"Error: {proto_name}:", result)
+            continue
+        counts = f"{result.states} states, {result.transitions} transitions"
+        if result.ok:
+            print(f"SAFE {proto_name} ({counts})")
+        else:
+            all_safe = False
+            print(f"UNSAFE {proto_name} ({counts}): {result.error}")
+            print(f"\ttrace: [{', '.join(result.trace)}]")
+            print(f"\t{result.message}")
+    return all_safe
+
+
+def protocols_statistics(protocols, k: int, output_format: str) -> bool:
+    """Prints the trace statistics of the projections of each protocol,
+    returning whether all of them could be projected"""
+    all_projected = True
+    results = []
+    for proto_name, protocol in protocols.items():
+        result = {"protocol": proto_name}
+        try:
+            dfas = normalised_projection_dfas(protocol)
+            result["roles"] = {
+                role: statistics(dfa, k).to_json() for role, dfa in dfas.items()
+            }
+        except Exception as e:
+            all_projected = False
+            result["error"] = error_to_json(e)
+        results.append(result)
+
+    if output_format == "json":
+        json.dump({"protocols": results}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return all_projected
+    for result in results:
+        proto_name = result["protocol"]
+        if "error" in result:
+            print(f"Error: {proto_name}:", result["error"]["message"])
+            continue
+        for role, stats in result["roles"].items():
+            print(
+                f"{role}@{proto_name}: {stats['traces']:.6g} traces of length <= {k}, "
+                f"{stats['states']} states, {stats['transitions']} transitions, "
+                f"branching {stats['mean_branching']:.2f} (max {stats['max_branching']})"
+            )
+            for action, share in stats["dominant_actions"]:
+                print(f"\t{action}: {share * 100:.1f}%")
+    return all_projected
+
+
+def generate_traces(protocols, args) -> bool:
+    """Writes args.traces random traces of the projection of a role onto a
+    protocol (args.role, ROLE@PROTOCOL) to args.output (stdout by default)"""
+    role, _, proto_name = args.role.partition("@")
+    protocol = protocols.get(proto_name)
+    if protocol is None or role not in protocol.roles:
+        print(f"Error: no role {role} in protocol {proto_name}")
+        return False
+    try:
+        dfa = normalised_projection_dfas(protocol)[role]
+        matrix = TransitionMatrix.from_dfa(dfa)
+        weights = None
+        if args.weights is not None:
+            with open(args.weights) as f:
+                action_weights = json.load(f)
+            weights = {
+                action: action_weights[str(action)]
+                for action in matrix.actions
+                if str(action) in action_weights
+            }
+        generator = TraceGenerator(
+            matrix,
+            weights,
+            max_length=args.max_length,
+            min_length=args.min_length,
+            stop_probability=args.stop_probability,
+            seed=args.seed,
+        )
+    except Exception as e:
+        print(f"Error: {proto_name}:", e)
+        return False
+
+    if args.trace_format == "binary":
+        if args.output is None:
+            generator.write_binary(sys.stdout.buffer, args.traces)
+        else:
+            with open(args.output, "wb") as f:
+                generator.write_binary(f, args.traces)
+    elif args.output is None:
+        generator.write_jsonl(sys.stdout, args.traces)
+    else:
+        with open(args.output, "w") as f:
+            generator.write_jsonl(f, args.traces)
+    return True
+
+
+def golden_path(directory: str, proto_name: str) -> str:
+    return os.path.join(directory, f"{proto_name}.json")
+
+
+def normalised_projection_dfas(protocol):
+    projections = protocol.gtype.project(set(protocol.roles))
+    dfas = {}
+    for role in protocol.roles:
+        dfa = DFA(projections[role].normalise())
+        dfa.explore()
+        dfas[role] = dfa
+    return dfas
+
+
+def write_golden(protocols, directory: str) -> bool:
+    os.makedirs(directory, exist_ok=True)
+    all_written = True
+    for proto_name, protocol in protocols.items():
+        try:
+            dfas = normalised_projection_dfas(protocol)
+        except Exception as e:
+            print(f"Error: {proto_name}:", e)
+            all_written = False
+            continue
+        tables = {role: DFATable.from_dfa(dfa).to_json() for role, dfa in dfas.items()}
+        with open(golden_path(directory, proto_name), "w") as f:
+            json.dump(tables, f, indent=2)
+        print(f"Wrote golden projections for {proto_name}")
+    return all_written
+
+
+def compare_golden(protocols, directory: str) -> bool:
+    all_equivalent = True
+    for proto_name, protocol in protocols.items():
+        path = golden_path(directory, proto_name)
+        if not os.path.exists(path):
+            print(f"MISSING {proto_name}: no golden projections in {path}")
+            all_equivalent = False
+            continue
+        with open(path, "r") as f:
+            tables = json.load(f)
+        try:
+            dfas = normalised_projection_dfas(protocol)
+        except Exception as e:
+            print(f"Error: {proto_name}:", e)
+            all_equivalent = False
+            continue
+        for role in protocol.roles:
+            if role not in tables:
+                print(f"MISSING {role}@{proto_name}: no golden projection")
+                all_equivalent = False
+                continue
+            trace = distinguishing_trace(dfas[role], DFATable.from_json(tables[role]))
+            if trace is None:
+                print(f"OK {role}@{proto_name}")
+            else:
+                all_equivalent = False
+                trace_str = ", ".join(str(action) for action in trace)
+                print(f"MISMATCH {role}@{proto_name}: [{trace_str}]")
+    return all_equivalent
+
+
+SCRIBBLE_EXTENSION = ".scr"
+
+
+def is_pattern(path: str) -> bool:
+    return any(c in path for c in "*?[")
+
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """Expands directories (recursively, keeping their Scribble files) and glob
+    patterns into the files to project, without repetitions"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(
+                    os.path.join(root, name)
+                    for name in sorted(names)
+                    if name.endswith(SCRIBBLE_EXTENSION)
+                )
+        elif is_pattern(path):
+            files.extend(
+                name
+                for name in sorted(glob.glob(path, recursive=True))
+                if os.path.isfile(name)
+            )
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def file_size(file_name: str) -> int:
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return 0
+
+
+def project_file(
+    file_name: str,
+    output_format: str,
+    quiet: bool,
+    check: bool = False,
+    engine: str = PROJECTION,
+    translator_options: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, str, int, int]:
+    """Projects the protocols in a file (or only checks whether they can be
+    projected), returning the output together with the number of protocols
+    and of failures. A file which can't be parsed counts as a single failure"""
+    out = StringIO()
+    try:
+        protocols = scr_parser.parse_file(file_name)
+    except Exception as e:
+        if output_format == "json":
+            json.dump({"file": file_name, "error": error_to_json(e)}, out)
+        else:
+            print("Error:", e, file=out)
+        return file_name, out.getvalue(), 0, 1
+
+    if output_format == "json":
+        if check:
+            results = check_json(protocols)
+        elif engine == LTS:
+            results = lts_json(protocols, quiet)
+        else:
+            results = project_json(protocols, quiet, translator_options)
+        json.dump({"file": file_name, "protocols": results}, out)
+        failures = sum(1 for result in results if "error" in result)
+    elif check:
+        failures = check_text(protocols, out)
+    elif engine == LTS:
+        failures = lts_text(protocols, quiet, out)
+    else:
+        failures = project_text(protocols, quiet, out, translator_options)
+    return file_name, out.getvalue(), len(protocols), failures
+
+
+def project_batch(
+    files: List[str],
+    output_format: str,
+    quiet: bool,
+    check: bool,
+    jobs,
+    engine: str = PROJECTION,
+    translator_options: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Projects the files in a pool of processes, printing the output of each
+    file as soon as it is ready. The files are submitted largest first, so a
+    big file doesn't start last and hold up the whole run. Returns whether
+    all the protocols were projected"""
+    files = sorted(files, key=file_size, reverse=True)
+    num_protocols = 0
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                project_file,
+                file_name,
+                output_format,
+                quiet,
+                check,
+                engine,
+                translator_options,
+            )
+            for file_name in files
+        ]
+        for future in as_completed(futures):
+            file_name, output, file_protocols, file_failures = future.result()
+            num_protocols += file_protocols
+            failures += file_failures
+            if output_format == "json":
+                sys.stdout.write(f"{output}\n")
+            elif check:
+                sys.stdout.write(f"==> {file_name} <==\n{output}")
+            else:
+                print(f"==> {file_name} <==\n")
+                sys.stdout.write(output)
+            sys.stdout.flush()
+
+    if output_format == "json":
+        summary = {"files": len(files), "protocols": num_protocols, "failures": failures}
+        json.dump({"summary": summary}, sys.stdout)
+        sys.stdout.write("\n")
+    else:
+        print(f"{len(files)} files, {num_protocols} protocols, {failures} failures")
+    return failures == 0
+
+
+# Options selecting what is done instead of projecting the protocols, and the
+# ones among them with a JSON output
+MODES = ["--traces", "--stats", "--safety", "--check", "--golden", "--write-golden"]
+JSON_MODES = ["--stats", "--check"]
+# Options which only apply to the projection, to --traces and to --safety
+PROJECTION_OPTIONS = [
+    "--quiet",
+    "--engine",
+    "--spill-states",
+    "--checkpoint",
+    "--checkpoint-interval",
+    "--resume",
+]
+TRACE_OPTIONS = [
+    "--role",
+    "--max-length",
+    "--min-length",
+    "--stop-probability",
+    "--weights",
+    "--seed",
+    "--trace-format",
+    "--output",
+]
+
+
+def option_given(parser, args, option: str) -> bool:
+    """Whether the option was given a value other than its default"""
+    dest = option[2:].replace("-", "_")
+    return getattr(args, dest) != parser.get_default(dest)
+
+
+def reject_options(parser, args, options: List[str], usage: str) -> None:
+    """Exits with an error if any of the options is given, as it would be
+    ignored"""
+    for option in options:
+        if option_given(parser, args, option):
+            parser.error(f"{option} can't be used {usage}")
+
 
 def main():
     parser = argparse.ArgumentParser(
         description="Tool to project Scribble protocols with mixed choice"
     )
     parser.add_argument(
-        "file",
+        "files",
         metavar="file",
         type=str,
-        help="path to the file where the scribble protocols are defined",
+        nargs="+",
+        help="path to the file where the scribble protocols are defined. "
+        "Several files, directories (searched for .scr files) or glob patterns "
+        "can be given to project them in a pool of processes",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="output format of the projections",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="only output the normalised projections, skipping the global type "
+        "and the preliminary projections",
+    )
+    # Modes which replace the projection of the protocols. The options of the
+    # other modes (and of the projection) can't be used with them
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--golden",
+        metavar="DIR",
+        help="check that the projections are trace equivalent to the golden "
+        "projections stored in DIR",
+    )
+    modes.add_argument(
+        "--write-golden",
+        metavar="DIR",
+        help="store the projections in DIR as golden projections",
+    )
+    modes.add_argument(
+        "--check",
+        action="store_true",
+        help="only check whether the protocols can be projected, without "
+        "building the projections",
+    )
+    modes.add_argument(
+        "--safety",
+        choices=[SYNCHRONOUS, ASYNCHRONOUS],
+        help="check that the projections compose into a system which can't "
+        "deadlock, under synchronous or bounded asynchronous communication",
+    )
+    parser.add_argument(
+        "--bound",
+        metavar="N",
+        type=int,
+        default=1,
+        help="capacity of the channels in the asynchronous safety check",
+    )
+    modes.add_argument(
+        "--stats",
+        metavar="K",
+        type=int,
+        help="print the number of traces of length at most K of each projection, "
+        "the branching factor of the states of its DFA and its most frequent "
+        "actions",
+    )
+    modes.add_argument(
+        "--traces",
+        metavar="N",
+        type=int,
+        help="generate N random traces of the projection of the role given "
+        "with --role, for load testing",
+    )
+    parser.add_argument(
+        "--role",
+        metavar="ROLE@PROTOCOL",
+        help="projection whose traces are generated with --traces",
+    )
+    parser.add_argument(
+        "--max-length",
+        metavar="N",
+        type=int,
+        default=32,
+        help="maximum length of the generated traces",
+    )
+    parser.add_argument(
+        "--min-length",
+        metavar="N",
+        type=int,
+        default=0,
+        help="length of the generated traces before they can be stopped early "
+        "with --stop-probability",
+    )
+    parser.add_argument(
+        "--stop-probability",
+        metavar="P",
+        type=float,
+        default=0.0,
+        help="probability of ending a generated trace before each action",
+    )
+    parser.add_argument(
+        "--weights",
+        metavar="FILE",
+        help='JSON file mapping actions (e.g. "b!U") to their weights in the '
+        "generated traces (1 by default, 0 to never take the action)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="seed of the generated traces",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=["jsonl", "binary"],
+        default="jsonl",
+        help="format of the generated traces: a JSON list of actions per line, "
+        "or the binary format of analytics/traces.py",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="file where the generated traces are written (stdout by default)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=[PROJECTION, LTS],
+        default=PROJECTION,
+        help="how the projections are built: by projecting the global type "
+        "onto each role and determinising the result, or by building the "
+        "labelled transition system of the global type once and hiding the "
+        "actions of the other roles (which doesn't check that the protocol "
+        "is projectable, see --check)",
+    )
+    parser.add_argument(
+        "--spill-states",
+        metavar="N",
+        type=int,
+        default=None,
+        help="keep the states of the DFAs with more than N states on disk "
+        "while they are explored, for protocols which don't fit in memory",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="DIR",
+        help="checkpoint the exploration of the DFAs to files in DIR, so that "
+        "it can be resumed with --resume if it is interrupted",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        metavar="SECONDS",
+        type=float,
+        default=60.0,
+        help="time between checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the explorations from the checkpoints in the --checkpoint "
+        "directory instead of starting them again",
+    )
+    parser.add_argument(
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=None,
+        help="number of processes used to project several files "
+        "(the number of CPUs by default)",
     )
     args = parser.parse_args()
-    try:
-        protocols = scr_parser.parse_file(args.file)
-        for proto_name, protocol in protocols.items():
-            role = None
-            try:
-                print(f"PROTOCOL {proto_name}\n")
-                print(str(protocol.gtype))
-                projections = protocol.gtype.project(set(protocol.roles))
-                print("Preliminary projections")
-                projections = {
-                    role: ltype.normalise() for role, ltype in projections.items()
-                }
-                # p = {}
-                # for role in protocol.roles:
-                #     p[role] = projections[role].normalise()
-                # projections = p
-                for role, ltype in projections.items():
-                    print(f"{role}@{protocol.protocol}:\n")
-                    print(str(ltype), "\n\n")
+    mode = next(
+        (option for option in MODES if option_given(parser, args, option)), None
+    )
+    if mode is not None:
+        reject_options(parser, args, PROJECTION_OPTIONS, f"with {mode}")
+        if mode not in JSON_MODES:
+            reject_options(parser, args, ["--format"], f"with {mode}")
+    if mode != "--traces":
+        reject_options(parser, args, TRACE_OPTIONS, "without --traces")
+    if mode != "--safety":
+        reject_options(parser, args, ["--bound"], "without --safety")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.traces is not None and args.role is None:
+        parser.error("--traces requires --role")
+    translator_options = {
+        "max_states": args.spill_states,
+        "checkpoint_dir": args.checkpoint,
+        "resume": args.resume,
+        "checkpoint_interval": args.checkpoint_interval,
+    }
+    batch = (
+        len(args.files) > 1
+        or os.path.isdir(args.files[0])
+        or is_pattern(args.files[0])
+    )
+    if batch:
+        if args.golden is not None or args.write_golden is not None:
+            parser.error("golden projections can only be used with a single file")
+        if args.safety is not None:
+            parser.error("the safety check can only be used with a single file")
+        if args.stats is not None:
+            parser.error("the statistics can only be computed for a single file")
+        if args.traces is not None:
+            parser.error("traces can only be generated for a single file")
+        files = expand_inputs(args.files)
+        if not project_batch(
+            files,
+            args.format,
+            args.quiet,
+            args.check,
+            args.jobs,
+            args.engine,
+            translator_options,
+        ):
+            sys.exit(1)
+        return
 
-                print("Normalised projections")
-                for role, ltype in projections.items():
-                    dfa = DFA(ltype)
-                    new_ltype = dfa.translate()
-                    print(f"{role}@{protocol.protocol}:\n")
-                    print(str(new_ltype), "\n\n")
-                print("\n\n=============================>\n")
-            except Exception as e:
-                name = "@".join([x for x in [role, proto_name] if x is not None])
-                print("!!!!!!!!!!!!!!!!!!!!!!!!")
-                print(f"Error: {name}:", e)
-                print("!!!!!!!!!!!!!!!!!!!!!!!!")
-                print("\n=============================>\n")
+    reject_options(parser, args, ["--jobs"], "with a single file")
+    file_name = args.files[0]
+    if args.traces is not None:
+        try:
+            protocols = scr_parser.parse_file(file_name)
+        except Exception as e:
+            print("Error:", e)
+            sys.exit(1)
+        if not generate_traces(protocols, args):
+            sys.exit(1)
+        return
 
+    if args.stats is not None:
+        try:
+            protocols = scr_parser.parse_file(file_name)
+        except Exception as e:
+            print("Error:", e)
+            sys.exit(1)
+        if not protocols_statistics(protocols, args.stats, args.format):
+            sys.exit(1)
+        return
+
+    if args.safety is not None:
+        try:
+            protocols = scr_parser.parse_file(file_name)
+        except Exception as e:
+            print("Error:", e)
+            sys.exit(1)
+        if not print_safety(protocols, args.safety, args.bound):
+            sys.exit(1)
+        return
+
+    if args.check:
+        _, output, num_protocols, failures = project_file(
+            file_name, args.format, args.quiet, check=True
+        )
+        sys.stdout.write(f"{output}\n" if args.format == "json" else output)
+        if args.format == "text":
+            print(f"{num_protocols} protocols, {failures} failures")
+        if failures > 0:
+            sys.exit(1)
+        return
+
+    if args.golden is not None or args.write_golden is not None:
+        try:
+            protocols = scr_parser.parse_file(file_name)
+        except Exception as e:
+            print("Error:", e)
+            sys.exit(1)
+        if args.write_golden is not None and not write_golden(
+            protocols, args.write_golden
+        ):
+            sys.exit(1)
+        if args.golden is not None and not compare_golden(protocols, args.golden):
+            sys.exit(1)
+        return
+
+    if args.format == "json":
+        try:
+            protocols = scr_parser.parse_file(file_name)
+            if args.engine == LTS:
+                output = {"protocols": lts_json(protocols, args.quiet)}
+            else:
+                output = {
+                    "protocols": project_json(protocols, args.quiet, translator_options)
+                }
+            failures = sum(1 for result in output["protocols"] if "error" in result)
+        except Exception as e:
+            output = {"error": error_to_json(e)}
+            failures = 1
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        if failures > 0:
+            sys.exit(1)
+        return
+
+    try:
+        protocols = scr_parser.parse_file(file_name)
+        if args.engine == LTS:
+            failures = lts_text(protocols, args.quiet)
+        else:
+            failures = project_text(
+                protocols, args.quiet, translator_options=translator_options
+            )
     except Exception as e:
         print("Error:", e)
+        failures = 1
+    if failures > 0:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
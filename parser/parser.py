@@ -1,6 +1,10 @@
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
-from lark import Lark, Transformer
+from lark import Lark, Transformer, Tree
+from lark.exceptions import VisitError
+
+from errors.errors import InvalidProtocolCall
 
 from gtypes.gaction import GAction
 from gtypes.gchoice import GChoice
@@ -8,7 +12,9 @@ from gtypes.gend import GEnd
 from gtypes.gmessage_pass import GMessagePass
 from gtypes.grec_var import GRecVar
 from gtypes.grecursion import GRecursion
+from gtypes.gsubprotocol import GSubprotocol
 from gtypes.gtype import GType
+from symbols.symbols import symbol, tvar_mask
 
 
 class Protocol:
@@ -25,48 +31,162 @@ class Protocol:
         return self.__str__()
 
 
-def parse_file(file_name) -> Dict[str, Protocol]:
-    parser = Lark.open("syntax.lark", rel_to=__file__, parser="lalr")
+@lru_cache(maxsize=None)
+def get_parser() -> Lark:
+    # Building the parser from the grammar is expensive, so it is only done
+    # once per process
+    return Lark.open("syntax.lark", rel_to=__file__, parser="lalr")
+
+
+def parse_source(protocols: str) -> Dict[str, Protocol]:
+    tree = get_parser().parse(protocols)
+    return TreeToGType.protocols(tree)
+
 
+def parse_file(file_name) -> Dict[str, Protocol]:
     with open(file_name, "r") as f:
         protocols = f.read()
 
-    tree = parser.parse(protocols)
-    transformer = TreeToGType()
-    return transformer.transform(tree)
+    return parse_source(protocols)
+
+
+# A variant of a sub-protocol instance, and the binders of its free variables
+# (see TreeToGType.instantiate)
+Variant = Tuple[GSubprotocol, Dict[int, object]]
 
 
 class TreeToGType(Transformer):
-    # def start(self, decls):
-    #     return {dec}
+    """Builds the global type of a protocol body. Sub-protocol invocations are
+    resolved while the body is transformed, by transforming the body of the
+    invoked protocol with its roles renamed to the arguments of the call"""
+
+    def __init__(
+        self,
+        declarations: Dict[str, Tree],
+        instances: Dict[Tuple[str, Tuple[str, ...]], List[Variant]],
+        renaming: Dict[str, str] = None,
+        calls: Tuple[str, ...] = (),
+        frames: Tuple[object, ...] = (),
+    ) -> None:
+        super().__init__()
+        self.declarations = declarations
+        self.instances = instances
+        self.renaming = {} if renaming is None else renaming
+        # Names of the sub-protocol instances the body is nested in. The type
+        # variables of an instance are prefixed by its name, so they don't
+        # clash with the ones of the instances around it
+        self.calls = calls
+        self.tvar_prefix = f"{calls[-1]}." if len(calls) > 1 else ""
+        # Mask of the variable bound by each instance the body is nested in ->
+        # token of the build of that instance, which is its binder once built
+        self.binders: Dict[int, object] = {
+            tvar_mask(call): frame for call, frame in zip(calls, frames)
+        }
+        self.frames = frames
+
+    @staticmethod
+    def protocols(tree: Tree) -> Dict[str, Protocol]:
+        declarations = {str(decl.children[0]): decl for decl in tree.children}
+        # The roles are interned before the payloads and type variables met
+        # while transforming, so the bitmasks of role sets stay small
+        for decl in declarations.values():
+            for role in decl.children[1].children:
+                symbol(str(role))
+        instances = {}
+        protocols = {}
+        for name, decl in declarations.items():
+            roles = [str(role) for role in decl.children[1].children]
+            transformer = TreeToGType(declarations, instances)
+            protocols[name] = Protocol(name, roles, transformer.instantiate(name, roles))
+        return protocols
+
+    def instantiate(self, name: str, roles: List[str]) -> GType:
+        if name not in self.declarations:
+            raise InvalidProtocolCall(f"Protocol {name} is not declared")
+        _, role_decl, body = self.declarations[name].children
+        params = [str(role) for role in role_decl.children]
+        if len(params) != len(roles) or len(set(roles)) != len(roles):
+            raise InvalidProtocolCall(
+                f"Protocol {name} expects {len(params)} distinct roles, "
+                f"but it was called with ({', '.join(roles)})"
+            )
+
+        instance_name = GSubprotocol.instance_name(name, roles)
+        if instance_name in self.calls:
+            return GRecVar(instance_name)
+        if not self.calls:
+            # The protocol itself isn't shared with its instances, as its type
+            # variables aren't prefixed
+            return self.build_instance(name, roles, params, body)
+        # An instance only depends on the instances it is nested in through
+        # its free variables, the (mutually) recursive calls to them, so it is
+        # shared by every call where these are bound by the same binders. Its
+        # variables are then bound once, by the binders it was built in, and
+        # never rebound while other protocols use it. Otherwise the instance
+        # is built again, and kept as another variant for the same call
+        variants = self.instances.setdefault((name, tuple(roles)), [])
+        for instance, binders in variants:
+            if all(self.binders.get(mask) is frame for mask, frame in binders.items()):
+                return instance
+        instance = self.build_instance(name, roles, params, body)
+        binders = {
+            mask: frame
+            for mask, frame in self.binders.items()
+            if instance.free_tvars & mask
+        }
+        variants.append((instance, binders))
+        return instance
+
+    def build_instance(
+        self, name: str, roles: List[str], params: List[str], body: Tree
+    ) -> GSubprotocol:
+        transformer = TreeToGType(
+            self.declarations,
+            self.instances,
+            dict(zip(params, roles)),
+            self.calls + (GSubprotocol.instance_name(name, roles),),
+            self.frames + (object(),),
+        )
+        try:
+            gtype = transformer.transform(body)
+        except VisitError as e:
+            # Report the error in the body rather than lark's wrapper
+            raise e.orig_exc
+        return GSubprotocol(name, roles, gtype)
+
+    def role(self, role: str) -> str:
+        return self.renaming.get(role, role)
+
     def END(self, tok):
         return GEnd()
 
     def tvar(self, tvar):
-        return GRecVar(tvar[0])
+        return GRecVar(self.tvar_prefix + tvar[0])
 
     def recursion(self, values):
         tvar, gtype = values
-        return GRecursion(tvar, gtype)
+        return GRecursion(self.tvar_prefix + tvar, gtype)
 
     def message_transfer(self, values):
         sender, recv, payload, cont = values
-        action = GAction([sender, recv], payload)
+        action = GAction([self.role(sender), self.role(recv)], payload)
         return GMessagePass(action, cont)
 
     def choice(self, values):
         return GChoice(values)
 
-    def decl(self, values):
-        name, roles, gtype = values
-        return Protocol(name, roles, gtype)
-
-    def start(self, declartions):
-        return {decl.protocol: decl for decl in declartions}
+    def subprotocol_call(self, values):
+        name, *roles = values
+        for role in roles:
+            if role not in self.renaming:
+                raise InvalidProtocolCall(
+                    f"Protocol {name} is called with role {role}, which is not "
+                    "a role of the calling protocol"
+                )
+        return self.instantiate(name, [self.role(role) for role in roles])
 
     def interaction(self, values):
         return values[0]
 
     CNAME = str
     WORD = str
-    role_decl = list
@@ -0,0 +1,126 @@
+import pytest
+
+from dfa.equivalence import ltype_distinguishing_trace
+from errors.errors import InvalidProtocolCall
+from gtypes.gchoice import GChoice, GIDChoice
+from gtypes.gmessage_pass import GMessagePass
+from gtypes.grec_var import GRecVar
+from gtypes.grecursion import GRecursion
+from gtypes.gsubprotocol import GSubprotocol
+from parser import parser as scr_parser
+
+P = """
+global protocol P(role a, role b, role c) {
+    choice {
+        a->b:l; do Q(a, b, c);
+    } or {
+        a->c:m; do Q(a, b, c);
+    } or {
+        a->b:n; do Q(b, a, c);
+    }
+}
+"""
+
+Q = """
+global protocol Q(role a, role b, role c) {
+    rec Y {
+        b->c:z;
+        choice {
+            c->a:w; continue Y
+        } or {
+            c->a:v; do Q(a, b, c);
+        } or {
+            c->a:u; do P(a, b, c);
+        }
+    }
+}
+"""
+
+
+def swap_source(depth: int) -> str:
+    # Every protocol calls the next one with both orders of its roles, so the
+    # calls reach every instance through exponentially many paths
+    lines = []
+    for k in range(depth, 0, -1):
+        first = f"do T{k - 1}(a, b);" if k > 1 else "end"
+        second = f"do T{k - 1}(b, a);" if k > 1 else "end"
+        lines += [
+            f"global protocol T{k}(role a, role b) {{",
+            f"    choice {{ a->b:l; {first} }} or {{ a->b:r; {second} }}",
+            "}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def nodes(gtype):
+    seen, stack, found = {id(gtype)}, [gtype], [gtype]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, GMessagePass):
+            children = [node.cont]
+        elif isinstance(node, GRecursion):
+            children = [node.gtype]
+        elif isinstance(node, (GChoice, GIDChoice)):
+            children = node.branches
+        else:
+            children = []
+        for child in children:
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+                found.append(child)
+    return found
+
+
+def instances(gtype):
+    return sum(isinstance(node, GSubprotocol) for node in nodes(gtype))
+
+
+def test_instances_are_shared_by_protocol_and_roles():
+    depth = 40
+    protocol = scr_parser.parse_source(swap_source(depth))[f"T{depth}"]
+    # One instance per protocol and order of the roles
+    assert instances(protocol.gtype) == 2 * (depth - 1) + 1
+    projections = protocol.gtype.project(set(protocol.roles))
+    for ltype in projections.values():
+        ltype.normalise()
+
+
+def test_mutually_recursive_instances_dont_depend_on_the_declaration_order():
+    protocols = scr_parser.parse_source(P + Q)
+    reordered = scr_parser.parse_source(Q + P)
+    for name in ("P", "Q"):
+        projections = protocols[name].gtype.project({"a", "b", "c"})
+        expected = reordered[name].gtype.project({"a", "b", "c"})
+        for role in ("a", "b", "c"):
+            assert (
+                ltype_distinguishing_trace(
+                    projections[role].normalise(), expected[role].normalise()
+                )
+                is None
+            )
+
+
+def test_shared_instances_are_bound_inside_every_protocol():
+    # The instance of P in Q(a, b, c) can't be shared with the one built
+    # while parsing P, as its call to Q(a, b, c) would be rebound to the
+    # top-level Q
+    protocols = scr_parser.parse_source(P + Q)
+    for protocol in protocols.values():
+        reachable = nodes(protocol.gtype)
+        ids = {id(node) for node in reachable}
+        for node in reachable:
+            if isinstance(node, GRecVar):
+                assert id(node.gtype) in ids
+
+
+@pytest.mark.parametrize(
+    "call", ["do R(a, a);", "do R(a, c);", "do R(a);", "do S(a, b);"]
+)
+def test_invalid_calls_are_rejected_when_parsing(call):
+    source = (
+        f"global protocol T(role a, role b) {{ a->b:m; {call} }}\n"
+        "global protocol R(role c, role d) { c->d:n; end }\n"
+    )
+    with pytest.raises(InvalidProtocolCall):
+        scr_parser.parse_source(source)
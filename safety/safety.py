@@ -0,0 +1,363 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, FrozenSet, List, Optional, Set, Tuple, Union
+
+from api.api import ProjectionCache, project_protocol
+from dfa.equivalence import DFATable
+from ltypes.laction import ActionType
+from parser.parser import Protocol
+
+SYNCHRONOUS = "sync"
+ASYNCHRONOUS = "async"
+
+DEADLOCK = "deadlock"
+ORPHAN_MESSAGES = "orphan messages"
+UNSPECIFIED_RECEPTION = "unspecified reception"
+
+# A step of the product: the label shown in traces and the state reached
+Step = Tuple[str, tuple]
+
+
+class LocalAutomaton:
+    """DFA of the projection onto a role, with the transitions of each state
+    split into sends and receives"""
+
+    def __init__(self, role: str, table: DFATable) -> None:
+        self.role = role
+        self.start = table.start
+        # State -> [(partner, payload, next state)]
+        self.sends: Dict[int, List[Tuple[str, str, int]]] = {}
+        # State -> {(partner, payload): next state}
+        self.receives: Dict[int, Dict[Tuple[str, str], int]] = {}
+        # State -> roles the transitions of the state communicate with
+        self.partners: Dict[int, FrozenSet[str]] = {}
+        for state, transitions in table.transitions.items():
+            sends = []
+            receives = {}
+            for action, next_state in transitions.items():
+                if action.action_type == ActionType.send:
+                    sends.append((action.participant, action.payload, next_state))
+                else:
+                    receives[(action.participant, action.payload)] = next_state
+            self.sends[state] = sends
+            self.receives[state] = receives
+            self.partners[state] = frozenset(
+                action.participant for action in transitions
+            )
+
+    def is_final(self, state: int) -> bool:
+        return len(self.partners[state]) == 0
+
+    def describe(self, state: int) -> str:
+        actions = [f"{partner}!{payload}" for partner, payload, _ in self.sends[state]]
+        actions.extend(f"{partner}?{payload}" for partner, payload in self.receives[state])
+        return f"{self.role} waiting for [{', '.join(sorted(actions))}]"
+
+
+class SafetyResult:
+    """Outcome of exploring the product of the projections. If a reachable state
+    is unsafe, error is the kind of error found, trace a shortest sequence of
+    steps reaching it and message a description of the state"""
+
+    def __init__(
+        self,
+        states: int,
+        transitions: int,
+        error: Optional[str] = None,
+        trace: Optional[List[str]] = None,
+        message: str = "",
+    ) -> None:
+        self.states = states
+        self.transitions = transitions
+        self.error = error
+        self.trace = [] if trace is None else trace
+        self.message = message
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Product(ABC):
+    """Communicating product of the automata of the roles. Only the operations
+    which depend on the semantics of communication are left to subclasses:
+    the states are tuples whose first element holds the local states"""
+
+    def __init__(self, automata: List[LocalAutomaton]) -> None:
+        self.automata = automata
+        self.roles = [automaton.role for automaton in automata]
+        self.role_idx = {role: idx for idx, role in enumerate(self.roles)}
+        self.all_roles = frozenset(range(len(automata)))
+
+    @abstractmethod
+    def initial(self) -> tuple:
+        pass
+
+    @abstractmethod
+    def steps(self, state: tuple, roles: FrozenSet[int]) -> List[Step]:
+        """Steps enabled in state which only involve the given roles"""
+        pass
+
+    @abstractmethod
+    def stuck_error(self, state: tuple) -> Optional[Tuple[str, str]]:
+        """Kind and description of the error in a state without steps, or None
+        if the protocol ended correctly"""
+        pass
+
+    def stuck_roles(self, state: tuple) -> str:
+        return "; ".join(
+            automaton.describe(local)
+            for automaton, local in zip(self.automata, state[0])
+            if not automaton.is_final(local)
+        )
+
+    def closure(self, state: tuple, seed: int) -> FrozenSet[int]:
+        """Smallest set of roles containing seed which is closed under the
+        partners of the transitions of the current states. The steps of the
+        other roles have disjoint participants, so they commute with the
+        steps in the set and can't enable or disable them"""
+        roles = {seed}
+        stack = [seed]
+        while stack:
+            idx = stack.pop()
+            local = state[0][idx]
+            for partner in self.automata[idx].partners[local]:
+                partner_idx = self.role_idx[partner]
+                if partner_idx not in roles:
+                    roles.add(partner_idx)
+                    stack.append(partner_idx)
+        return frozenset(roles)
+
+    def reduced_steps(self, state: tuple) -> List[Step]:
+        """Stubborn set of the state: the smallest non-empty set of enabled
+        steps among the closures of the roles. Exploring only these steps
+        reaches every state without steps (so every deadlock) reachable in the
+        full product"""
+        best: Optional[List[Step]] = None
+        seen: Set[FrozenSet[int]] = set()
+        for idx, automaton in enumerate(self.automata):
+            if automaton.is_final(state[0][idx]):
+                continue
+            roles = self.closure(state, idx)
+            if roles in seen:
+                continue
+            seen.add(roles)
+            steps = self.steps(state, roles)
+            if steps and (best is None or len(steps) < len(best)):
+                best = steps
+                if len(best) == 1:
+                    break
+        return [] if best is None else best
+
+    def explore(self, reduce: bool = True) -> SafetyResult:
+        """Explores the reachable states in BFS order, stopping at the first
+        unsafe state, so the counterexample is a shortest one"""
+        start = self.initial()
+        parents: Dict[tuple, Optional[Tuple[tuple, str]]] = {start: None}
+        queue: Deque[tuple] = deque([start])
+        num_transitions = 0
+        while queue:
+            state = queue.popleft()
+            if reduce:
+                steps = self.reduced_steps(state)
+            else:
+                steps = self.steps(state, self.all_roles)
+            if not steps:
+                error = self.stuck_error(state)
+                if error is not None:
+                    kind, message = error
+                    trace = Product.rebuild_trace(parents, state)
+                    return SafetyResult(
+                        len(parents), num_transitions, kind, trace, message
+                    )
+                continue
+
+            for label, next_state in steps:
+                num_transitions += 1
+                if next_state not in parents:
+                    parents[next_state] = (state, label)
+                    queue.append(next_state)
+        return SafetyResult(len(parents), num_transitions)
+
+    @staticmethod
+    def rebuild_trace(
+        parents: Dict[tuple, Optional[Tuple[tuple, str]]], state: tuple
+    ) -> List[str]:
+        trace = []
+        while parents[state] is not None:
+            state, label = parents[state]
+            trace.append(label)
+        trace.reverse()
+        return trace
+
+
+class SynchronousProduct(Product):
+    """Product where a message is sent and received in a single step. States
+    are (local states,)"""
+
+    def initial(self) -> tuple:
+        return (tuple(automaton.start for automaton in self.automata),)
+
+    def steps(self, state: tuple, roles: FrozenSet[int]) -> List[Step]:
+        locals_ = state[0]
+        steps = []
+        for idx in sorted(roles):
+            sender = self.automata[idx]
+            for partner, payload, next_local in sender.sends[locals_[idx]]:
+                partner_idx = self.role_idx[partner]
+                if partner_idx not in roles:
+                    continue
+                receiver = self.automata[partner_idx]
+                partner_next = receiver.receives[locals_[partner_idx]].get(
+                    (sender.role, payload)
+                )
+                if partner_next is None:
+                    continue
+                next_locals = list(locals_)
+                next_locals[idx] = next_local
+                next_locals[partner_idx] = partner_next
+                label = f"{sender.role}->{partner}:{payload}"
+                steps.append((label, (tuple(next_locals),)))
+        return steps
+
+    def stuck_error(self, state: tuple) -> Optional[Tuple[str, str]]:
+        locals_ = state[0]
+        if all(a.is_final(local) for a, local in zip(self.automata, locals_)):
+            return None
+        return DEADLOCK, self.stuck_roles(state)
+
+
+class AsynchronousProduct(Product):
+    """Product where every ordered pair of roles communicates through a FIFO
+    channel holding at most bound messages: a send blocks while the channel
+    is full. States are (local states, channel contents), where the contents
+    of the channel from role i to role j are at index i * #roles + j"""
+
+    def __init__(self, automata: List[LocalAutomaton], bound: int) -> None:
+        super().__init__(automata)
+        assert bound >= 1
+        self.bound = bound
+
+    def channel(self, sender: int, receiver: int) -> int:
+        return sender * len(self.automata) + receiver
+
+    def initial(self) -> tuple:
+        locals_ = tuple(automaton.start for automaton in self.automata)
+        return locals_, ((),) * (len(self.automata) ** 2)
+
+    def steps(self, state: tuple, roles: FrozenSet[int]) -> List[Step]:
+        locals_, channels = state
+        steps = []
+        for idx in sorted(roles):
+            automaton = self.automata[idx]
+            local = locals_[idx]
+            for partner, payload, next_local in automaton.sends[local]:
+                channel = self.channel(idx, self.role_idx[partner])
+                if len(channels[channel]) >= self.bound:
+                    continue
+                next_channels = list(channels)
+                next_channels[channel] = channels[channel] + (payload,)
+                label = f"{automaton.role}:{partner}!{payload}"
+                steps.append(
+                    (label, (self.move(locals_, idx, next_local), tuple(next_channels)))
+                )
+            for (partner, payload), next_local in automaton.receives[local].items():
+                channel = self.channel(self.role_idx[partner], idx)
+                if not channels[channel] or channels[channel][0] != payload:
+                    continue
+                next_channels = list(channels)
+                next_channels[channel] = channels[channel][1:]
+                label = f"{automaton.role}:{partner}?{payload}"
+                steps.append(
+                    (label, (self.move(locals_, idx, next_local), tuple(next_channels)))
+                )
+        return steps
+
+    @staticmethod
+    def move(locals_: tuple, idx: int, next_local: int) -> tuple:
+        next_locals = list(locals_)
+        next_locals[idx] = next_local
+        return tuple(next_locals)
+
+    def stuck_error(self, state: tuple) -> Optional[Tuple[str, str]]:
+        locals_, channels = state
+        pending = [
+            f"{self.roles[channel // len(self.roles)]}->"
+            f"{self.roles[channel % len(self.roles)]}: [{', '.join(messages)}]"
+            for channel, messages in enumerate(channels)
+            if messages
+        ]
+        if all(a.is_final(local) for a, local in zip(self.automata, locals_)):
+            if not pending:
+                return None
+            return ORPHAN_MESSAGES, "; ".join(pending)
+
+        for idx, automaton in enumerate(self.automata):
+            receives = automaton.receives[locals_[idx]]
+            for partner in {partner for partner, _ in receives}:
+                messages = channels[self.channel(self.role_idx[partner], idx)]
+                if messages and (partner, messages[0]) not in receives:
+                    return (
+                        UNSPECIFIED_RECEPTION,
+                        f"{automaton.role} can't receive {messages[0]} from {partner}",
+                    )
+        return DEADLOCK, "; ".join([self.stuck_roles(state)] + pending)
+
+
+def local_automata(
+    protocol: Protocol, cache: Optional[ProjectionCache] = None
+) -> List[LocalAutomaton]:
+    """Automata of the projections of the protocol onto its roles. The first
+    projection error found is raised"""
+    result = project_protocol(protocol, determinise=False, cache=cache)
+    if result.error is not None:
+        raise result.error
+    automata = []
+    for role in protocol.roles:
+        projection = result.projections[role]
+        if projection.error is not None:
+            raise projection.error
+        automata.append(LocalAutomaton(role, projection.dfa_table()))
+    return automata
+
+
+def check_safety(
+    protocol: Protocol,
+    semantics: str = SYNCHRONOUS,
+    bound: int = 1,
+    reduce: bool = True,
+    cache: Optional[ProjectionCache] = None,
+) -> SafetyResult:
+    """Checks that the projections of the protocol compose into a system which
+    can't get stuck, under synchronous communication or asynchronous
+    communication through channels holding at most bound messages. Unless
+    reduce is unset, steps of roles which don't interact are not interleaved
+    in every order (partial-order reduction), which preserves every state
+    where the system gets stuck"""
+    automata = local_automata(protocol, cache)
+    if semantics == SYNCHRONOUS:
+        product: Product = SynchronousProduct(automata)
+    elif semantics == ASYNCHRONOUS:
+        product = AsynchronousProduct(automata, bound)
+    else:
+        raise ValueError(f"Unknown semantics {semantics}")
+    return product.explore(reduce)
+
+
+def check_protocols_safety(
+    protocols: Dict[str, Protocol],
+    semantics: str = SYNCHRONOUS,
+    bound: int = 1,
+    reduce: bool = True,
+) -> Dict[str, Union[SafetyResult, Exception]]:
+    """Checks the safety of each protocol (see check_safety), sharing the
+    projections of their common sub-protocols. The protocols which couldn't
+    be projected are mapped to the exception raised"""
+    cache = ProjectionCache()
+    results: Dict[str, Union[SafetyResult, Exception]] = {}
+    for proto_name, protocol in protocols.items():
+        try:
+            results[proto_name] = check_safety(protocol, semantics, bound, reduce, cache)
+        except Exception as e:
+            results[proto_name] = e
+    return results
@@ -0,0 +1,487 @@
+import mmap
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple, Union
+
+from dfa.equivalence import DFATable
+from gtypes.gaction import GAction
+from gtypes.gchoice import GChoice, GIDChoice
+from gtypes.gend import GEnd
+from gtypes.gmessage_pass import GMessagePass
+from gtypes.grec_var import GRecVar
+from gtypes.grecursion import GRecursion
+from gtypes.gsubprotocol import GSubprotocol
+from gtypes.gtype import GType
+from ltypes.laction import ActionType, LAction
+from ltypes.lchoice import LChoice, LIDChoice, LUnmergedChoice
+from ltypes.lend import LEnd
+from ltypes.lmessage_pass import LMessagePass
+from ltypes.lrec_var import LRecVar
+from ltypes.lrecursion import LRecursion
+from ltypes.ltype import LType
+from symbols.symbols import mask_roles, role_mask
+
+# Layout of an image (all integers are little-endian, sections are 4-aligned):
+#   header
+#   string offsets   u32[#strings + 1], into the string data
+#   node offsets     u32[#nodes], into the words
+#   words            u32[#words], the fields of the nodes (see below)
+#   roots            u32[2 * #roots], pairs (name, node)
+#   node kinds       u8[#nodes]
+#   string data      utf-8, padded to a multiple of 4 bytes
+#
+# Names are indices in the string table and children are indices of nodes.
+# Nodes are numbered in pre-order and shared nodes are only stored once, so
+# the binder of a type variable is a back-reference to a node with a smaller
+# index (NO_NODE if the variable is free in the stored type).
+# Fields of each kind of node:
+#   END                             -
+#   G_MESSAGE                       sender, receiver, payload, cont
+#   L_MESSAGE                       participant, action type, payload, cont
+#   G_REC_VAR, L_REC_VAR            tvar, binder
+#   G_RECURSION, L_RECURSION        tvar, body
+#   G_SUBPROTOCOL                   name, normalised, body, #roles, roles...
+#   G_CHOICE, G_ID_CHOICE, L_CHOICE, L_UNMERGED_CHOICE
+#                                   #branches, branches...
+#   L_ID_CHOICE                     role, #branches,
+#                                   (branch, #decision roles, roles...)...
+#   DFA_TABLE                       start, #states, transition offsets
+#                                   u32[#states + 1] relative to the node,
+#                                   (participant, action type, payload,
+#                                   next state)...
+MAGIC = b"MCPB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIII")
+NO_NODE = 0xFFFFFFFF
+
+G_END = 0
+G_MESSAGE = 1
+G_REC_VAR = 2
+G_RECURSION = 3
+G_SUBPROTOCOL = 4
+G_CHOICE = 5
+G_ID_CHOICE = 6
+L_END = 7
+L_MESSAGE = 8
+L_REC_VAR = 9
+L_RECURSION = 10
+L_CHOICE = 11
+L_ID_CHOICE = 12
+L_UNMERGED_CHOICE = 13
+DFA_TABLE = 14
+
+Node = Union[GType, LType, DFATable]
+
+# Images are read through native u32 views of the buffer
+assert sys.byteorder == "little"
+
+
+class ImageWriter:
+    """Writes types and DFA tables into a single image in one pass over each
+    of them. Every node is written once, however many times it is shared,
+    and every name is stored once in the string table"""
+
+    def __init__(self) -> None:
+        self.strings: Dict[str, int] = {}
+        self.kinds = bytearray()
+        self.offsets: List[int] = []
+        self.words: List[int] = []
+        self.roots: List[int] = []
+        # id of the objects already written -> node index. The objects are
+        # kept alive, so their ids can't be reused while writing
+        self.node_ids: Dict[int, int] = {}
+        self.objects: List[Node] = []
+
+    def string(self, name: str) -> int:
+        sid = self.strings.get(name)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings[name] = sid
+        return sid
+
+    def add_root(self, name: str, node: Node) -> int:
+        idx = self.add(node)
+        self.roots.extend((self.string(name), idx))
+        return idx
+
+    def add(self, node: Node) -> int:
+        idx = self.node_ids.get(id(node))
+        if idx is not None:
+            return idx
+        idx = self.reserve(node)
+        # Nodes are numbered when they are first reached, but written when
+        # they are popped, so deep types don't exhaust the Python stack
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            kind, fields = self.encode(node, stack)
+            node_idx = self.node_ids[id(node)]
+            self.kinds[node_idx] = kind
+            self.offsets[node_idx] = len(self.words)
+            self.words.extend(fields)
+        return idx
+
+    def reserve(self, node: Node) -> int:
+        idx = len(self.objects)
+        self.node_ids[id(node)] = idx
+        self.objects.append(node)
+        self.kinds.append(0)
+        self.offsets.append(0)
+        return idx
+
+    def child(self, node: Node, stack: List[Node]) -> int:
+        idx = self.node_ids.get(id(node))
+        if idx is None:
+            idx = self.reserve(node)
+            stack.append(node)
+        return idx
+
+    def binder(self, node: Union[GType, LType]) -> int:
+        return self.node_ids.get(id(node), NO_NODE)
+
+    def children(self, nodes: List[Node], stack: List[Node]) -> List[int]:
+        return [len(nodes)] + [self.child(node, stack) for node in nodes]
+
+    def encode(self, node: Node, stack: List[Node]) -> Tuple[int, List[int]]:
+        if isinstance(node, GEnd):
+            return G_END, []
+        if isinstance(node, GMessagePass):
+            sender, receiver = node.action.participants
+            return G_MESSAGE, [
+                self.string(sender),
+                self.string(receiver),
+                self.string(node.action.payload),
+                self.child(node.cont, stack),
+            ]
+        if isinstance(node, GRecVar):
+            return G_REC_VAR, [self.string(node.tvar), self.binder(node.gtype)]
+        if isinstance(node, GSubprotocol):
+            return G_SUBPROTOCOL, [
+                self.string(node.name),
+                int(node.normalised),
+                self.child(node.gtype, stack),
+                len(node.roles),
+            ] + [self.string(role) for role in node.roles]
+        if isinstance(node, GRecursion):
+            return G_RECURSION, [self.string(node.tvar), self.child(node.gtype, stack)]
+        if isinstance(node, GChoice):
+            return G_CHOICE, self.children(node.branches, stack)
+        if isinstance(node, GIDChoice):
+            return G_ID_CHOICE, self.children(node.branches, stack)
+        if isinstance(node, LEnd):
+            return L_END, []
+        if isinstance(node, LMessagePass):
+            return L_MESSAGE, self.action(node.action) + [self.child(node.cont, stack)]
+        if isinstance(node, LRecVar):
+            return L_REC_VAR, [self.string(node.tvar), self.binder(node.ltype)]
+        if isinstance(node, LRecursion):
+            return L_RECURSION, [self.string(node.tvar), self.child(node.ltype, stack)]
+        if isinstance(node, LChoice):
+            return L_CHOICE, self.children(node.branches, stack)
+        if isinstance(node, LUnmergedChoice):
+            return L_UNMERGED_CHOICE, self.children(node.choices, stack)
+        if isinstance(node, LIDChoice):
+            fields = [self.string(node.role), len(node.branches)]
+            for branch, roles in zip(node.branches, node.decision_roles):
+                role_names = sorted(mask_roles(roles))
+                fields.extend((self.child(branch, stack), len(role_names)))
+                fields.extend(self.string(role) for role in role_names)
+            return L_ID_CHOICE, fields
+        if isinstance(node, DFATable):
+            return DFA_TABLE, self.table(node)
+        raise TypeError(f"Cannot serialise {type(node).__name__}")
+
+    def action(self, action: LAction) -> List[int]:
+        return [
+            self.string(action.participant),
+            action.action_type.value,
+            self.string(action.payload),
+        ]
+
+    def table(self, table: DFATable) -> List[int]:
+        num_states = len(table.transitions)
+        fields = [table.start, num_states]
+        offset = 2 + num_states + 1
+        offsets = []
+        transitions: List[int] = []
+        for state in range(num_states):
+            offsets.append(offset + len(transitions))
+            for action, next_state in table.transitions[state].items():
+                transitions.extend(self.action(action))
+                transitions.append(next_state)
+        offsets.append(offset + len(transitions))
+        return fields + offsets + transitions
+
+    def to_bytes(self) -> bytes:
+        strings = [name.encode() for name in self.strings]
+        string_offsets = [0]
+        for data in strings:
+            string_offsets.append(string_offsets[-1] + len(data))
+        string_data = b"".join(strings)
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            0,
+            len(strings),
+            len(string_data),
+            len(self.offsets),
+            len(self.words),
+            len(self.roots) // 2,
+        )
+        kinds = bytes(self.kinds)
+        return b"".join(
+            [
+                header,
+                _u32s(string_offsets),
+                _u32s(self.offsets),
+                _u32s(self.words),
+                _u32s(self.roots),
+                _pad(kinds),
+                _pad(string_data),
+            ]
+        )
+
+    def write(self, file_name: str) -> None:
+        with open(file_name, "wb") as f:
+            f.write(self.to_bytes())
+
+
+def _u32s(values: List[int]) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 4)
+
+
+def dump(file_name: str, roots: Dict[str, Node]) -> None:
+    """Writes the named types and DFA tables into an image file"""
+    writer = ImageWriter()
+    for name, node in roots.items():
+        writer.add_root(name, node)
+    writer.write(file_name)
+
+
+class MappedDFATable:
+    """DFA table read from an image. The transitions of a state are only
+    decoded when they are accessed"""
+
+    def __init__(self, image: "Image", idx: int) -> None:
+        self.image = image
+        self.base = image.offsets[idx]
+        self.start = image.words[self.base]
+        self.num_states = image.words[self.base + 1]
+
+    def state_transitions(self, state: int) -> Dict[LAction, int]:
+        words = self.image.words
+        begin = words[self.base + 2 + state]
+        end = words[self.base + 2 + state + 1]
+        transitions = {}
+        for pos in range(self.base + begin, self.base + end, 4):
+            action = self.image.action(words[pos], words[pos + 1], words[pos + 2])
+            transitions[action] = words[pos + 3]
+        return transitions
+
+    def to_table(self) -> DFATable:
+        return DFATable(
+            self.start,
+            {state: self.state_transitions(state) for state in range(self.num_states)},
+        )
+
+
+class Image:
+    """Types and DFA tables stored in an image. The image is only read through
+    views of the buffer, so a memory-mapped file is shared between the
+    processes which open it, and the Python objects of a node (and of the
+    nodes it contains) are only built when the node is first loaded"""
+
+    def __init__(self, buffer) -> None:
+        self.buffer = memoryview(buffer)
+        (
+            magic,
+            version,
+            _,
+            num_strings,
+            string_bytes,
+            num_nodes,
+            num_words,
+            num_roots,
+        ) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a projection image, or unsupported version")
+        pos = HEADER.size
+        self.string_offsets, pos = self.u32s(pos, num_strings + 1)
+        self.offsets, pos = self.u32s(pos, num_nodes)
+        self.words, pos = self.u32s(pos, num_words)
+        roots, pos = self.u32s(pos, 2 * num_roots)
+        self.kinds = self.buffer[pos : pos + num_nodes]
+        pos += num_nodes + (-num_nodes % 4)
+        self.string_data = self.buffer[pos : pos + string_bytes]
+        self.strings: Dict[int, str] = {}
+        self.actions: Dict[tuple, LAction] = {}
+        self.nodes: Dict[int, Node] = {}
+        self.roots = {
+            self.string(roots[2 * idx]): roots[2 * idx + 1] for idx in range(num_roots)
+        }
+        self.mapped: Optional[mmap.mmap] = None
+
+    @staticmethod
+    def open(file_name: str) -> "Image":
+        with open(file_name, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        image = Image(mapped)
+        image.mapped = mapped
+        return image
+
+    def close(self) -> None:
+        # The views must be released before the file can be unmapped
+        for view in (
+            self.string_offsets,
+            self.offsets,
+            self.words,
+            self.kinds,
+            self.string_data,
+            self.buffer,
+        ):
+            view.release()
+        if self.mapped is not None:
+            self.mapped.close()
+
+    def __enter__(self) -> "Image":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def u32s(self, pos: int, count: int):
+        end = pos + 4 * count
+        return self.buffer[pos:end].cast("I"), end
+
+    def string(self, sid: int) -> str:
+        name = self.strings.get(sid)
+        if name is None:
+            begin = self.string_offsets[sid]
+            end = self.string_offsets[sid + 1]
+            name = str(self.string_data[begin:end], "utf-8")
+            self.strings[sid] = name
+        return name
+
+    def action(self, participant: int, action_type: int, payload: int) -> LAction:
+        key = (participant, action_type, payload)
+        action = self.actions.get(key)
+        if action is None:
+            action = LAction(
+                self.string(participant), ActionType(action_type), self.string(payload)
+            )
+            self.actions[key] = action
+        return action
+
+    def __getitem__(self, name: str) -> Node:
+        return self.load(self.roots[name])
+
+    def table(self, name: str) -> MappedDFATable:
+        idx = self.roots[name]
+        assert self.kinds[idx] == DFA_TABLE
+        return MappedDFATable(self, idx)
+
+    def load(self, idx: int) -> Node:
+        node = self.nodes.get(idx)
+        if node is not None:
+            return node
+        # Post-order walk of the nodes which haven't been loaded yet, so every
+        # node is built after the nodes it contains. Types are acyclic apart
+        # from the binders of their variables, which aren't followed
+        stack = [(idx, False)]
+        while stack:
+            node_idx, expanded = stack.pop()
+            if node_idx in self.nodes:
+                continue
+            if expanded:
+                self.nodes[node_idx] = self.build(node_idx)
+                continue
+            stack.append((node_idx, True))
+            for child in self.child_indices(node_idx):
+                if child not in self.nodes:
+                    stack.append((child, False))
+        return self.nodes[idx]
+
+    def child_indices(self, idx: int) -> List[int]:
+        kind = self.kinds[idx]
+        words = self.words
+        pos = self.offsets[idx]
+        if kind in (G_MESSAGE, L_MESSAGE):
+            return [words[pos + 3]]
+        if kind in (G_RECURSION, L_RECURSION):
+            return [words[pos + 1]]
+        if kind == G_SUBPROTOCOL:
+            return [words[pos + 2]]
+        if kind in (G_CHOICE, G_ID_CHOICE, L_CHOICE, L_UNMERGED_CHOICE):
+            return list(words[pos + 1 : pos + 1 + words[pos]])
+        if kind == L_ID_CHOICE:
+            children = []
+            pos += 2
+            for _ in range(words[pos - 1]):
+                children.append(words[pos])
+                pos += 2 + words[pos + 1]
+            return children
+        return []
+
+    def build(self, idx: int) -> Node:
+        kind = self.kinds[idx]
+        words = self.words
+        pos = self.offsets[idx]
+        nodes = self.nodes
+        if kind == G_END:
+            return GEnd()
+        if kind == G_MESSAGE:
+            action = GAction(
+                [self.string(words[pos]), self.string(words[pos + 1])],
+                self.string(words[pos + 2]),
+            )
+            return GMessagePass(action, nodes[words[pos + 3]])
+        if kind == G_REC_VAR:
+            # The binder sets the recursion of the variable when it is built
+            return GRecVar(self.string(words[pos]))
+        if kind == G_RECURSION:
+            return GRecursion(self.string(words[pos]), nodes[words[pos + 1]])
+        if kind == G_SUBPROTOCOL:
+            roles = [self.string(sid) for sid in words[pos + 4 : pos + 4 + words[pos + 3]]]
+            subprotocol = GSubprotocol(self.string(words[pos]), roles, nodes[words[pos + 2]])
+            subprotocol.normalised = bool(words[pos + 1])
+            return subprotocol
+        if kind == G_CHOICE:
+            return GChoice([nodes[child] for child in self.child_indices(idx)])
+        if kind == G_ID_CHOICE:
+            return GIDChoice([nodes[child] for child in self.child_indices(idx)])
+        if kind == L_END:
+            return LEnd()
+        if kind == L_MESSAGE:
+            action = self.action(words[pos], words[pos + 1], words[pos + 2])
+            return LMessagePass(action, nodes[words[pos + 3]])
+        if kind == L_REC_VAR:
+            return LRecVar(self.string(words[pos]))
+        if kind == L_RECURSION:
+            return LRecursion(self.string(words[pos]), nodes[words[pos + 1]])
+        if kind == L_CHOICE:
+            return LChoice([nodes[child] for child in self.child_indices(idx)])
+        if kind == L_UNMERGED_CHOICE:
+            return LUnmergedChoice([nodes[child] for child in self.child_indices(idx)])
+        if kind == L_ID_CHOICE:
+            role = self.string(words[pos])
+            branches = []
+            decision_roles = []
+            num_branches = words[pos + 1]
+            pos += 2
+            for _ in range(num_branches):
+                num_roles = words[pos + 1]
+                branches.append(nodes[words[pos]])
+                decision_roles.append(
+                    role_mask(
+                        self.string(sid) for sid in words[pos + 2 : pos + 2 + num_roles]
+                    )
+                )
+                pos += 2 + num_roles
+            return LIDChoice(role, branches, decision_roles)
+        if kind == DFA_TABLE:
+            return MappedDFATable(self, idx).to_table()
+        raise ValueError(f"Unknown node kind {kind}")
@@ -0,0 +1,239 @@
+from functools import wraps
+from hashlib import blake2b
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+# Environments of type variables which have already been unfolded are
+# represented as bitmasks, where every type variable is interned into its own
+# bit. Extending an environment is then a single integer operation instead of
+# allocating a new set.
+EMPTY_ENV = 0
+
+_tvar_masks: Dict[str, int] = {}
+_tvar_masks_lock = Lock()
+
+
+def tvar_mask(tvar: str) -> int:
+    mask = _tvar_masks.get(tvar)
+    if mask is None:
+        with _tvar_masks_lock:
+            mask = _tvar_masks.setdefault(tvar, 1 << len(_tvar_masks))
+    return mask
+
+
+class SymbolTable:
+    """Interns the names of roles, payloads and type variables into small
+    integer ids, so that actions are compared as integers and sets of roles
+    are bitmasks with a bit for each id. Ids are only meaningful within a
+    process: stable hashes are still computed from the names"""
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.lock = Lock()
+
+    def intern(self, name: str) -> int:
+        sid = self.ids.get(name)
+        if sid is None:
+            with self.lock:
+                sid = self.ids.get(name)
+                if sid is None:
+                    sid = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = sid
+        return sid
+
+    def name(self, sid: int) -> str:
+        return self.names[sid]
+
+
+SYMBOLS = SymbolTable()
+
+
+def symbol(name: str) -> int:
+    return SYMBOLS.intern(name)
+
+
+def role_mask(roles: Iterable[str]) -> int:
+    mask = 0
+    for role in roles:
+        mask |= 1 << symbol(role)
+    return mask
+
+
+def mask_roles(mask: int) -> List[str]:
+    """Names of the roles in a bitmask, in the order of their ids"""
+    roles = []
+    while mask:
+        low_bit = mask & -mask
+        roles.append(SYMBOLS.name(low_bit.bit_length() - 1))
+        mask ^= low_bit
+    return roles
+
+
+_MASK_64 = (1 << 64) - 1
+
+_stable_hashes: Dict[str, int] = {}
+
+
+def stable_hash(name: str) -> int:
+    """64-bit hash of a name which, unlike str.__hash__, does not depend on
+    PYTHONHASHSEED, so it is the same across processes and machines"""
+    name_hash = _stable_hashes.get(name)
+    if name_hash is None:
+        digest = blake2b(name.encode(), digest_size=8).digest()
+        name_hash = int.from_bytes(digest, "little")
+        _stable_hashes[name] = name_hash
+    return name_hash
+
+
+def mix(value: int) -> int:
+    """Scrambles the bits of a 64-bit hash (splitmix64 finaliser), so that
+    hashes combined linearly don't collide for permuted subterms"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return value ^ (value >> 31)
+
+
+def union_free_tvars(types) -> int:
+    free_tvars = EMPTY_ENV
+    for t in types:
+        free_tvars |= t.free_tvars
+    return free_tvars
+
+
+def union_free_binders(types) -> Dict[int, object]:
+    binders: Dict[int, object] = {}
+    for t in types:
+        if t.free_tvars:
+            binders.update(t.free_binders())
+    return binders
+
+
+def memoise_empty_env(method):
+    """Caches the result of a method taking a type variable environment when
+    it is called with the empty environment, which is the common case. The
+    cached result is shared, so callers must not mutate it. Threads calling
+    the method at the same time may both compute the result, but they store
+    the same value, so no lock is needed"""
+    attr = f"_{method.__name__}_memo"
+
+    @wraps(method)
+    def wrapper(self, tvars: int):
+        if tvars != EMPTY_ENV:
+            return method(self, tvars)
+        result = self.__dict__.get(attr)
+        if result is None:
+            result = method(self, tvars)
+            setattr(self, attr, result)
+        return result
+
+    return wrapper
+
+
+def bound_indices(free_tvars: int, binders: Tuple[str, ...]) -> Tuple[int, ...]:
+    """De Bruijn index of each free variable of a type which is bound by one of
+    the binders (the innermost last), flattened into a tuple of (mask of the
+    variable, index) pairs"""
+    indices = []
+    idx = len(binders) - 1
+    while free_tvars and idx >= 0:
+        mask = tvar_mask(binders[idx])
+        if free_tvars & mask:
+            indices.append(mask)
+            indices.append(len(binders) - 1 - idx)
+            free_tvars &= ~mask
+        idx -= 1
+    return tuple(indices)
+
+
+def memoise_binders(method):
+    """Caches the result of a method taking the names bound around a type (see
+    LType.closed_hash). It only depends on the indices of the variables which
+    are free in the type, so closed subterms are computed once whatever the
+    binders around them, and the others once per binding of their variables"""
+    attr = f"_{method.__name__}_memo"
+
+    @wraps(method)
+    def wrapper(self, binders: Tuple[str, ...]):
+        memo = self.__dict__.get(attr)
+        if memo is None:
+            memo = {}
+            setattr(self, attr, memo)
+        key = bound_indices(self.free_tvars, binders)
+        result = memo.get(key)
+        if result is None:
+            result = method(self, binders)
+            memo[key] = result
+        return result
+
+    return wrapper
+
+
+def memoise_args(method):
+    """Caches the result of a method for every tuple of arguments it is called
+    with. It is used for the methods of local types which only depend on the
+    type (e.g. normalise), as local types are never modified once built: the
+    subterms shared by several parts of a type (e.g. the projections of a
+    sub-protocol instance) are then only processed once"""
+    attr = f"_{method.__name__}_memo"
+
+    @wraps(method)
+    def wrapper(self, *args):
+        memo = self.__dict__.get(attr)
+        if memo is None:
+            memo = {}
+            setattr(self, attr, memo)
+        result = memo.get(args)
+        if result is None:
+            result = method(self, *args)
+            memo[args] = result
+        return result
+
+    return wrapper
+
+
+def share_copies(method):
+    """Makes a method which copies a type with some of its type variables
+    renamed (rename_tvars) copy every node at most once per call: a subterm
+    reached by several paths is copied once, and the copy is shared in the
+    same way. The copies are only shared within a call, so the variables of
+    every call are still bound to their own binder. A subterm reached under
+    binders of different variables is copied once for each set of them, as
+    the occurrences of their variables are copied too"""
+
+    @wraps(method)
+    def wrapper(
+        self,
+        tvars: int,
+        new_tvar: str,
+        keep: int = EMPTY_ENV,
+        copies: Dict[Tuple[int, int], object] = None,
+    ):
+        if copies is None:
+            copies = {}
+        key = (id(self), keep)
+        copy = copies.get(key)
+        if copy is None:
+            copy = method(self, tvars, new_tvar, keep, copies)
+            copies[key] = copy
+        return copy
+
+    return wrapper
+
+
+def bind_once(method):
+    """Makes a method which binds the occurrences of a type variable to their
+    binder (set_rec_ltype, set_rec_gtype) skip the nodes it has already
+    visited while binding the same variable to the same binder, so that the
+    subterms shared by several paths are only visited once"""
+
+    @wraps(method)
+    def wrapper(self, tvar: str, binder) -> None:
+        bound = self.__dict__.get("_bound")
+        if bound is not None and bound[0] == tvar and bound[1] is binder:
+            return
+        self._bound = (tvar, binder)
+        method(self, tvar, binder)
+
+    return wrapper
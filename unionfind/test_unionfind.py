@@ -0,0 +1,42 @@
+from unionfind.unionfind import DisjointSets, Elem, UnionFind
+
+
+def test_disjoint_sets():
+    sets = DisjointSets()
+    assert sets.union("a", "b")
+    assert sets.union("c", "d")
+    assert not sets.union("b", "a")
+    assert sets.find("a") == sets.find("b")
+    assert sets.find("a") != sets.find("c")
+    assert sets.union("d", "a")
+    assert len({sets.find(key) for key in "abcd"}) == 1
+    assert sets.find("e") == "e"
+
+
+def test_disjoint_sets_compress_paths():
+    sets = DisjointSets()
+    for key in range(4):
+        sets.find(key)
+    # A chain 0 -> 1 -> 2 -> 3, which union by size never builds
+    sets.parents.update({0: 1, 1: 2, 2: 3})
+    assert sets.find(0) == 3
+    assert all(sets.parents[key] == 3 for key in range(4))
+
+
+def test_elem_find_root_compresses_the_whole_path():
+    elems = [Elem(uid, uid) for uid in range(4)]
+    for child, parent in zip(elems, elems[1:]):
+        child.parent = parent
+    root = elems[0].find_root()
+    assert root is elems[3]
+    assert all(elem.parent is root for elem in elems)
+
+
+def test_union_find_groups_branches_by_roles():
+    ufind = UnionFind()
+    ufind.add([0, 1], "b1")
+    ufind.add([2, 3], "b2")
+    ufind.add([1, 2], "b3")
+    ufind.add([4, 5], "b4")
+    subsets = sorted(sorted(subset) for subset in ufind.get_subsets())
+    assert subsets == [["b1", "b2", "b3"], ["b4"]]
@@ -4,11 +4,12 @@ from typing import List, Any, Set, Dict
 class UnionFind:
     def __init__(self):
         self.uid = 0
-        self.elems: Dict[str, Elem] = {}
+        # Symbol id of a role -> set of the branches it takes part in
+        self.elems: Dict[int, Elem] = {}
         self.leaders: Set[int] = set()
         self.all_subsets: Dict[int, Elem] = {}
 
-    def add(self, participants: List[str], branch: Any):
+    def add(self, participants: List[int], branch: Any):
         if participants[0] in self.elems and participants[1] in self.elems:
             root1 = self.elems[participants[0]].find_root()
             root2 = self.elems[participants[1]].find_root()
@@ -59,8 +60,10 @@ class Elem:
 
         # Path compression
         node = self
-        while node.parent != root:
-            node, node.parent = node.parent, root
+        while node.parent is not root:
+            parent = node.parent
+            node.parent = root
+            node = parent
         return root
 
     def union(self, other):
@@ -82,3 +85,44 @@ class Elem:
 
     def get_values(self):
         return self.values
+
+
+class DisjointSets:
+    """Generic union-find over arbitrary hashable keys, with path compression
+    and union by size. Keys are added lazily the first time they are seen.
+    Only the parent and the size of the set of each key are kept, so every
+    operation takes near-constant amortised time"""
+
+    def __init__(self):
+        self.parents: Dict[Any, Any] = {}
+        self.sizes: Dict[Any, int] = {}
+
+    def find(self, key: Any) -> Any:
+        """Returns the key representing the set of the key"""
+        parents = self.parents
+        if key not in parents:
+            parents[key] = key
+            self.sizes[key] = 1
+            return key
+        root = key
+        while parents[root] != root:
+            root = parents[root]
+        # Path compression
+        while key != root:
+            parent = parents[key]
+            parents[key] = root
+            key = parent
+        return root
+
+    def union(self, key1: Any, key2: Any) -> bool:
+        """Merges the sets of both keys, returning False if they were already
+        in the same set"""
+        root1 = self.find(key1)
+        root2 = self.find(key2)
+        if root1 == root2:
+            return False
+        if self.sizes[root1] < self.sizes[root2]:
+            root1, root2 = root2, root1
+        self.parents[root2] = root1
+        self.sizes[root1] += self.sizes.pop(root2)
+        return True